@@ -13,7 +13,7 @@ import requests
 
 from requests_oauthlib import OAuth1
 
-from ..notifications.emails import email_send, email_send_bcc
+from ..notifications.emails import email_queue_bcc, email_send
 from ..users.models import User
 
 logger = logging.getLogger(__name__)
@@ -131,7 +131,10 @@ def announcement_approved_email(request, obj, req):
 
 
 def announcement_posted_email(request, obj, send_all=False):
-    """Send a notification posted email.
+    """Queue a notification posted email.
+
+    The recipients are found with one query, and the email is sent in
+    the background by the send_queued_emails command.
 
     obj: The announcement object
 
@@ -144,30 +147,15 @@ def announcement_posted_email(request, obj, send_all=False):
         else:
             users = User.objects.filter(receive_news_emails=True)
 
-        send_groups = obj.groups.all()
-        emails = []
-        users_send = []
-        for u in users:
-            if len(send_groups) == 0:
-                # no groups, public.
-                em = u.emails[0] if u.emails and len(u.emails) >= 1 else u.tj_email
-                if em:
-                    emails.append(em)
-                users_send.append(u)
-            else:
-                # specific to a group
-                user_groups = u.groups.all()
-                if any(i in send_groups for i in user_groups):
-                    # group intersection exists
-                    em = u.emails[0] if u.emails and len(u.emails) >= 1 else u.tj_email
-                    if em:
-                        emails.append(em)
-                    users_send.append(u)
-
-        logger.debug(users_send)
-        logger.debug(emails)
-
-        if not settings.PRODUCTION and len(emails) > 3:
+        if obj.groups.exists():
+            # specific to a group
+            users = users.filter(groups__in=obj.groups.all()).distinct()
+        # otherwise no groups, public.
+
+        num_users = users.count()
+        logger.debug("Emailing announcement to {} users".format(num_users))
+
+        if not settings.PRODUCTION and num_users > 3:
             raise exceptions.PermissionDenied("You're about to email a lot of people, and you aren't in production!")
             return
 
@@ -178,10 +166,10 @@ def announcement_posted_email(request, obj, send_all=False):
             "info_link": url,
             "base_url": base_url
         }
-        email_send_bcc("announcements/emails/announcement_posted.txt",
-                       "announcements/emails/announcement_posted.html",
-                       data, subject, emails)
-        messages.success(request, "Sent email to {} users".format(len(users_send)))
+        email_queue_bcc("announcements/emails/announcement_posted.txt",
+                        "announcements/emails/announcement_posted.html",
+                        data, subject, users)
+        messages.success(request, "Queued email to {} users".format(num_users))
     else:
         logger.debug("Emailing announcements disabled")
 
@@ -3,18 +3,95 @@
 import logging
 import os
 import re
+import time
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import BoundedSemaphore, Lock
 
 from django.conf import settings
 from django.contrib.auth.hashers import check_password
 
 import pexpect
 
+try:
+    import gssapi
+    from gssapi.raw.ext_cred_store import store_cred_into
+    from gssapi.raw.ext_password import acquire_cred_with_password
+except ImportError:
+    acquire_cred_with_password = None
+
 from ..users.models import User
+from ...db.ldap_db import set_kerberos_cache
 
 logger = logging.getLogger(__name__)
 
 
+# Limits the number of logins a process authenticates with Kerberos at
+# once, so a burst of logins cannot tie up every worker thread
+_login_slots = BoundedSemaphore(settings.KERBEROS_MAX_CONCURRENT_LOGINS)
+
+# Runs the credential requests for each realm in parallel
+_realm_executor = ThreadPoolExecutor(max_workers=2 * settings.KERBEROS_MAX_CONCURRENT_LOGINS)
+
+_stats_lock = Lock()
+_stats = {
+    "logins": 0,
+    "successes": 0,
+    "failures": 0,
+    "timeouts": 0,
+    "rejected": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0
+}
+
+
+def _record_login(outcome, elapsed_ms):
+    with _stats_lock:
+        _stats["logins"] += 1
+        _stats[outcome] += 1
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+
+
+def _release_slot_when_done(futures):
+    """Release a login slot once all of the futures have finished.
+
+    Credential requests cannot be interrupted, so a request to a slow KDC
+    keeps its executor thread after the login times out. Holding the slot
+    until then means at most KERBEROS_MAX_CONCURRENT_LOGINS logins have
+    requests running at once, and new requests never wait in the
+    executor's queue behind abandoned ones.
+
+    """
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def done(future):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            _login_slots.release()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def get_kerberos_stats():
+    """Returns the Kerberos login counters and latencies of this process.
+
+    Returns:
+        A dictionary of the numbers of logins, successes, failures,
+        timeouts and rejected logins (because too many logins were in
+        progress), with the average and maximum latency in ms.
+
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_ms"] = stats["total_ms"] / stats["logins"] if stats["logins"] else 0.0
+    return stats
+
+
 class KerberosAuthenticationBackend(object):
     """Authenticate using Kerberos.
 
@@ -22,76 +99,170 @@ class KerberosAuthenticationBackend(object):
 
     """
     @staticmethod
-    def get_kerberos_ticket(username, password):
-        """Attempts to create a Kerberos ticket for a user.
+    def kinit_timeout_handle(username, realm):
+        """Check if the user exists before we throw an error.
+
+        If the user does not exist in LDAP, only throw a warning.
+
+        """
+        try:
+            User.get_user(username=username)
+        except User.DoesNotExist:
+            logger.warning("kinit timed out for {}@{} (invalid user)".format(username, realm))
+            return
+
+        logger.critical("kinit timed out for {}@{}".format(username, realm))
+
+    @staticmethod
+    def acquire_credentials(username, password, realm):
+        """Get initial Kerberos credentials for a user in-process with GSSAPI.
 
         Args:
             username
                 The username.
             password
                 The password.
+            realm
+                The Kerberos realm to authenticate against.
 
         Returns:
-            Boolean indicating success or failure of ticket creation
+            The credentials, or None if the username and password were not
+            accepted.
 
         """
-        def kinit_timeout_handle(username, realm):
-            """Check if the user exists before we throw an error.
-
-            If the user does not exist in LDAP, only throw a warning.
+        name = gssapi.Name("{}@{}".format(username, realm), gssapi.NameType.kerberos_principal)
+        try:
+            result = acquire_cred_with_password(name, password.encode("utf-8"), usage="initiate",
+                                                mechs=[gssapi.MechType.kerberos])
+        except gssapi.exceptions.GSSError as e:
+            logger.debug("Kerberos failed to authorize {}@{}: {}".format(username, realm, e))
+            return None
+        return result.creds
 
-            """
-            try:
-                User.get_user(username=username)
-            except User.DoesNotExist:
-                logger.warning("kinit timed out for {}@{} (invalid user)".format(username, realm))
-                return
+    @staticmethod
+    def kinit(username, password, realm, cache):
+        """Get initial Kerberos credentials for a user into the current credentials cache with
+        /usr/bin/kinit.
 
-            logger.critical("kinit timed out for {}@{}".format(username, realm))
+        This is used when the GSSAPI password and credential store
+        extensions are not available.
 
-        cache = "/tmp/ion-" + str(uuid.uuid4())
+        Args:
+            cache
+                The name of the credentials cache to store the ticket in.
 
-        logger.debug("Setting KRB5CCNAME to 'FILE:{}'".format(cache))
-        os.environ["KRB5CCNAME"] = "FILE:" + cache
+        Returns:
+            Boolean indicating success or failure of ticket creation
 
+        """
+        env = dict(os.environ, KRB5CCNAME=cache)
         try:
-            realm = settings.CSL_REALM
-            kinit = pexpect.spawnu("/usr/bin/kinit {}@{}".format(username, realm), timeout=settings.KINIT_TIMEOUT)
+            kinit = pexpect.spawnu("/usr/bin/kinit {}@{}".format(username, realm), timeout=settings.KINIT_TIMEOUT, env=env)
             kinit.expect(":")
             kinit.sendline(password)
             kinit.expect(pexpect.EOF)
             kinit.close()
-            exitstatus = kinit.exitstatus
+            return kinit.exitstatus == 0
         except pexpect.TIMEOUT:
-            kinit_timeout_handle(username, realm)
-            exitstatus = 1
-
-        if exitstatus != 0:
-            realm = settings.AD_REALM
-            try:
-                kinit = pexpect.spawnu("/usr/bin/kinit {}@{}".format(username, realm), timeout=settings.KINIT_TIMEOUT)
-                kinit.expect(":", timeout=5)
-                kinit.sendline(password)
-                kinit.expect(pexpect.EOF)
-                kinit.close()
-                exitstatus = kinit.exitstatus
-            except pexpect.TIMEOUT:
-                kinit_timeout_handle(username, realm)
-                exitstatus = 1
-
-        if exitstatus == 0:
-            logger.debug("Kerberos authorized {}@{}".format(username, realm))
-            return True
-        else:
-            logger.debug("Kerberos failed to authorize {}".format(username))
-            if "KRB5CCNAME" in os.environ:
-                del os.environ["KRB5CCNAME"]
+            KerberosAuthenticationBackend.kinit_timeout_handle(username, realm)
             return False
 
+    @staticmethod
+    def get_kerberos_ticket(username, password):
+        """Attempts to create a Kerberos ticket for a user.
+
+        Credentials for the CSL and AD realms are requested at the same
+        time. The CSL credentials are preferred, but if the CSL request
+        fails or does not finish in time, the AD credentials are used if
+        that request succeeded.
+
+        Args:
+            username
+                The username.
+            password
+                The password.
+
+        Returns:
+            The name of the credentials cache the ticket was stored in, or
+            None if no ticket could be created.
+
+        """
+        start = time.time()
+        slot_handed_off = False
+        if not _login_slots.acquire(timeout=settings.KINIT_TIMEOUT):
+            logger.error("Too many Kerberos logins in progress, rejecting {}".format(username))
+            _record_login("rejected", (time.time() - start) * 1000)
+            return None
+
+        try:
+            cache = "FILE:/tmp/ion-" + str(uuid.uuid4())
+            realms = [settings.CSL_REALM, settings.AD_REALM]
+            outcome = "failures"
+
+            if acquire_cred_with_password is not None:
+                attempts = {_realm_executor.submit(KerberosAuthenticationBackend.acquire_credentials,
+                                                   username, password, realm): realm for realm in realms}
+                # The slot is released when the attempts finish, not when
+                # this login gives up on them
+                _release_slot_when_done(list(attempts))
+                slot_handed_off = True
+
+                # realm => credentials (None if they were not accepted)
+                results = {}
+                pending = set(attempts)
+                timed_out = False
+                # Wait for the CSL attempt (which is preferred) unless it
+                # fails, then for the rest, until the timeout
+                while pending and results.get(settings.CSL_REALM) is None:
+                    remaining = max(0, settings.KINIT_TIMEOUT - (time.time() - start))
+                    done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                    if not done:
+                        timed_out = True
+                        break
+                    for attempt in done:
+                        try:
+                            results[attempts[attempt]] = attempt.result()
+                        except Exception as e:
+                            logger.error("Kerberos failed to authorize {}@{}: {}".format(username, attempts[attempt], e))
+                            results[attempts[attempt]] = None
+
+                for attempt in pending:
+                    attempt.cancel()
+                    if timed_out:
+                        KerberosAuthenticationBackend.kinit_timeout_handle(username, attempts[attempt])
+                        outcome = "timeouts"
+
+                realm = next((realm for realm in realms if results.get(realm) is not None), None)
+                creds = results.get(realm)
+                if creds is not None:
+                    store_cred_into({"ccache": cache}, creds, usage="initiate", overwrite=True)
+            else:
+                creds = None
+                for realm in realms:
+                    if KerberosAuthenticationBackend.kinit(username, password, realm, cache):
+                        creds = True
+                        break
+
+            elapsed_ms = (time.time() - start) * 1000
+            if creds is not None:
+                logger.info("Kerberos authorized {}@{} in {:.0f} ms".format(username, realm, elapsed_ms))
+                _record_login("successes", elapsed_ms)
+                return cache
+            else:
+                logger.info("Kerberos failed to authorize {} in {:.0f} ms".format(username, elapsed_ms))
+                _record_login(outcome, elapsed_ms)
+                return None
+        finally:
+            if not slot_handed_off:
+                _login_slots.release()
+
     def authenticate(self, username=None, password=None):
         """Authenticate a username-password pair.
 
-        Creates a new user if one is not already in the database.
+        Creates a new user if one is not already in the database. The
+        Kerberos cache is used for the rest of the request's LDAP queries
+        and is available as the user's ``kerberos_cache`` attribute, so
+        it can be stored in the session.
 
         Args:
             username
@@ -112,12 +283,13 @@ class KerberosAuthenticationBackend(object):
         # remove all non-alphanumerics
         username = re.sub('\W', '', username)
 
-        krb_ticket = self.get_kerberos_ticket(username, password)
+        kerberos_cache = self.get_kerberos_ticket(username, password)
 
-        if not krb_ticket:
+        if not kerberos_cache:
             return None
         else:
             logger.debug("Authentication successful")
+            set_kerberos_cache(kerberos_cache)
             try:
                 user = User.get_user(username=username)
             except User.DoesNotExist:
@@ -126,6 +298,7 @@ class KerberosAuthenticationBackend(object):
                              "in LDAP.".format(username))
 
                 user, status = User.objects.get_or_create(username="INVALID_USER", id=99999)
+            user.kerberos_cache = kerberos_cache
             return user
 
     def get_user(self, user_id):
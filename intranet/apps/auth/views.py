@@ -16,6 +16,7 @@ from django.views.generic.base import View
 from .forms import AuthenticateForm
 from ..dashboard.views import dashboard_view, get_fcps_emerg
 from ..schedule.views import schedule_context
+from ...db.ldap_db import get_connection_pool, release_ldap_connection, set_kerberos_cache
 
 logger = logging.getLogger(__name__)
 auth_logger = logging.getLogger("intranet_auth")
@@ -145,10 +146,11 @@ class LoginView(View):
             logger.warning("No cookie support detected! This could cause problems.")
 
         if form.is_valid():
-            login(request, form.get_user())
+            user = form.get_user()
+            login(request, user)
             # Initial load into session
-            if "KRB5CCNAME" in os.environ:
-                request.session["KRB5CCNAME"] = os.environ["KRB5CCNAME"]
+            if getattr(user, "kerberos_cache", None):
+                request.session["KRB5CCNAME"] = user.kerberos_cache
             logger.info("Login succeeded as {}".format(request.POST.get("username", "unknown")))
             logger.info("request.user: {}".format(request.user))
 
@@ -205,6 +207,10 @@ def do_logout(request):
     try:
         kerberos_cache = request.session["KRB5CCNAME"]
         os.system("/usr/bin/kdestroy -c " + kerberos_cache)
+        # Pooled LDAP connections bound with the destroyed cache can not be reused
+        release_ldap_connection()
+        get_connection_pool().discard(kerberos_cache)
+        set_kerberos_cache(None)
     except KeyError:
         pass
 
@@ -26,9 +26,9 @@ def get_fcps_emerg(request):
         emerg = get_emerg()
     except Exception:
         logger.info("Unable to fetch FCPS emergency info")
-        emerg = {"status": False}
+        emerg = {"status": False, "message": None}
 
-    if emerg["status"] or ("show_emerg" in request.GET):
+    if emerg["status"] or ("show_emerg" in request.GET and emerg["message"]):
         msg = emerg["message"]
         return "{} <span style='display: block;text-align: right'>&mdash; FCPS</span>".format(msg)
 
@@ -1,9 +1,47 @@
 # -*- coding: utf-8 -*-
 
-from django.core.management.base import BaseCommand
+from collections import defaultdict
 
-from intranet.apps.eighth.models import EighthBlock, EighthSignup
-from intranet.apps.users.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from intranet.apps.eighth.models import EighthSignup
+
+# Rejects a signup if the user already has another signup in the same block.
+# The advisory lock serializes the check for each user so that two concurrent
+# transactions cannot both add a signup for the same block.
+SAFEGUARD_SQL = """
+CREATE OR REPLACE FUNCTION eighth_signup_one_per_block() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(NEW.user_id);
+    IF EXISTS (
+        SELECT 1
+        FROM eighth_eighthsignup s
+        JOIN eighth_eighthscheduledactivity sa ON sa.id = s.scheduled_activity_id
+        WHERE s.user_id = NEW.user_id
+          AND s.id <> NEW.id
+          AND sa.block_id = (SELECT block_id FROM eighth_eighthscheduledactivity
+                             WHERE id = NEW.scheduled_activity_id)
+    ) THEN
+        RAISE EXCEPTION 'User % already has a signup in this block', NEW.user_id
+            USING ERRCODE = 'unique_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS eighth_signup_one_per_block ON eighth_eighthsignup;
+CREATE CONSTRAINT TRIGGER eighth_signup_one_per_block
+    AFTER INSERT OR UPDATE OF user_id, scheduled_activity_id ON eighth_eighthsignup
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE PROCEDURE eighth_signup_one_per_block();
+"""
+
+REMOVE_SAFEGUARD_SQL = """
+DROP TRIGGER IF EXISTS eighth_signup_one_per_block ON eighth_eighthsignup;
+DROP FUNCTION IF EXISTS eighth_signup_one_per_block();
+"""
 
 
 class Command(BaseCommand):
@@ -14,26 +52,103 @@ class Command(BaseCommand):
                             action='store_true',
                             dest='fix',
                             default=False,
-                            help='Fix.')
+                            help='Delete the duplicates that can be resolved automatically.')
+
+        parser.add_argument('--install-safeguard',
+                            action='store_true',
+                            dest='install_safeguard',
+                            default=False,
+                            help='Add a database trigger that rejects duplicate signups (PostgreSQL only).')
+
+        parser.add_argument('--remove-safeguard',
+                            action='store_true',
+                            dest='remove_safeguard',
+                            default=False,
+                            help='Remove the database trigger added by --install-safeguard.')
 
     def handle(self, *args, **options):
+        duplicates = (EighthSignup.objects.values_list("user_id", "scheduled_activity__block_id")
+                                          .annotate(count=Count("id"))
+                                          .filter(count__gt=1)
+                                          .order_by("scheduled_activity__block_id", "user_id"))
+
+        pairs = set()
+        for user_id, block_id, count in duplicates.iterator():
+            self.stdout.write("Duplicate: user {} block {} ({} signups)".format(user_id, block_id, count))
+            pairs.add((user_id, block_id))
+
+        self.stdout.write("{} duplicates found.".format(len(pairs)))
+
+        unresolved = len(pairs)
+        if pairs and options["fix"]:
+            unresolved = self.fix(pairs)
+
+        if options["install_safeguard"] or options["remove_safeguard"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("The duplicate signup safeguard requires PostgreSQL.")
+            if options["install_safeguard"] and unresolved:
+                raise CommandError("Resolve the existing duplicates before installing the safeguard.")
+            with transaction.atomic(), connection.cursor() as cursor:
+                if options["remove_safeguard"]:
+                    cursor.execute(REMOVE_SAFEGUARD_SQL)
+                    self.stdout.write("Removed duplicate signup safeguard.")
+                else:
+                    cursor.execute(SAFEGUARD_SQL)
+                    self.stdout.write("Installed duplicate signup safeguard.")
+
+    def fix(self, pairs):
+        """Delete the signups that conflict with a both-blocks signup for the same user.
+
+        If one of the duplicate signups is for a both-blocks activity and
+        the user is also signed up for that activity in the other block,
+        that signup is kept and the rest of the block's signups are deleted.
+        Other duplicates are left to be resolved manually.
+
+        Returns:
+            The number of duplicates that were left unresolved.
+
+        """
+        user_ids = set(user_id for user_id, _ in pairs)
+        block_ids = set(block_id for _, block_id in pairs)
+
+        with transaction.atomic():
+            signups = (EighthSignup.objects.select_for_update()
+                                           .filter(user_id__in=user_ids, scheduled_activity__block_id__in=block_ids)
+                                           .select_related("scheduled_activity__activity", "scheduled_activity__block"))
+
+            groups = defaultdict(list)
+            for signup in signups:
+                key = (signup.user_id, signup.scheduled_activity.block_id)
+                if key in pairs:
+                    groups[key].append(signup)
+
+            # user ID => scheduled activity IDs the user is signed up for
+            signed_up = defaultdict(set)
+            for user_id, sa_id in EighthSignup.objects.filter(user_id__in=user_ids).values_list("user_id", "scheduled_activity_id"):
+                signed_up[user_id].add(sa_id)
+
+            to_delete = []
+            unresolved = 0
+            for (user_id, block_id), group in sorted(groups.items()):
+                keep = None
+                for signup in group:
+                    sibling = signup.scheduled_activity.get_both_blocks_sibling()
+                    if sibling and sibling.id in signed_up[user_id]:
+                        keep = signup
+                        break
+
+                if keep is None:
+                    self.stdout.write("Could not resolve: user {} block {}".format(user_id, block_id))
+                    unresolved += 1
+                    continue
+
+                for signup in group:
+                    if signup is not keep:
+                        self.stdout.write("Deleted {}".format(signup))
+                        to_delete.append(signup.id)
+
+            # Deleting through the queryset still sends post_delete, which keeps signup counts in sync
+            EighthSignup.objects.filter(id__in=to_delete).delete()
 
-        fix = options["fix"]
-
-        for u in User.objects.all():
-            for b in EighthBlock.objects.all():
-                su = EighthSignup.objects.filter(user=u, scheduled_activity__block=b)
-                if su.count() != 0 and su.count() != 1:
-                    print("Duplicate: {} {}".format(u.id, b.id))
-                    print("Scheduled activities:", su)
-                    if fix:
-                        if su[0].scheduled_activity.activity.both_blocks:
-                            sibling = su[0].scheduled_activity.get_both_blocks_sibling()
-                            if EighthSignup.objects.filter(user=u, scheduled_activity=sibling).exists():
-                                print("Deleted su1 {}".format(su[1]))
-                                su[1].delete()
-                        elif su[1].scheduled_activity.activity.both_blocks:
-                            sibling = su[1].scheduled_activity.get_both_blocks_sibling()
-                            if EighthSignup.objects.filter(user=u, scheduled_activity=sibling).exists():
-                                print("Deleted su0 {}".format(su[0]))
-                                su[0].delete()
+        self.stdout.write("{} signups deleted, {} duplicates left unresolved.".format(len(to_delete), unresolved))
+        return unresolved
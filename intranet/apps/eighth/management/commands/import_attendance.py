@@ -1,52 +1,109 @@
 # -*- coding: utf-8 -*-
 
-import csv
+from cacheops import invalidate_model
 
 from django.core.management.base import BaseCommand
 
 from intranet.apps.eighth.models import (EighthActivity, EighthBlock,
-                                         EighthScheduledActivity, EighthSignup)
+                                         EighthScheduledActivity, EighthSignup, invalidate_activity_lists)
 from intranet.apps.users.models import User
+from intranet.utils.csv_import import CSVImporter, RowError
+
+
+class AttendanceImporter(CSVImporter):
+
+    """Marks users absent from the (block ID, user ID) rows of the exported "eighth_absentees" table.
+
+    Users without a signup in the block are signed up for a placeholder
+    administrative activity and marked absent there.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AttendanceImporter, self).__init__(*args, **kwargs)
+        self.other_absence_activity, _ = EighthActivity.objects.get_or_create(name="z-OTHER ABSENCE (transferred from Iodine)",
+                                                                              administrative=True)
+
+    def parse_row(self, row):
+        try:
+            bid, uid = row
+            return int(bid), int(uid)
+        except ValueError:
+            raise RowError("Invalid row {}".format(row))
+
+    def import_chunk(self, rows):
+        block_ids = set(bid for _, (bid, _) in rows)
+        user_ids = set(uid for _, (_, uid) in rows)
+
+        blocks = EighthBlock.objects.nocache().in_bulk(list(block_ids))
+        users = set(User.objects.nocache().filter(id__in=user_ids).values_list("id", flat=True))
+
+        # (user ID, block ID) => signup
+        signups = {}
+        for signup in (EighthSignup.objects.nocache()
+                                           .filter(user_id__in=user_ids, scheduled_activity__block_id__in=block_ids)
+                                           .select_related("scheduled_activity")):
+            signups[(signup.user_id, signup.scheduled_activity.block_id)] = signup
+
+        # block ID => scheduled placeholder activity
+        other_absence = {}
+        for sa in (EighthScheduledActivity.objects.nocache()
+                                                  .filter(activity=self.other_absence_activity, block_id__in=block_ids)):
+            other_absence[sa.block_id] = sa
+
+        absent_signups = set()
+        attendance_taken = set()
+        new_signups = {}
+        for line, (bid, uid) in rows:
+            if uid not in users:
+                self.error(line, "User {} doesn't exist, bid {}".format(uid, bid))
+                continue
+            if bid not in blocks:
+                self.error(line, "Block {} doesn't exist, with user {}".format(bid, uid))
+                continue
+
+            signup = signups.get((uid, bid))
+            if signup is not None:
+                absent_signups.add(signup.id)
+                attendance_taken.add(signup.scheduled_activity_id)
+            elif (uid, bid) not in new_signups:
+                if bid not in other_absence:
+                    other_absence[bid] = EighthScheduledActivity.objects.create(block=blocks[bid],
+                                                                                activity=self.other_absence_activity)
+                new_signups[(uid, bid)] = EighthSignup(user_id=uid,
+                                                       scheduled_activity=other_absence[bid],
+                                                       was_absent=True)
+
+        EighthSignup.objects.filter(id__in=absent_signups).update(was_absent=True)
+        EighthScheduledActivity.objects.filter(id__in=attendance_taken).update(attendance_taken=True)
+        EighthSignup.objects.bulk_create(new_signups.values())
+        # bulk_create skips the signals that keep signup counts up to date
+        EighthScheduledActivity.update_signup_counts(set(s.scheduled_activity_id for s in new_signups.values()))
+
+        self.count("modified", len(absent_signups))
+        self.count("created", len(new_signups))
+
+    def finish(self):
+        invalidate_model(EighthSignup)
+        invalidate_model(EighthScheduledActivity)
+        invalidate_activity_lists()
 
 
 class Command(BaseCommand):
     help = "Transfer attendance data"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--csv',
+                            type=str,
+                            dest='csv_file',
+                            default='eighth_absentees.csv',
+                            help='Exported "eighth_absentees" table in CSV format.')
+
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            dest='chunk_size',
+                            default=1000,
+                            help='Number of rows to import per transaction.')
+
     def handle(self, **options):
-        """Exported "eighth_absentees" table in CSV format."""
-
-        with open('eighth_absentees.csv', 'r') as absopen:
-            absences = csv.reader(absopen)
-            for row in absences:
-                bid, uid = row
-                try:
-                    usr = User.objects.get(id=uid)
-                except User.DoesNotExist:
-                    self.stdout.write("User {} doesn't exist, bid {}".format(usr, bid))
-                else:
-                    try:
-                        blk = EighthBlock.objects.get(id=bid)
-                    except EighthBlock.DoesNotExist:
-                        self.stdout.write("Block {} doesn't exist, with user {}".format(bid, uid))
-                    else:
-                        usr_signup = EighthSignup.objects.filter(user=usr, scheduled_activity__block=blk)
-                        self.stdout.write("{} signup: {}".format(usr, usr_signup))
-                        if usr_signup.count() == 0:
-                            other_abs_act, _ = EighthActivity.objects.get_or_create(name="z-OTHER ABSENCE (transferred from Iodine)",
-                                                                                    administrative=True)
-                            other_abs_sch, _ = EighthScheduledActivity.objects.get_or_create(block=blk,
-                                                                                             activity=other_abs_act)
-                            other_abs_su = EighthSignup.objects.create(user=usr,
-                                                                       scheduled_activity=other_abs_sch,
-                                                                       was_absent=True)
-                            self.stdout.write("{} Signup on {} created: {}".format(usr, bid, other_abs_su))
-                        else:
-                            s = usr_signup[0]
-                            s.was_absent = True
-                            s.save()
-                            sa = s.scheduled_activity
-                            sa.attendance_taken = True
-                            sa.save()
-                            self.stdout.write("{} Signup on {} modified: {}".format(usr, bid, usr_signup[0]))
-
-        self.stdout.write("Done.")
+        AttendanceImporter(stdout=self.stdout, chunk_size=options["chunk_size"]).run(options["csv_file"])
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from intranet.apps.eighth.models import EighthScheduledActivity
+
+
+class Command(BaseCommand):
+    help = "Recalculate the signup count of every scheduled activity from its signups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            dest='chunk_size',
+                            default=1000,
+                            help='Number of scheduled activities to check at a time.')
+
+    def handle(self, *args, **options):
+        ids = list(EighthScheduledActivity.objects.nocache().order_by("id").values_list("id", flat=True))
+
+        changed = 0
+        for i in range(0, len(ids), options["chunk_size"]):
+            with transaction.atomic():
+                changed += EighthScheduledActivity.update_signup_counts(ids[i:i + options["chunk_size"]])
+
+        self.stdout.write("Checked {} scheduled activities, repaired {}.".format(len(ids), changed))
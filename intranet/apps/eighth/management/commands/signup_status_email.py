@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import time
 from datetime import datetime, timedelta
 
 from django.core.management.base import BaseCommand
+from django.db.models import Case, Count, When
 
 from intranet.apps.eighth.models import EighthBlock, EighthSignup
-from intranet.apps.eighth.notifications import signup_status_email
+from intranet.apps.eighth.notifications import build_signup_status_email
+from intranet.apps.notifications.emails import email_send_many
 from intranet.apps.users.models import User
 
 
@@ -43,6 +46,12 @@ class Command(BaseCommand):
                             default=False,
                             help="Send to everyone, even those who have no eighth emails set.")
 
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=100,
+                            help="Number of emails to send at a time.")
+
     def handle(self, *args, **options):
 
         log = not options["silent"]
@@ -76,28 +85,65 @@ class Command(BaseCommand):
         if log:
             self.stdout.write("{}".format(next_blocks))
             self.stdout.write("{}".format(options))
-            self.stdout.write("{}".format(users))
 
-        for user in users:
-            user_signups = EighthSignup.objects.filter(user=user, scheduled_activity__block__in=next_blocks).nocache()
-            if user_signups.count() < next_blocks.count():
+        next_blocks = list(next_blocks)
+        block_ids = [blk.id for blk in next_blocks]
+
+        # Count each user's signups (and cancelled signups) for the
+        # upcoming blocks in one query
+        signup_counts = (EighthSignup.objects.nocache()
+                                     .filter(user__in=users, scheduled_activity__block__in=block_ids)
+                                     .values_list("user")
+                                     .annotate(signups=Count("id"),
+                                               cancelled=Count(Case(When(scheduled_activity__cancelled=True, then=1)))))
+        signup_counts = {uid: (signups, cancelled) for uid, signups, cancelled in signup_counts}
+
+        notify_ids = []
+        for uid in users.values_list("id", flat=True):
+            signups, cancelled = signup_counts.get(uid, (0, 0))
+            if signups < len(next_blocks):
                 """User hasn't signed up for a block."""
                 if log:
-                    self.stdout.write("User {} hasn't signed up for a block".format(user))
-                if not options["pretend"]:
-                    try:
-                        signup_status_email(user, next_blocks)
-                    except Exception as e:
-                        print(e)
-            elif user_signups.filter(scheduled_activity__cancelled=True).count() > 0:
+                    self.stdout.write("User {} hasn't signed up for a block".format(uid))
+                notify_ids.append(uid)
+            elif cancelled > 0:
                 """User is in a cancelled activity."""
                 if log:
-                    self.stdout.write("User {} is in a cancelled activity.".format(user))
-                if not options["pretend"]:
-                    try:
-                        signup_status_email(user, next_blocks)
-                    except Exception as e:
-                        print(e)
+                    self.stdout.write("User {} is in a cancelled activity.".format(uid))
+                notify_ids.append(uid)
+
+        if log:
+            self.stdout.write("{} users to notify".format(len(notify_ids)))
+
+        if options["pretend"] or not notify_ids:
+            if log:
+                self.stdout.write("Done.")
+            return
+
+        signups = {}
+        for signup in (EighthSignup.objects.nocache()
+                                   .filter(user__in=notify_ids, scheduled_activity__block__in=block_ids)
+                                   .select_related("scheduled_activity__activity", "scheduled_activity__block")):
+            signups.setdefault(signup.user_id, {})[signup.scheduled_activity.block_id] = signup
+
+        recipients = User.get_users(ids=notify_ids, fields=["emails", "user_type"])
+
+        def messages():
+            for user in recipients:
+                try:
+                    msg = build_signup_status_email(user, next_blocks, signups.get(user.id, {}))
+                except Exception as e:
+                    self.stdout.write("Unable to build email for {}: {}".format(user, e))
+                    continue
+                if msg is not None:
+                    yield msg
+
+        def progress(sent):
+            if log:
+                self.stdout.write("Sent {}/{} emails".format(sent, len(recipients)))
+
+        start = time.time()
+        sent = email_send_many(messages(), batch_size=options["batch_size"], progress=progress)
 
         if log:
-            self.stdout.write("Done.")
+            self.stdout.write("Done: sent {} emails in {:.1f}s.".format(sent, time.time() - start))
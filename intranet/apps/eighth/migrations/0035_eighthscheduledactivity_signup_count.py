@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_signups(apps, schema_editor):
+    EighthScheduledActivity = apps.get_model("eighth", "EighthScheduledActivity")
+    EighthSignup = apps.get_model("eighth", "EighthSignup")
+
+    counts = (EighthSignup.objects.values_list("scheduled_activity_id")
+                                  .annotate(count=Count("id")))
+    for sched_act_id, count in counts:
+        EighthScheduledActivity.objects.filter(id=sched_act_id).update(signup_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eighth', '0034_eighthscheduledactivity_special'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eighthscheduledactivity',
+            name='signup_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_signups, migrations.RunPython.noop),
+    ]
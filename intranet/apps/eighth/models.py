@@ -2,13 +2,19 @@
 
 import datetime
 import logging
+import time
 from itertools import chain
 
+from cacheops import invalidate_obj
+
 from django.conf import settings
 from django.contrib.auth.models import Group as DjangoGroup
+from django.core.cache import cache
 from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
-from django.db import models
-from django.db.models import Manager, Q
+from django.db import models, transaction
+from django.db.models import Count, F, Manager, Q
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
 from django.utils import formats
 
 from . import exceptions as eighth_exceptions
@@ -289,6 +295,24 @@ class EighthActivity(AbstractBaseEighthModel):
 
         return list(activities)
 
+    def is_available_to_user(self, user):
+        """Return whether the given user is allowed to sign up for this activity if it is
+        restricted.
+
+        This is equivalent to checking membership in
+        :meth:`restricted_activities_available_to_user`, but only runs
+        a single query.
+
+        """
+        allowed = Q(users_allowed=user) | Q(groups_allowed__in=user.groups.all())
+
+        grade = user.grade.number if user.grade else None
+        grade_fields = {9: "freshmen_allowed", 10: "sophomores_allowed", 11: "juniors_allowed", 12: "seniors_allowed"}
+        if grade in grade_fields:
+            allowed |= Q(**{grade_fields[grade]: True})
+
+        return EighthActivity.objects.filter(id=self.id).filter(allowed).exists()
+
     @classmethod
     def available_ids(cls):
         id_min = 1
@@ -657,6 +681,11 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
             not set, falls back on the EighthActivity's special setting.
         cancelled
             whether the :class:`EighthScheduledActivity` has been cancelled
+        signup_count
+            The number of users signed up for the scheduled activity.
+            This is kept up to date when an :class:`EighthSignup` is
+            created, moved or deleted, and can be recalculated with the
+            ``repair_signup_counts`` command.
 
     """
 
@@ -684,6 +713,33 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
     attendance_taken = models.BooleanField(default=False)
     cancelled = models.BooleanField(default=False)
 
+    signup_count = models.IntegerField(default=0)
+
+    @classmethod
+    def update_signup_counts(cls, ids):
+        """Recalculate the signup counts of the given scheduled activities.
+
+        This must be called after signups are changed without sending
+        signals (e.g. with ``bulk_create``).
+
+        Returns:
+            The number of scheduled activities whose count was wrong.
+
+        """
+        ids = set(ids)
+        counts = dict(EighthSignup.objects.filter(scheduled_activity_id__in=ids)
+                                          .values_list("scheduled_activity_id")
+                                          .annotate(count=Count("id")))
+        changed = 0
+        for sched_act_id, signup_count in (EighthScheduledActivity.objects.nocache()
+                                                                  .filter(id__in=ids)
+                                                                  .values_list("id", "signup_count")):
+            if counts.get(sched_act_id, 0) != signup_count:
+                invalidated_update(EighthScheduledActivity.objects.filter(id=sched_act_id),
+                                   signup_count=counts.get(sched_act_id, 0))
+                changed += 1
+        return changed
+
     @property
     def full_title(self):
         """Gets the full title for the activity, appending the title of the scheduled activity to
@@ -768,24 +824,21 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         """Return whether the activity is full."""
         capacity = self.get_true_capacity()
         if capacity != -1:
-            num_signed_up = self.eighthsignup_set.count()
-            return num_signed_up >= capacity
+            return self.signup_count >= capacity
         return False
 
     def is_almost_full(self):
         """Return whether the activity is almost full (>90%)."""
         capacity = self.get_true_capacity()
         if capacity != -1:
-            num_signed_up = self.eighthsignup_set.count()
-            return num_signed_up >= (0.9 * capacity)
+            return self.signup_count >= (0.9 * capacity)
         return False
 
     def is_overbooked(self):
         """Return whether the activity is overbooked."""
         capacity = self.get_true_capacity()
         if capacity != -1:
-            num_signed_up = self.eighthsignup_set.count()
-            return num_signed_up > capacity
+            return self.signup_count > capacity
         return False
 
     def is_too_early_to_signup(self, now=None):
@@ -806,29 +859,48 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         """Return whether there are passes that have not been acknowledged."""
         return self.eighthsignup_set.filter(after_deadline=True, pass_accepted=False)
 
-    def get_viewable_members(self, user=None):
-        """Get the list of members that you have permissions to view.
+    def get_members_by_visibility(self, user=None):
+        """Split the members into those that a user has permission to
+        view and those that are hidden.
 
-        Returns: List of members
+        The members are loaded with their directory entries in one query,
+        and their permissions are fetched in one batch (see
+        :meth:`User.preload_permissions`) instead of one lookup per
+        member.
+
+        Args:
+            user
+                The user viewing the roster.
+
+        Returns:
+            A tuple of the list of viewable members, sorted by name, and
+            the list of hidden members.
 
         """
-        members = []
-        for member in self.members.all():
-            show = False
-            if member.dn and member.can_view_eighth:
-                show = member.can_view_eighth
+        members = list(self.members.select_related("directory_entry"))
+        sees_all = user is not None and (user.is_eighth_admin or user.is_teacher)
+        if not sees_all:
+            User.preload_permissions(members)
+        User.prefetch_cache([member for member in members if member.directory is None], ["last_name", "first_name"])
+
+        viewable = []
+        hidden = []
+        for member in members:
+            if sees_all or member == user or (member.dn and member.can_view_eighth):
+                viewable.append(member)
+            else:
+                hidden.append(member)
+
+        viewable.sort(key=lambda u: (u.last_name, u.first_name))
+        return viewable, hidden
 
-            if not show and user and user.is_eighth_admin:
-                show = True
-            if not show and user and user.is_teacher:
-                show = True
-            if not show and member == user:
-                show = True
+    def get_viewable_members(self, user=None):
+        """Get the list of members that you have permissions to view.
 
-            if show:
-                members.append(member)
+        Returns: List of members
 
-        return sorted(members, key=lambda u: (u.last_name, u.first_name))
+        """
+        return self.get_members_by_visibility(user)[0]
 
     def get_viewable_members_serializer(self, request):
         """Get a QuerySet of User objects of students in the activity. Needed for the
@@ -837,24 +909,8 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         Returns: QuerySet
 
         """
-        ids = []
-        user = request.user
-        for member in self.members.all():
-            show = False
-            if member.dn and member.can_view_eighth:
-                show = member.can_view_eighth
-
-            if not show and user and user.is_eighth_admin:
-                show = True
-            if not show and user and user.is_teacher:
-                show = True
-            if not show and member == user:
-                show = True
-
-            if show:
-                ids.append(member.id)
-
-        return User.objects.filter(id__in=ids)
+        viewable = self.get_members_by_visibility(request.user)[0]
+        return User.objects.filter(id__in=[member.id for member in viewable])
 
     def get_hidden_members(self, user=None):
         """Get the members that you do not have permission to view.
@@ -862,23 +918,7 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         Returns: List of members hidden based on their permission preferences
 
         """
-        hidden_members = []
-        for member in self.members.all():
-            show = False
-            if member.dn and member.can_view_eighth:
-                show = member.can_view_eighth
-
-            if not show and user and user.is_eighth_admin:
-                show = True
-            if not show and user and user.is_teacher:
-                show = True
-            if not show and member == user:
-                show = True
-
-            if not show:
-                hidden_members.append(member)
-
-        return hidden_members
+        return self.get_members_by_visibility(user)[1]
 
     def get_both_blocks_sibling(self):
         """If this is a both-blocks activity, get the other EighthScheduledActivity
@@ -916,7 +956,19 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         Raises an exception if there's a problem signing the user up
         unless the signup is forced.
 
+        The checks and the write happen in one transaction which locks
+        the scheduled activity (and its both-blocks sibling), so
+        concurrent signups can not push an activity past its capacity.
+
         """
+        start = time.time()
+        try:
+            with transaction.atomic():
+                return self._add_user(user, request, force)
+        finally:
+            logger.info("Signup of {} for {} took {:.1f}ms".format(user, self, (time.time() - start) * 1000))
+
+    def _add_user(self, user, request, force):
         if request is not None:
             force = (force or ("force" in request.GET)) and request.user.is_eighth_admin
 
@@ -937,6 +989,24 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
             all_sched_act = [self]
             all_blocks = [self.block]
 
+        # Hold a lock on the scheduled activities until the signup is
+        # committed, so that the capacity check below stays valid
+        signup_counts = dict(EighthScheduledActivity.objects.nocache()
+                                                    .select_for_update()
+                                                    .filter(id__in=[sched_act.id for sched_act in all_sched_act])
+                                                    .order_by("id")
+                                                    .values_list("id", "signup_count"))
+        for sched_act in all_sched_act:
+            sched_act.signup_count = signup_counts[sched_act.id]
+
+        # All of the user's signups on this day, for the sticky and
+        # one-a-day checks and for changing an existing signup
+        day_signups = list(EighthSignup.objects.nocache()
+                                       .filter(user=user,
+                                               scheduled_activity__block__date=self.block.date)
+                                       .select_related("scheduled_activity__activity",
+                                                       "scheduled_activity__block"))
+
         if not force:
             # Check if the user who sent the request has the permissions
             # to change the target user's signups
@@ -968,36 +1038,24 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
                     exception.Presign = True
 
             # Check if the user is already stickied into an activity
-            if not self.activity.both_blocks:
-                in_stickie = (EighthSignup.objects
-                                          .filter(user=user,
-                                                  scheduled_activity__activity__sticky=True,
-                                                  scheduled_activity__block=self.block)
-                                          .exists())
-            else:
-                in_stickie = (EighthSignup.objects
-                                          .filter(user=user,
-                                                  scheduled_activity__activity__sticky=True,
-                                                  scheduled_activity__block__in=all_blocks)
-                                          .exists())
+            block_ids = [block.id for block in all_blocks]
+            in_stickie = any(signup.scheduled_activity.activity.sticky and
+                             signup.scheduled_activity.block_id in block_ids
+                             for signup in day_signups)
             if in_stickie:
                 exception.Sticky = True
 
             # Check if signup would violate one-a-day constraint
             if not self.activity.both_blocks and self.activity.one_a_day:
-                in_act = (EighthSignup.objects
-                                      .exclude(scheduled_activity__block=self.block)
-                                      .filter(user=user,
-                                              scheduled_activity__block__date=self.block.date,
-                                              scheduled_activity__activity=self.activity)
-                                      .exists())
+                in_act = any(signup.scheduled_activity.block_id != self.block_id and
+                             signup.scheduled_activity.activity_id == self.activity_id
+                             for signup in day_signups)
                 if in_act:
                     exception.OneADay = True
 
             # Check if user is allowed in the activity if it's restricted
             if self.activity.restricted:
-                acts = EighthActivity.restricted_activities_available_to_user(user)
-                if self.activity.id not in acts:
+                if not self.activity.is_available_to_user(user):
                     exception.Restricted = True
 
         success_message = "Successfully signed up for activity."
@@ -1047,9 +1105,10 @@ class EighthScheduledActivity(AbstractBaseEighthModel):
         after_deadline = self.block.locked
         if not self.activity.both_blocks:
             try:
-                existing_signup = (EighthSignup.objects
-                                               .get(user=user,
-                                                    scheduled_activity__block=self.block))
+                existing_signups = [signup for signup in day_signups if signup.scheduled_activity.block_id == self.block_id]
+                if not existing_signups:
+                    raise EighthSignup.DoesNotExist
+                existing_signup = existing_signups[0]
 
                 previous_activity_name = existing_signup.scheduled_activity.activity.name_with_flags
                 prev_sponsors = existing_signup.scheduled_activity.get_true_sponsors()
@@ -1327,3 +1386,115 @@ class EighthSignup(AbstractBaseEighthModel):
 
     class Meta:
         unique_together = (("user", "scheduled_activity"),)
+
+
+def invalidated_update(queryset, **kwargs):
+    """Update the rows of a queryset and invalidate the cached querysets that they appear in.
+
+    ``QuerySet.update()`` does not send signals, so cacheops can not tell
+    which cached querysets it affects. This invalidates every cached
+    queryset that matched one of the rows either before or after the
+    update (once the transaction is committed, so that a concurrent
+    request can not cache the old values again), so eighth models can be
+    cached without serving stale data.
+
+    Args:
+        queryset
+            The queryset to update.
+        kwargs
+            The new values, as for ``QuerySet.update()``.
+
+    Returns:
+        The number of rows updated.
+
+    """
+    model = queryset.model
+    with transaction.atomic():
+        old = list(queryset.nocache().select_for_update())
+        ids = [obj.pk for obj in old]
+        if not ids:
+            return 0
+        updated = model.objects.filter(pk__in=ids).update(**kwargs)
+        new = list(model.objects.nocache().filter(pk__in=ids))
+
+        def invalidate():
+            for obj in old + new:
+                invalidate_obj(obj)
+
+        transaction.on_commit(invalidate)
+
+    return updated
+
+
+def _change_signup_count(sched_act_id, change):
+    invalidated_update(EighthScheduledActivity.objects.filter(id=sched_act_id),
+                       signup_count=F("signup_count") + change)
+
+
+@receiver(post_init, sender=EighthSignup, dispatch_uid="eighthsignup_track_scheduled_activity")
+def track_signup_scheduled_activity(sender, instance, **kwargs):
+    """Remember the scheduled activity a signup was loaded with, so that moves can be detected."""
+    # Read from __dict__ so that deferred fields are not loaded
+    instance._original_scheduled_activity_id = instance.__dict__.get("scheduled_activity_id")
+
+
+@receiver(post_save, sender=EighthSignup, dispatch_uid="eighthsignup_count_save")
+def update_signup_count_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep ``EighthScheduledActivity.signup_count`` up to date when a signup is created or moved
+    to another scheduled activity."""
+    if raw:
+        return
+
+    original = instance._original_scheduled_activity_id
+    if created:
+        _change_signup_count(instance.scheduled_activity_id, 1)
+    elif original is not None and original != instance.scheduled_activity_id:
+        _change_signup_count(original, -1)
+        _change_signup_count(instance.scheduled_activity_id, 1)
+
+    instance._original_scheduled_activity_id = instance.scheduled_activity_id
+
+
+@receiver(post_delete, sender=EighthSignup, dispatch_uid="eighthsignup_count_delete")
+def update_signup_count_on_delete(sender, instance, **kwargs):
+    """Keep ``EighthScheduledActivity.signup_count`` up to date when a signup is deleted."""
+    _change_signup_count(instance._original_scheduled_activity_id or instance.scheduled_activity_id, -1)
+
+
+ACTIVITY_LIST_VERSION_KEY = "eighth_block_activities:version"
+
+
+def get_activity_list_version():
+    """Return the current version of the cached block activity lists.
+
+    The version is part of the cache key of every block's activity list
+    (see ``EighthBlockDetailSerializer``), so incrementing it
+    invalidates all of them at once.
+
+    """
+    version = cache.get(ACTIVITY_LIST_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(ACTIVITY_LIST_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def invalidate_activity_lists(sender=None, **kwargs):
+    """Invalidate the cached block activity lists after an activity, schedule, room or sponsor
+    edit."""
+    try:
+        cache.incr(ACTIVITY_LIST_VERSION_KEY)
+    except ValueError:
+        cache.set(ACTIVITY_LIST_VERSION_KEY, 2, timeout=None)
+
+
+for model in (EighthActivity, EighthScheduledActivity, EighthRoom, EighthSponsor):
+    post_save.connect(invalidate_activity_lists, sender=model,
+                      dispatch_uid="invalidate_activity_lists_save_{}".format(model.__name__))
+    post_delete.connect(invalidate_activity_lists, sender=model,
+                        dispatch_uid="invalidate_activity_lists_delete_{}".format(model.__name__))
+
+for through in (EighthActivity.rooms.through, EighthActivity.sponsors.through,
+                EighthScheduledActivity.rooms.through, EighthScheduledActivity.sponsors.through):
+    m2m_changed.connect(invalidate_activity_lists, sender=through,
+                        dispatch_uid="invalidate_activity_lists_m2m_{}".format(through.__name__))
@@ -3,25 +3,52 @@
 import logging
 
 from .models import EighthSignup
-from ..notifications.emails import email_send
+from ..notifications.emails import email_build, email_send
 
 logger = logging.getLogger(__name__)
 
 
 def signup_status_email(user, next_blocks):
+    msg = build_signup_status_email(user, next_blocks)
+    if msg is None:
+        return False
+
+    logger.debug("Emailing {} to {}".format(msg.subject, msg.to))
+    msg.send()
+
+
+def build_signup_status_email(user, next_blocks, signups=None):
+    """Render the signup status email for a user without sending it.
+
+    Args:
+        user
+            The user to email.
+        next_blocks
+            The upcoming blocks to report on.
+        signups
+            An optional dictionary mapping block IDs to the user's
+            signups, to avoid querying for each block.
+
+    Returns:
+        The message, or ``None`` if the user has no email address.
+
+    """
     em = user.tj_email if user.tj_email else user.emails[0] if user.emails and len(user.emails) >= 1 else None
     if em:
         emails = [em]
     else:
-        return False
+        return None
 
     blocks = []
     issues = 0
     for blk in next_blocks:
-        try:
-            signup = EighthSignup.objects.get(user=user, scheduled_activity__block=blk)
-        except EighthSignup.DoesNotExist:
-            signup = None
+        if signups is not None:
+            signup = signups.get(blk.id)
+        else:
+            try:
+                signup = EighthSignup.objects.get(user=user, scheduled_activity__block=blk)
+            except EighthSignup.DoesNotExist:
+                signup = None
 
         cancelled = False
 
@@ -60,9 +87,9 @@ def signup_status_email(user, next_blocks):
         "info_link": base_url + "eighth/signup"
     }
 
-    email_send("eighth/emails/signup_status.txt",
-               "eighth/emails/signup_status.html",
-               data, subject, emails)
+    return email_build("eighth/emails/signup_status.txt",
+                       "eighth/emails/signup_status.html",
+                       data, subject, emails)
 
 
 def absence_email(signup):
@@ -3,13 +3,14 @@
 import logging
 from collections import OrderedDict
 
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
 
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
 from .models import (EighthActivity, EighthBlock, EighthScheduledActivity,
-                     EighthSignup, EighthSponsor)
+                     EighthSignup, EighthSponsor, get_activity_list_version)
 from ..users.models import User
 
 logger = logging.getLogger(__name__)
@@ -89,24 +90,25 @@ class EighthBlockDetailSerializer(serializers.Serializer):
     block_letter = serializers.CharField(max_length=10)
     comments = serializers.CharField(max_length=100)
 
-    def process_scheduled_activity(self, scheduled_activity, request=None, user=None, favorited_activities=None, available_restricted_acts=None):
+    def process_scheduled_activity(self, scheduled_activity, request=None):
+        """Return the information about a scheduled activity that is the same for every user.
+
+        Returns:
+            A tuple of the activity information and the parts of the
+            activity's name that go before and after the restricted
+            flag.
+
+        """
         activity = scheduled_activity.activity
-        restricted_for_user = (activity.restricted and
-                               not (user.is_eighth_admin and not user.is_student) and
-                               (activity.id not in available_restricted_acts))
         prefix = "Special: " if activity.special else ""
         prefix += activity.name
         if scheduled_activity.title:
             prefix += " - " + scheduled_activity.title
-        middle = " (R)" if restricted_for_user else ""
         suffix = " (S)" if activity.sticky else ""
         suffix += " (BB)" if activity.both_blocks else ""
         suffix += " (A)" if activity.administrative else ""
         suffix += " (Deleted)" if activity.deleted else ""
 
-        name_with_flags = prefix + middle + suffix
-        name_with_flags_for_user = prefix + (middle if restricted_for_user else "") + suffix
-
         activity_info = {
             "id": activity.id,
             "aid": activity.aid,
@@ -120,11 +122,8 @@ class EighthBlockDetailSerializer(serializers.Serializer):
                            args=[activity.id],
                            request=request),
             "name": activity.name,
-            "name_with_flags": name_with_flags,
-            "name_with_flags_for_user": name_with_flags_for_user,
             "description": activity.description,
             "cancelled": scheduled_activity.cancelled,
-            "favorited": activity.id in favorited_activities,
             "roster": {
                 "count": 0,
                 "capacity": 0,
@@ -135,7 +134,6 @@ class EighthBlockDetailSerializer(serializers.Serializer):
             "rooms": [],
             "sponsors": [],
             "restricted": activity.restricted,
-            "restricted_for_user": restricted_for_user,
             "both_blocks": activity.both_blocks,
             "one_a_day": activity.one_a_day,
             "special": scheduled_activity.get_special(),
@@ -146,10 +144,69 @@ class EighthBlockDetailSerializer(serializers.Serializer):
             "comments": scheduled_activity.comments,
             "display_text": ""
         }
-        return activity_info
+        return activity_info, (prefix, suffix)
 
     def fetch_activity_list_with_metadata(self, block):
+        """Return the activities scheduled for the block with their signup counts and the
+        fields that depend on the user (favorites and restrictions).
+
+        The rest of the list is the same for every user, so it is built
+        by :meth:`build_activity_list` once per version of the eighth
+        period schedule and cached.
+
+        """
+        request = self.context["request"]
+        key = "eighth_block_activities:{}:{}:{}".format(get_activity_list_version(), block.id,
+                                                        request.build_absolute_uri("/"))
+        cached = cache.get(key)
+        if cached:
+            activity_list, name_parts = cached
+        else:
+            activity_list, name_parts = self.build_activity_list(block, request)
+            cache.set(key, (activity_list, name_parts), timeout=settings.CACHE_AGE["eighth_block_activities"])
+
+        # Live signup counts
+        for activity_id, signup_count in (block.eighthscheduledactivity_set
+                                               .exclude(activity__deleted=True)
+                                               .values_list("activity_id", "signup_count")):
+            if activity_id in activity_list:
+                activity_list[activity_id]["roster"]["count"] = signup_count
+
+        user = self.context.get("user", request.user)
+        favorited_activities = set(user.favorited_activity_set
+                                       .values_list("id", flat=True))
+        if any(activity_info["restricted"] for activity_info in activity_list.values()):
+            available_restricted_acts = EighthActivity.restricted_activities_available_to_user(user)
+            can_bypass_restrictions = user.is_eighth_admin and not user.is_student
+        else:
+            available_restricted_acts = []
+            can_bypass_restrictions = False
+
+        for activity_id, activity_info in activity_list.items():
+            restricted_for_user = (activity_info["restricted"] and
+                                   not can_bypass_restrictions and
+                                   (activity_id not in available_restricted_acts))
+            prefix, suffix = name_parts[activity_id]
+            middle = " (R)" if restricted_for_user else ""
+
+            activity_info["favorited"] = activity_id in favorited_activities
+            activity_info["restricted_for_user"] = restricted_for_user
+            activity_info["name_with_flags"] = prefix + middle + suffix
+            activity_info["name_with_flags_for_user"] = prefix + middle + suffix
+
+        return activity_list
+
+    def build_activity_list(self, block, request):
+        """Build the user-independent part of the activity list for a block.
+
+        Returns:
+            A tuple of a dictionary mapping activity IDs to activity
+            information and a dictionary mapping activity IDs to the
+            parts of their names (see :meth:`process_scheduled_activity`).
+
+        """
         activity_list = {}
+        name_parts = {}
         scheduled_activity_to_activity_map = {}
 
         # Find all scheduled activities that don't correspond to
@@ -158,31 +215,12 @@ class EighthBlockDetailSerializer(serializers.Serializer):
                                      .exclude(activity__deleted=True)
                                      .select_related("activity"))
 
-        user = self.context.get("user", self.context["request"].user)
-        favorited_activities = set(user.favorited_activity_set
-                                       .values_list("id", flat=True))
-        available_restricted_acts = EighthActivity.restricted_activities_available_to_user(user)
-
         for scheduled_activity in scheduled_activities:
-            activity_info = self.process_scheduled_activity(scheduled_activity,
-                                                            self.context["request"],
-                                                            user,
-                                                            favorited_activities,
-                                                            available_restricted_acts)
+            activity_info, parts = self.process_scheduled_activity(scheduled_activity, request)
             activity = scheduled_activity.activity
             scheduled_activity_to_activity_map[scheduled_activity.id] = activity.id
             activity_list[activity.id] = activity_info
-
-        # Find the number of students signed up for every activity
-        # in this block
-        activities_with_signups = (EighthSignup.objects
-                                               .filter(scheduled_activity__block=block)
-                                               .exclude(scheduled_activity__activity__deleted=True)
-                                               .values_list("scheduled_activity__activity_id")
-                                               .annotate(user_count=Count("scheduled_activity")))
-
-        for activity, user_count in activities_with_signups:
-            activity_list[activity]["roster"]["count"] = user_count
+            name_parts[activity.id] = parts
 
         sponsors_dict = (EighthSponsor.objects
                                       .values_list("id",
@@ -290,7 +328,7 @@ class EighthBlockDetailSerializer(serializers.Serializer):
                 sched_act_id = scheduled_activity.activity.id
                 activity_list[sched_act_id]["roster"]["capacity"] = capacity
 
-        return activity_list
+        return activity_list, name_parts
 
     class Meta:
         fields = ("id",
@@ -399,12 +437,12 @@ class EighthScheduledActivitySerializer(serializers.ModelSerializer):
         serializer = UserSerializer(signups, context=self.context, many=True)
         return {
             "members": serializer.data,
-            "count": scheduled_activity.members.count(),
+            "count": scheduled_activity.signup_count,
             "viewable_count": signups.count()
         }
 
     def num_signups(self, scheduled_activity):
-        return scheduled_activity.members.count()
+        return scheduled_activity.signup_count
 
     class Meta:
         model = EighthScheduledActivity
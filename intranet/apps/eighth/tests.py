@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
+from io import StringIO
+
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 
+from ..eighth.exceptions import SignupException
 from ..eighth.models import (EighthActivity, EighthBlock, EighthRoom,
-                             EighthScheduledActivity)
+                             EighthScheduledActivity, EighthSignup, invalidated_update)
+from ..eighth.views.admin.rooms import room_utilization_rows
 from ..groups.models import Group
 from ..users.models import User
 from ...test.ion_test import IonTestCase
@@ -76,3 +81,119 @@ class EighthTest(IonTestCase):
         )
 
         self.verify_signup(user1, schact1)
+
+    def test_signup_capacity(self):
+        """Make sure signups can not exceed capacity, and that changing activities moves the
+        existing signup."""
+
+        user1 = User.objects.create(username="user1")
+        user2 = User.objects.create(username="user2")
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        act2 = EighthActivity.objects.create(name="Test Activity 2")
+        schact1 = EighthScheduledActivity.objects.create(activity=act1, block=block1, capacity=1)
+        schact2 = EighthScheduledActivity.objects.create(activity=act2, block=block1, capacity=5)
+
+        self.verify_signup(user1, schact1)
+        with self.assertRaises(SignupException) as e:
+            schact1.add_user(user2)
+        self.assertIn("ActivityFull", e.exception.errors)
+        self.assertEqual(schact1.eighthsignup_set.count(), 1)
+
+        schact2.add_user(user1)
+        self.assertEqual(schact1.eighthsignup_set.count(), 0)
+        self.assertEqual(user1.eighthsignup_set.get().scheduled_activity, schact2)
+
+    def test_signup_count(self):
+        """Make sure the signup counts follow created, moved and deleted signups."""
+
+        user1 = User.objects.create(username="user1")
+        user2 = User.objects.create(username="user2")
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        act2 = EighthActivity.objects.create(name="Test Activity 2")
+        schact1 = EighthScheduledActivity.objects.create(activity=act1, block=block1)
+        schact2 = EighthScheduledActivity.objects.create(activity=act2, block=block1)
+
+        def counts():
+            return [EighthScheduledActivity.objects.nocache().get(id=schact.id).signup_count for schact in (schact1, schact2)]
+
+        schact1.add_user(user1)
+        schact1.add_user(user2)
+        self.assertEqual(counts(), [2, 0])
+
+        schact2.add_user(user1)
+        self.assertEqual(counts(), [1, 1])
+
+        EighthSignup.objects.filter(user=user2).delete()
+        self.assertEqual(counts(), [0, 1])
+
+        EighthSignup.objects.bulk_create([EighthSignup(user=user2, scheduled_activity=schact1)])
+        self.assertEqual(counts(), [0, 1])
+        self.assertEqual(EighthScheduledActivity.update_signup_counts([schact1.id, schact2.id]), 1)
+        self.assertEqual(counts(), [1, 1])
+
+    def test_invalidated_update(self):
+        """Make sure invalidated_update updates every row of the queryset."""
+
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        act2 = EighthActivity.objects.create(name="Test Activity 2")
+        schact1 = EighthScheduledActivity.objects.create(activity=act1, block=block1)
+        EighthScheduledActivity.objects.create(activity=act2, block=block1)
+
+        self.assertEqual(invalidated_update(EighthScheduledActivity.objects.filter(block=block1), cancelled=True), 2)
+        self.assertTrue(EighthScheduledActivity.objects.nocache().get(id=schact1.id).cancelled)
+        self.assertEqual(invalidated_update(EighthScheduledActivity.objects.filter(block=block1, cancelled=False),
+                                            cancelled=True), 0)
+
+    def test_members_by_visibility(self):
+        """Make sure eighth admins can view every member of an activity."""
+
+        user = User.get_user(username='awilliam')
+        user.groups.add(Group.objects.get_or_create(name="admin_all")[0])
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        schact1 = EighthScheduledActivity.objects.create(activity=act1, block=block1)
+        schact1.add_user(user)
+
+        self.assertEqual(schact1.get_members_by_visibility(user), ([user], []))
+        self.assertEqual(schact1.get_hidden_members(user), [])
+
+    def test_room_utilization_rows(self):
+        """Make sure the room utilization CSV falls back to the activity's rooms."""
+
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+        room1 = EighthRoom.objects.create(name="room1", capacity=5)
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        act1.rooms.add(room1)
+        EighthScheduledActivity.objects.create(activity=act1, block=block1)
+
+        sched_acts = EighthScheduledActivity.objects.prefetch_related("rooms", "activity__rooms")
+        rows = list(room_utilization_rows(sched_acts, ["rooms", "capacity", "signups"]))
+        self.assertEqual(rows, [["Rooms", "Capacity", "Signups"], ["room1 (5)", 5, 0]])
+
+    def test_find_duplicates(self):
+        """Make sure duplicate signups in a block are reported."""
+
+        user1 = User.objects.create(username="user1")
+        block1 = EighthBlock.objects.create(date='2015-01-01', block_letter="A")
+        act1 = EighthActivity.objects.create(name="Test Activity 1")
+        act2 = EighthActivity.objects.create(name="Test Activity 2")
+        schact1 = EighthScheduledActivity.objects.create(activity=act1, block=block1)
+        schact2 = EighthScheduledActivity.objects.create(activity=act2, block=block1)
+
+        out = StringIO()
+        call_command("find_duplicates", stdout=out)
+        self.assertIn("0 duplicates found.", out.getvalue())
+
+        EighthSignup.objects.bulk_create([EighthSignup(user=user1, scheduled_activity=schact1),
+                                          EighthSignup(user=user1, scheduled_activity=schact2)])
+        out = StringIO()
+        call_command("find_duplicates", "--fix", stdout=out)
+        self.assertIn("Duplicate: user {} block {} (2 signups)".format(user1.id, block1.id), out.getvalue())
+        # Neither activity is a both-blocks activity, so the duplicate is left alone
+        self.assertIn("0 signups deleted, 1 duplicates left unresolved.", out.getvalue())
+        self.assertEqual(user1.eighthsignup_set.count(), 2)
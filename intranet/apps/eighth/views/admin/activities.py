@@ -3,8 +3,6 @@
 import logging
 import pickle
 
-from cacheops import invalidate_obj
-
 from django import forms, http
 from django.contrib import messages
 from django.core.urlresolvers import reverse
@@ -31,7 +29,6 @@ def add_activity_view(request):
             else:
                 activity = (EighthActivity.objects.create(name=form.cleaned_data["name"],
                                                           id=int(new_id)))
-            invalidate_obj(activity)
             messages.success(request, "Successfully added activity.")
             return redirect("eighth_admin_edit_activity",
                             activity_id=activity.id)
@@ -167,7 +164,6 @@ def edit_activity_view(request, activity_id):
                     activity.restricted = True
                     activity.groups_allowed.add(grp)
                     activity.save()
-                    invalidate_obj(activity)
                     messages.success(request, "{} to '{}' group".format("Created and added" if status else "Added", grp_name))
                     return redirect("eighth_admin_edit_group", grp.id)
 
@@ -255,7 +251,6 @@ def delete_activity_view(request, activity_id=None):
         else:
             activity.deleted = True
             activity.save()
-            invalidate_obj(activity)
         messages.success(request, "Successfully deleted activity.")
         return redirect("eighth_admin_dashboard")
     else:
@@ -4,15 +4,13 @@ import csv
 import logging
 from datetime import MAXYEAR, MINYEAR, date, datetime, timedelta
 
-from cacheops import invalidate_obj
-
 from django import http
 from django.contrib import messages
 from django.db.models import Count, Q
 from django.shortcuts import redirect, render
 
 from ...models import (EighthActivity, EighthBlock, EighthRoom,
-                       EighthScheduledActivity, EighthSignup)
+                       EighthScheduledActivity, EighthSignup, invalidated_update)
 from ...utils import get_start_date
 from ....auth.decorators import eighth_admin_required
 from ....users.models import User
@@ -105,7 +103,7 @@ def delinquent_students_view(request):
             all_students = User.objects.get_students().values_list("id")
             uids_all_students = [row[0] for row in all_students]
             uids_without_absence = set(uids_all_students) - set(uids_with_absence)
-            users_without_absence = User.objects.filter(id__in=uids_without_absence).order_by("id")
+            users_without_absence = User.objects.filter(id__in=uids_without_absence).select_related("directory_entry").order_by("id")
             non_delinquents = []
             for usr in users_without_absence:
                 non_delinquents.append({
@@ -129,7 +127,7 @@ def delinquent_students_view(request):
                                        .order_by("user"))
 
             user_ids = [d["user"] for d in delinquents]
-            delinquent_users = User.objects.filter(id__in=user_ids).order_by("id")
+            delinquent_users = User.objects.filter(id__in=user_ids).select_related("directory_entry").order_by("id")
             for index, user in enumerate(delinquent_users):
                 delinquents[index]["user"] = user
             logger.debug(delinquents)
@@ -371,17 +369,20 @@ def migrate_outstanding_passes_view(request):
                                     "office was not turned in.")
 
         activity.save()
-        invalidate_obj(activity)
 
         pass_not_received, created = (EighthScheduledActivity.objects
                                                              .get_or_create(block=block,
                                                                             activity=activity))
 
-        EighthSignup.objects.filter(
+        outstanding = EighthSignup.objects.filter(
             scheduled_activity__block=block,
             after_deadline=True,
             pass_accepted=False
-        ).update(scheduled_activity=pass_not_received)
+        )
+        moved_from = set(outstanding.values_list("scheduled_activity_id", flat=True))
+        invalidated_update(outstanding, scheduled_activity=pass_not_received)
+        # update() skips the signals that keep signup counts up to date
+        EighthScheduledActivity.update_signup_counts(moved_from | {pass_not_received.id})
 
         messages.success(request, "Successfully migrated outstanding passes.")
 
@@ -469,7 +470,6 @@ def clear_absence_view(request, signup_id):
             raise http.Http404
         signup.was_absent = False
         signup.save()
-        invalidate_obj(signup)
         if "next" in request.GET:
             return redirect(request.GET["next"])
         return redirect("eighth_admin_dashboard")
@@ -500,7 +500,6 @@ def open_passes_view(request):
             elif status == "reject":
                 signup.reject_pass()
                 rejected += 1
-            invalidate_obj(signup)
 
         messages.success(request, "Accepted {} and rejected {} passes.".format(accepted, rejected))
 
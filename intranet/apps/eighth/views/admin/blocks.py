@@ -4,8 +4,6 @@ import logging
 import pickle
 import re
 
-from cacheops import invalidate_model
-
 from django import http
 from django.contrib import messages
 from django.core.urlresolvers import reverse
@@ -68,8 +66,6 @@ def add_block_view(request):
                     EighthBlock.objects.get(date=fmtdate, block_letter=l).delete()
                     messages.success(request, "Successfully removed {} Block on {}".format(l, fmtdate))
 
-            invalidate_model(EighthBlock)
-
     letters = []
     visible_blocks = ["A", "B", "C", "D", "E", "F", "G", "H"]
     if show_letters:
@@ -110,7 +106,6 @@ def edit_block_view(request, block_id):
         form = BlockForm(request.POST, instance=block)
         if form.is_valid():
             form.save()
-            invalidate_model(EighthBlock)
             messages.success(request, "Successfully edited block.")
             return redirect("eighth_admin_dashboard")
         else:
@@ -136,7 +131,6 @@ def delete_block_view(request, block_id):
 
     if request.method == "POST":
         block.delete()
-        invalidate_model(EighthBlock)
         messages.success(request, "Successfully deleted block.")
         return redirect("eighth_admin_dashboard")
     else:
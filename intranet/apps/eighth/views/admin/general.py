@@ -1,24 +1,31 @@
 # -*- coding: utf-8 -*-
 
+import logging
 import pickle
 
 from urllib.parse import unquote
 
 from cacheops import invalidate_all
+from cacheops.conf import redis_client
 
 from django.conf import settings
 from django.contrib import messages
 from django.shortcuts import redirect, render
 
+import redis
+
 from ...forms.admin import general as general_forms
 from ...forms.admin import groups as group_forms
 from ...forms.admin import rooms as room_forms
-from ...models import EighthActivity, EighthBlock, EighthRoom, EighthSponsor
+from ...models import (EighthActivity, EighthBlock, EighthRoom, EighthScheduledActivity,
+                       EighthSignup, EighthSponsor)
 from ...utils import get_start_date, set_start_date
 from ....auth.decorators import eighth_admin_required
 from ....groups.models import Group
 from ....users.models import User
 
+logger = logging.getLogger(__name__)
+
 
 @eighth_admin_required
 def eighth_admin_dashboard_view(request, **kwargs):
@@ -135,11 +142,41 @@ def cache_view(request):
 
     context = {
         "admin_page_title": "Cache Configuration",
-        "cache_length": cache
+        "cache_length": cache,
+        "cache_stats": get_cache_stats()
     }
     return render(request, "eighth/admin/cache.html", context)
 
 
+def get_cache_stats():
+    """Returns the hit rate of the cacheops Redis server and the number of cached querysets of
+    each eighth model.
+
+    Returns:
+        A dictionary, or None if Redis could not be reached.
+
+    """
+    try:
+        info = redis_client.info("stats")
+        models = []
+        for model in (EighthBlock, EighthActivity, EighthScheduledActivity, EighthSignup, EighthRoom, EighthSponsor):
+            # Each cached queryset is in a "conj:<table>:..." set for every condition it depends on
+            conj_keys = list(redis_client.scan_iter(match="conj:{}:*".format(model._meta.db_table)))
+            querysets = len(redis_client.sunion(conj_keys)) if conj_keys else 0
+            models.append((model._meta.verbose_name_plural, querysets))
+    except redis.RedisError as e:
+        logger.warning("Could not load cache stats: {}".format(e))
+        return None
+
+    hits, misses = info["keyspace_hits"], info["keyspace_misses"]
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": 100.0 * hits / (hits + misses) if hits + misses else None,
+        "models": models
+    }
+
+
 @eighth_admin_required
 def not_implemented_view(request, *args, **kwargs):
     raise NotImplementedError("This view has not been implemented yet.")
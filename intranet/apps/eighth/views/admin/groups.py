@@ -328,7 +328,8 @@ def download_group_csv_view(request, group_id):
 
     writer = csv.writer(response)
     writer.writerow(["Last Name", "First Name", "Student ID", "Grade", "Email"])
-    users = group.user_set.all()
+    user_ids = group.user_set.values_list("id", flat=True)
+    users = User.get_users(ids=user_ids, fields=["last_name", "first_name", "student_id", "graduation_year", "emails", "user_type"])
     users = sorted(users, key=lambda m: (m.last_name, m.first_name))
     for user in users:
         row = []
@@ -455,6 +456,10 @@ def eighth_admin_signup_group_action(request, group_id):
                     ))
 
         EighthSignup.objects.bulk_create(signup_bulk)
+        # bulk_create does not send signals, so neither cacheops nor the
+        # signup counts see the new signups
+        invalidate_model(EighthSignup)
+        EighthScheduledActivity.update_signup_counts(set(signup.scheduled_activity_id for signup in signup_bulk))
 
         messages.success(request, "Successfully signed up group for activity.")
         return redirect("eighth_admin_dashboard")
@@ -609,12 +614,14 @@ def eighth_admin_distribute_action(request):
                 user__id__in=userids,
                 scheduled_activity__block=schact.block
             ).delete()
-            for uid in userids:
-                changes += 1
-                EighthSignup.objects.create(
-                    user=User.objects.get(id=int(uid)),
-                    scheduled_activity=schact
-                )
+            users = User.objects.filter(id__in=[int(uid) for uid in userids])
+            EighthSignup.objects.bulk_create([EighthSignup(user=user, scheduled_activity=schact) for user in users])
+            changes += len(userids)
+
+        # bulk_create does not send signals, so neither cacheops nor the
+        # signup counts see the new signups
+        invalidate_model(EighthSignup)
+        EighthScheduledActivity.update_signup_counts(schact.id for schact in activity_user_map)
 
         messages.success(request, "Successfully completed {} activity signups.".format(changes))
 
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import csv
 import logging
 import pickle
 from collections import defaultdict
@@ -18,6 +17,7 @@ from ...forms.admin.rooms import RoomForm
 from ...models import EighthBlock, EighthRoom, EighthScheduledActivity
 from ...utils import get_start_date
 from ....auth.decorators import eighth_admin_required
+from .....utils.csv_export import stream_csv
 
 logger = logging.getLogger(__name__)
 
@@ -197,6 +197,46 @@ class EighthAdminRoomUtilizationWizard(SessionWizardView):
         return redirect("eighth_admin_room_utilization", start_block.id, end_block.id)
 
 
+def room_utilization_rows(sched_acts, columns, hide_administrative=False, only_show_overbooked=False):
+    """Generate the rows of the room utilization CSV, starting with the header.
+
+    Args:
+        sched_acts
+            A list of EighthScheduledActivity objects, with their block,
+            activity, rooms and sponsors already loaded.
+        columns
+            The names of the columns to include (see
+            ``room_utilization_action``).
+        hide_administrative
+            Whether to skip administrative activities.
+        only_show_overbooked
+            Whether to skip activities that are not overbooked.
+
+    """
+    yield [column.capitalize().replace("_", " ") for column in columns]
+
+    values = {
+        "block": lambda sch_act: sch_act.block,
+        "rooms": lambda sch_act: ";".join([str(rm) for rm in sch_act.get_true_rooms()]),
+        "capacity": lambda sch_act: sch_act.get_true_capacity(),
+        "signups": lambda sch_act: sch_act.signup_count,
+        "aid": lambda sch_act: sch_act.activity.aid,
+        "activity": lambda sch_act: sch_act.activity,
+        "comments": lambda sch_act: sch_act.comments,
+        "sponsors": lambda sch_act: ";".join([str(sp) for sp in sch_act.get_true_sponsors()]),
+        "admin_comments": lambda sch_act: sch_act.admin_comments
+    }
+
+    for sch_act in sched_acts:
+        if sch_act.activity.administrative and hide_administrative:
+            continue
+
+        if not sch_act.is_overbooked() and only_show_overbooked:
+            continue
+
+        yield [values[column](sch_act) for column in columns]
+
+
 @eighth_admin_required
 def room_utilization_action(request, start_id, end_id):
     try:
@@ -239,8 +279,13 @@ def room_utilization_action(request, start_id, end_id):
     }
     get_csv = request.resolver_match.url_name == "eighth_admin_room_utilization_csv"
     if show_listing or get_csv:
+        # The rooms, capacity and sponsors of each scheduled activity fall
+        # back to the activity's, so load both sets up front instead of
+        # querying for them on every row
         sched_acts = (EighthScheduledActivity.objects
-                                             .exclude(activity__deleted=True))
+                                             .exclude(activity__deleted=True)
+                                             .select_related("block", "activity")
+                                             .prefetch_related("rooms", "activity__rooms", "sponsors", "activity__sponsors"))
         # .exclude(cancelled=True) # include cancelled activities
         if not one_block:
             sched_acts = (sched_acts.filter(block__date__gte=start_block.date,
@@ -248,13 +293,10 @@ def room_utilization_action(request, start_id, end_id):
         else:
             sched_acts = sched_acts.filter(block=start_block)
 
-        logger.debug("sched_acts before: {}".format(sched_acts.count()))
         room_ids = request.GET.getlist("room")
         if "room" in request.GET:
             rooms = EighthRoom.objects.filter(id__in=room_ids)
-            sched_acts = sched_acts.filter(Q(rooms__in=rooms) | Q(activity__rooms__in=rooms))
-
-        logger.debug("sched_acts: {}".format(sched_acts.count()))
+            sched_acts = sched_acts.filter(Q(rooms__in=rooms) | Q(activity__rooms__in=rooms)).distinct()
 
         sched_acts = (sched_acts.order_by("block__date",
                                           "block__block_letter"))
@@ -270,7 +312,7 @@ def room_utilization_action(request, start_id, end_id):
 
         logger.debug("sched_acts end: {}".format(len(sched_acts)))
 
-        sched_acts = sorted(sched_acts, key=lambda x: ("{}".format(x.block), "{}".format(x.get_true_rooms())))
+        sched_acts = sorted(sched_acts, key=lambda x: ("{}".format(x.block), [str(rm) for rm in x.get_true_rooms()]))
 
         context.update({
             "scheduled_activities": sched_acts,
@@ -279,47 +321,9 @@ def room_utilization_action(request, start_id, end_id):
         })
 
     if get_csv:
-        response = http.HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = "attachment; filename=\"room_utilization.csv\""
-
-        writer = csv.writer(response)
-
-        title_row = []
-        for opt in show_opts:
-            if show[opt]:
-                title_row.append(opt.capitalize().replace("_", " "))
-        writer.writerow(title_row)
-
-        for sch_act in sched_acts:
-            row = []
-            if sch_act.activity.administrative and hide_administrative:
-                continue
-
-            if not sch_act.is_overbooked() and only_show_overbooked:
-                continue
-
-            if show["block"]:
-                row.append(sch_act.block)
-            if show["rooms"]:
-                row.append(";".join([str(rm) for rm in sch_act.get_true_rooms()]))
-            if show["capacity"]:
-                row.append(sch_act.get_true_capacity())
-            if show["signups"]:
-                row.append(sch_act.members.count())
-            if show["aid"]:
-                row.append(sch_act.activity.aid)
-            if show["activity"]:
-                row.append(sch_act.activity)
-            if show["comments"]:
-                row.append(sch_act.comments)
-            if show["sponsors"]:
-                row.append(";".join([str(sp) for sp in sch_act.get_true_sponsors()]))
-            if show["admin_comments"]:
-                row.append(sch_act.admin_comments)
-
-            writer.writerow(row)
-
-        return response
+        return stream_csv(room_utilization_rows(sched_acts, [opt for opt in show_opts if show[opt]],
+                                                hide_administrative, only_show_overbooked),
+                          "room_utilization.csv")
 
     return render(request, "eighth/admin/room_utilization.html", context)
 
@@ -2,8 +2,6 @@
 
 import logging
 
-from cacheops import invalidate_obj
-
 from django.contrib import messages
 from django.forms.formsets import formset_factory
 from django.http import Http404
@@ -15,7 +13,7 @@ from ...forms.admin.activities import ActivitySelectionForm
 from ...forms.admin.blocks import BlockSelectionForm
 from ...forms.admin.scheduling import ScheduledActivityForm
 from ...models import (EighthActivity, EighthBlock, EighthRoom,
-                       EighthScheduledActivity, EighthSponsor)
+                       EighthScheduledActivity, EighthSponsor, invalidated_update)
 from ...utils import get_start_date
 from ....auth.decorators import eighth_admin_required
 from .....utils.serialization import safe_json
@@ -47,9 +45,6 @@ def schedule_activity_view(request):
                     instance, created = (EighthScheduledActivity.objects
                                                                 .get_or_create(block=block,
                                                                                activity=activity))
-                    invalidate_obj(instance)
-                    invalidate_obj(block)
-                    invalidate_obj(activity)
                 else:
                     schact = EighthScheduledActivity.objects.filter(
                         block=block,
@@ -73,11 +68,8 @@ def schedule_activity_view(request):
                             if other_act:
                                 other_act.cancelled = True
                                 other_act.save()
-                                invalidate_obj(other_act)
                         else:
-                            schact.update(cancelled=True)
-                            for s in schact:
-                                invalidate_obj(s)
+                            invalidated_update(schact, cancelled=True)
                         instance = schact[0]
 
                         cancelled = True
@@ -92,23 +84,11 @@ def schedule_activity_view(request):
                         "comments",
                         "admin_comments"
                     ]
-                    if "rooms" in form.cleaned_data:
-                        for o in form.cleaned_data["rooms"]:
-                            invalidate_obj(o)
-
-                    if "sponsors" in form.cleaned_data:
-                        for o in form.cleaned_data["sponsors"]:
-                            invalidate_obj(o)
-
                     for field_name in fields:
                         obj = form.cleaned_data[field_name]
                         logger.debug("{} {}".format(field_name, obj))
                         setattr(instance, field_name, obj)
 
-                        if field_name in ["rooms", "sponsors"]:
-                            for o in obj:
-                                invalidate_obj(o)
-
                 if form["scheduled"].value() or cancelled:
                     # Uncancel if this activity/block pairing was already
                     # created and cancelled
@@ -452,15 +432,11 @@ def transfer_students_action(request):
     if request.method == "POST":
         if dest_unsignup and not dest_act:
             source_act.eighthsignup_set.all().delete()
-            invalidate_obj(source_act)
             messages.success(request, "Successfully removed signups for {} students.".format(num))
         else:
-            source_act.eighthsignup_set.update(
-                scheduled_activity=dest_act
-            )
-
-            invalidate_obj(source_act)
-            invalidate_obj(dest_act)
+            invalidated_update(source_act.eighthsignup_set.all(), scheduled_activity=dest_act)
+            # update() skips the signals that keep signup counts up to date
+            EighthScheduledActivity.update_signup_counts([source_act.id, dest_act.id])
             messages.success(request, "Successfully transfered {} students.".format(num))
         return redirect("eighth_admin_dashboard")
     else:
@@ -5,8 +5,6 @@ import logging
 from datetime import datetime
 from io import BytesIO
 
-from cacheops import invalidate_obj
-
 from django import http
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -27,7 +25,7 @@ from reportlab.platypus import (PageBreak, Paragraph, SimpleDocTemplate,
 from ..forms.admin.activities import ActivitySelectionForm
 from ..forms.admin.blocks import BlockSelectionForm
 from ..models import (EighthActivity, EighthBlock, EighthScheduledActivity,
-                      EighthSignup, EighthSponsor)
+                      EighthSignup, EighthSponsor, invalidated_update)
 from ..utils import get_start_date
 from ...auth.decorators import attendance_taker_required, eighth_admin_required
 from ...dashboard.views import gen_sponsor_schedule
@@ -213,8 +211,8 @@ def roster_view(request, scheduled_activity_id):
 
     signups = EighthSignup.objects.filter(scheduled_activity=scheduled_activity)
 
-    viewable_members = scheduled_activity.get_viewable_members(request.user)
-    num_hidden_members = len(scheduled_activity.get_hidden_members(request.user))
+    viewable_members, hidden_members = scheduled_activity.get_members_by_visibility(request.user)
+    num_hidden_members = len(hidden_members)
     is_sponsor = scheduled_activity.user_is_sponsor(request.user)
     logger.debug(viewable_members)
     context = {
@@ -237,8 +235,8 @@ def raw_roster_view(request, scheduled_activity_id):
 
     signups = EighthSignup.objects.filter(scheduled_activity=scheduled_activity)
 
-    viewable_members = scheduled_activity.get_viewable_members(request.user)
-    num_hidden_members = len(scheduled_activity.get_hidden_members(request.user))
+    viewable_members, hidden_members = scheduled_activity.get_members_by_visibility(request.user)
+    num_hidden_members = len(hidden_members)
 
     context = {
         "scheduled_activity": scheduled_activity,
@@ -295,7 +293,6 @@ def take_attendance_view(request, scheduled_activity_id):
         if "clear_attendance_bit" in request.POST:
             scheduled_activity.attendance_taken = False
             scheduled_activity.save()
-            invalidate_obj(scheduled_activity)
 
             messages.success(request, "Attendance bit cleared for {}".format(scheduled_activity))
 
@@ -321,32 +318,22 @@ def take_attendance_view(request, scheduled_activity_id):
             present_user_ids.remove(csrf)
 
         absent_signups = (EighthSignup.objects.filter(scheduled_activity=scheduled_activity)
-                                      .exclude(user__in=present_user_ids)).nocache()
-        absent_signups.update(was_absent=True)
-
-        for s in absent_signups:
-            invalidate_obj(s)
+                                      .exclude(user__in=present_user_ids))
+        invalidated_update(absent_signups, was_absent=True)
 
         present_signups = (EighthSignup.objects
                                        .filter(scheduled_activity=scheduled_activity,
-                                               user__in=present_user_ids)).nocache()
-        present_signups.update(was_absent=False)
-
-        for s in present_signups:
-            invalidate_obj(s)
+                                               user__in=present_user_ids))
+        invalidated_update(present_signups, was_absent=False)
 
         passes = (EighthSignup.objects
                               .filter(scheduled_activity=scheduled_activity,
                                       after_deadline=True,
-                                      pass_accepted=False)).nocache()
-        passes.update(was_absent=True)
-
-        for s in passes:
-            invalidate_obj(s)
+                                      pass_accepted=False))
+        invalidated_update(passes, was_absent=True)
 
         scheduled_activity.attendance_taken = True
         scheduled_activity.save()
-        invalidate_obj(scheduled_activity)
 
         messages.success(request, "Attendance updated.")
 
@@ -361,23 +348,25 @@ def take_attendance_view(request, scheduled_activity_id):
                               .select_related("user")
                               .filter(scheduled_activity=scheduled_activity,
                                       after_deadline=True,
-                                      pass_accepted=False)).nocache()
+                                      pass_accepted=False))
 
-        users = scheduled_activity.members.exclude(eighthsignup__in=passes)
+        users = list(scheduled_activity.members.exclude(eighthsignup__in=passes))
         members = []
+        # Versions for the roster's photo links
+        User.prefetch_cache(users + [signup.user for signup in passes], ["photo_versions"])
 
         absent_user_ids = (EighthSignup.objects
                                        .select_related("user")
                                        .filter(scheduled_activity=scheduled_activity,
                                                was_absent=True)
-                                       .values_list("user__id", flat=True)).nocache()
+                                       .values_list("user__id", flat=True))
 
         pass_users = (EighthSignup.objects
                                   .select_related("user")
                                   .filter(scheduled_activity=scheduled_activity,
                                           after_deadline=True,
                                           pass_accepted=True)
-                                  .values_list("user__id", flat=True)).nocache()
+                                  .values_list("user__id", flat=True))
 
         for user in users:
             members.append({
@@ -390,9 +379,9 @@ def take_attendance_view(request, scheduled_activity_id):
                 "pass_present": (not scheduled_activity.attendance_taken and
                                  user.id in pass_users and
                                  user.id not in absent_user_ids),
-                "email": user.tj_email
+                "email": user.tj_email,
+                "user": user
             })
-            invalidate_obj(user)
 
         members.sort(key=lambda m: m["name"])
 
@@ -525,14 +514,10 @@ def accept_all_passes_view(request, scheduled_activity_id):
             "reason": "You do not have permission to take accept these passes."
         }, status=403)
 
-    EighthSignup.objects.filter(
-        after_deadline=True,
-        scheduled_activity=scheduled_activity
-    ).update(
-        pass_accepted=True,
-        was_absent=False
-    )
-    invalidate_obj(scheduled_activity)
+    invalidated_update(EighthSignup.objects.filter(after_deadline=True,
+                                                   scheduled_activity=scheduled_activity),
+                       pass_accepted=True,
+                       was_absent=False)
 
     if "admin" in request.path:
         url_name = "eighth_admin_take_attendance"
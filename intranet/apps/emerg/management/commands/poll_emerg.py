@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from intranet.apps.emerg.views import update_emerg
+
+
+class Command(BaseCommand):
+    help = "Periodically fetch the FCPS emergency announcement page and cache the result."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once',
+                            action='store_true',
+                            dest='once',
+                            default=False,
+                            help='Fetch the page once and exit.')
+
+        parser.add_argument('--interval',
+                            type=int,
+                            dest='interval',
+                            default=settings.FCPS_EMERGENCY_POLL_INTERVAL,
+                            help='Seconds between fetches.')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.time()
+            result = update_emerg()
+            if result is None:
+                self.stdout.write("Fetch failed, keeping the cached result.")
+            else:
+                self.stdout.write("Emergency status: {}".format(result["status"]))
+
+            if options["once"]:
+                break
+
+            time.sleep(max(0, options["interval"] - (time.time() - start)))
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
-import datetime
 import logging
+import threading
 import time
 
 from django.conf import settings
@@ -11,12 +11,23 @@ import requests
 
 logger = logging.getLogger(__name__)
 
+EMERG_CACHE_KEY = "emerg:result"
+EMERG_REFRESH_LOCK_KEY = "emerg:refreshing"
+
 
 def check_emerg():
+    """Fetch and parse the FCPS emergency announcement page.
+
+    Raises a ``requests.RequestException`` if the page could not be
+    fetched within ``FCPS_EMERGENCY_TIMEOUT`` seconds.
+
+    """
     status = True
     message = None
 
-    r = requests.get("{}?{}".format(settings.FCPS_EMERGENCY_PAGE, int(time.time())))
+    r = requests.get("{}?{}".format(settings.FCPS_EMERGENCY_PAGE, int(time.time())),
+                     timeout=settings.FCPS_EMERGENCY_TIMEOUT)
+    r.raise_for_status()
     res = r.text
     if not res or len(res) < 1:
         status = False
@@ -43,13 +54,61 @@ def get_emerg_result():
     return {"status": status, "message": message}
 
 
+def update_emerg():
+    """Fetch the emergency information from FCPS and cache it.
+
+    The result is kept for ``FCPS_EMERGENCY_MAX_STALE`` seconds so that
+    it can still be shown if later refreshes fail. If the refresh
+    fails, the previously cached result is left in place.
+
+    Returns:
+        The new result, or ``None`` if it could not be fetched.
+
+    """
+    try:
+        result = get_emerg_result()
+    except requests.RequestException as e:
+        logger.warning("Unable to fetch FCPS emergency info: {}".format(e))
+        return None
+
+    cache.set(EMERG_CACHE_KEY, (result, time.time()), timeout=settings.FCPS_EMERGENCY_MAX_STALE)
+    return result
+
+
+def _locked_update_emerg():
+    """Update the emergency information, then release the lock taken by
+    :func:`refresh_emerg_in_background`."""
+    try:
+        update_emerg()
+    finally:
+        cache.delete(EMERG_REFRESH_LOCK_KEY)
+
+
+def refresh_emerg_in_background():
+    """Start a thread to refresh the emergency information, unless a refresh is already running."""
+    # The lock expires on its own in case the refreshing process dies
+    if cache.add(EMERG_REFRESH_LOCK_KEY, True, timeout=settings.FCPS_EMERGENCY_TIMEOUT * 2):
+        thread = threading.Thread(target=_locked_update_emerg, name="emerg-refresh")
+        thread.daemon = True
+        thread.start()
+
+
 def get_emerg():
-    key = "emerg:{}".format(datetime.datetime.now().date())
-    cached = cache.get(key)
+    """Return the cached FCPS emergency information without waiting for FCPS.
+
+    The information is normally kept up to date by the ``poll_emerg``
+    management command. If the cached result is older than
+    ``CACHE_AGE["emerg"]`` (or missing), it is still returned (or no
+    emergency is reported) and a refresh is started in the background.
+
+    """
+    cached = cache.get(EMERG_CACHE_KEY)
     if cached:
-        logger.debug("Returning emergency info from cache")
-        return cached
-    else:
-        result = get_emerg_result()
-        cache.set(key, result, timeout=settings.CACHE_AGE["emerg"])
+        result, fetched = cached
+        if time.time() - fetched > settings.CACHE_AGE["emerg"]:
+            logger.debug("Emergency info is stale - refreshing in background")
+            refresh_emerg_in_background()
         return result
+
+    refresh_emerg_in_background()
+    return {"status": False, "message": None}
@@ -1,11 +1,102 @@
 # -*- coding: utf-8 -*-
 
-import csv
-
 from django.core.management.base import BaseCommand
 
 from intranet.apps.ionldap.models import LDAPCourse
 from intranet.apps.users.models import User
+from intranet.utils.csv_import import CSVImporter, RowError
+
+COLUMNS = ["StudentID", "Gender", "Grade", "FirstName", "LastName", "MiddleName", "StudentName", "TJUsername",
+           "Nickname", "Birthdate", "Gridcode", "Address", "City", "State", "Zipcode", "CityStateZip",
+           "EthnicCode", "Language", "EnterDate", "LeaveDate", "Track", "Phone", "ScheduleHouse",
+           "HomeroomTeacher", "HomeroomStaffName", "HomeroomName", "CounselorLast", "Counselor", "Locker",
+           "LockerComb", "ADA", "Organization", "Period", "EndPeriod", "Teacher", "TeacherStaffName", "Room",
+           "SectionID", "CourseID", "CourseTitle", "CourseShortTitle", "CourseIDTitle", "CourseTitleId",
+           "TermName", "TermCode", "TeacherAide", "TermOverride", "SectionEnterDate", "SectionLeaveDate",
+           "House", "AuditClass", "MeetDays", "FeeAmount", "FeeCategory", "FeeCode", "FeeDescription",
+           "ParentName1", "Phone1", "Type1", "Extension1", "ParentName2", "Phone2", "Type2", "Extension2",
+           "ParentName3", "Phone3", "Type3", "Extension3", "ParentName4", "Phone4", "Type4", "Extension4"]
+
+
+class ScheduleImporter(CSVImporter):
+
+    """Imports the enrollments of students from a Kosatka-formatted CSV file.
+
+    Each row is one class of one student. Courses that do not exist yet
+    are created from the first row that mentions them.
+
+    """
+
+    has_header = True
+
+    def __init__(self, add=False, **kwargs):
+        super(ScheduleImporter, self).__init__(**kwargs)
+        self.add = add
+
+    def parse_row(self, row):
+        row_dict = dict(zip(COLUMNS, row))
+        username = row_dict.get("TJUsername", "").lower()
+        if not username:
+            raise RowError("Blank username")
+        if not row_dict.get("SectionID"):
+            raise RowError("Blank section ID for {}".format(username))
+        try:
+            int(row_dict.get("Period")), int(row_dict.get("EndPeriod"))
+        except (TypeError, ValueError):
+            raise RowError("Invalid periods for section {}".format(row_dict["SectionID"]))
+        return username, row_dict
+
+    def import_chunk(self, rows):
+        users = {u.username.lower(): u.id
+                 for u in User.objects.nocache().filter(username__in=set(username for _, (username, _) in rows))}
+
+        enrollments = []
+        for line, (username, row_dict) in rows:
+            if username not in users:
+                self.error(line, "User does not exist with username '{}'".format(username))
+                continue
+            enrollments.append((users[username], row_dict))
+
+        if not self.add:
+            self.count("found", len(enrollments))
+            return
+
+        section_ids = set(row_dict["SectionID"] for _, row_dict in enrollments)
+        courses = {c.section_id: c for c in LDAPCourse.objects.filter(section_id__in=section_ids)}
+
+        new_courses = {}
+        for _, row_dict in enrollments:
+            section_id = row_dict["SectionID"]
+            if section_id not in courses and section_id not in new_courses:
+                new_courses[section_id] = LDAPCourse(course_id=row_dict["CourseID"],
+                                                     section_id=section_id,
+                                                     course_title=row_dict["CourseTitle"],
+                                                     course_short_title=row_dict["CourseShortTitle"],
+                                                     teacher_name=row_dict["Teacher"],
+                                                     room_name=row_dict["Room"],
+                                                     term_code=row_dict["TermCode"],
+                                                     period=row_dict["Period"],
+                                                     end_period=row_dict["EndPeriod"])
+        if new_courses:
+            LDAPCourse.objects.bulk_create(new_courses.values())
+            # bulk_create does not set primary keys on PostgreSQL in this version of Django
+            courses.update({c.section_id: c for c in LDAPCourse.objects.filter(section_id__in=new_courses.keys())})
+            self.count("courses created", len(new_courses))
+
+        Enrollment = LDAPCourse.users.through
+        course_ids = set(c.id for c in courses.values())
+        existing = set(Enrollment.objects.filter(ldapcourse_id__in=course_ids)
+                                         .values_list("ldapcourse_id", "user_id"))
+
+        new_enrollments = set()
+        for user_id, row_dict in enrollments:
+            pair = (courses[row_dict["SectionID"]].id, user_id)
+            if pair not in existing:
+                new_enrollments.add(pair)
+
+        Enrollment.objects.bulk_create([Enrollment(ldapcourse_id=course_id, user_id=user_id)
+                                        for course_id, user_id in new_enrollments])
+        self.count("enrollments added", len(new_enrollments))
 
 
 class Command(BaseCommand):
@@ -23,161 +114,14 @@ class Command(BaseCommand):
                             dest='add',
                             default=False,
                             help='Add to database.')
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            dest='chunk_size',
+                            default=1000,
+                            help='Number of rows to import per transaction.')
 
     def handle(self, *args, **options):
+        self.stdout.write("CSV file {}".format(options["csv_file"]))
 
-        csv_file = options["csv_file"]
-        add_db = options["add"]
-
-        print("CSV file", csv_file)
-
-        users_dict = {}
-        users_dict_base = "TJUsername"
-        class_dict_base = "SectionID"
-
-        with open(csv_file, 'r') as csv_open:
-            csv_reader = csv.reader(csv_open)
-            next(csv_reader)  # skip first line
-            class_rows = [
-                "Period",
-                "EndPeriod",
-                "Teacher",
-                "TeacherStaffName",
-                "Room",
-                "SectionID",
-                "CourseID",
-                "CourseTitle",
-                "CourseShortTitle",
-                "CourseIDTitle",
-                "CourseTitleId",
-                "TermName",
-                "TermCode",
-                "TeacherAide",
-                "TermOverride",
-                "SectionEnterDate",
-                "SectionLeaveDate",
-                "MeetDays"
-            ]
-            rows = ["StudentID",
-                    "Gender",
-                    "Grade",
-                    "FirstName",
-                    "LastName",
-                    "MiddleName",
-                    "StudentName",
-                    "TJUsername",
-                    "Nickname",
-                    "Birthdate",
-                    "Gridcode",
-                    "Address",
-                    "City",
-                    "State",
-                    "Zipcode",
-                    "CityStateZip",
-                    "EthnicCode",
-                    "Language",
-                    "EnterDate",
-                    "LeaveDate",
-                    "Track",
-                    "Phone",
-                    "ScheduleHouse",
-                    "HomeroomTeacher",
-                    "HomeroomStaffName",
-                    "HomeroomName",
-                    "CounselorLast",
-                    "Counselor",
-                    "Locker",
-                    "LockerComb",
-                    "ADA",
-                    "Organization",
-                    "Period",
-                    "EndPeriod",
-                    "Teacher",
-                    "TeacherStaffName",
-                    "Room",
-                    "SectionID",
-                    "CourseID",
-                    "CourseTitle",
-                    "CourseShortTitle",
-                    "CourseIDTitle",
-                    "CourseTitleId",
-                    "TermName",
-                    "TermCode",
-                    "TeacherAide",
-                    "TermOverride",
-                    "SectionEnterDate",
-                    "SectionLeaveDate",
-                    "House",
-                    "AuditClass",
-                    "MeetDays",
-                    "FeeAmount",
-                    "FeeCategory",
-                    "FeeCode",
-                    "FeeDescription",
-                    "ParentName1",
-                    "Phone1",
-                    "Type1",
-                    "Extension1",
-                    "ParentName2",
-                    "Phone2",
-                    "Type2",
-                    "Extension2",
-                    "ParentName3",
-                    "Phone3",
-                    "Type3",
-                    "Extension3",
-                    "ParentName4",
-                    "Phone4",
-                    "Type4",
-                    "Extension4"
-                    ]
-            for row in csv_reader:
-                row_dict = {rows[i]: row[i] for i in range(len(row))}
-                class_dict = {i: row_dict[i] for i in class_rows}
-                if row_dict[users_dict_base] not in users_dict:
-                    users_dict[row_dict[users_dict_base]] = {
-                        "user": row_dict,
-                        "classes": {}
-                    }
-                users_dict[row_dict[users_dict_base]]["classes"][class_dict[class_dict_base]] = class_dict
-
-            for student_id in users_dict:
-                user_dict = users_dict[student_id]
-                sid = student_id.lower()
-                if not sid:
-                    print("Blank studentid")
-                    print(user_dict)
-                    continue
-
-                print("User: {}".format(sid))
-
-                try:
-                    user = User.objects.get(username=sid)
-                except User.DoesNotExist:
-                    print("User does not exist with username '{}'".format(sid))
-                    print(user_dict)
-                    continue
-
-                if not add_db:
-                    continue
-
-                for class_id in user_dict["classes"]:
-                    class_obj = user_dict["classes"][class_id]
-                    try:
-                        ldap_course = LDAPCourse.objects.get(course_id=class_obj["CourseID"],
-                                                             section_id=class_obj["SectionID"])
-
-                    except LDAPCourse.DoesNotExist:
-                        ldap_course = LDAPCourse.objects.create(course_id=class_obj["CourseID"],
-                                                                section_id=class_obj["SectionID"],
-                                                                course_title=class_obj["CourseTitle"],
-                                                                course_short_title=class_obj["CourseShortTitle"],
-                                                                teacher_name=class_obj["Teacher"],
-                                                                room_name=class_obj["Room"],
-                                                                term_code=class_obj["TermCode"],
-                                                                period=class_obj["Period"],
-                                                                end_period=class_obj["EndPeriod"]
-                                                                )
-                    ldap_course.users.add(user)
-                    ldap_course.save()
-                    print("{} \t\tadded to\t\t {}".format(user, ldap_course))
+        importer = ScheduleImporter(add=options["add"], stdout=self.stdout, chunk_size=options["chunk_size"])
+        importer.run(options["csv_file"])
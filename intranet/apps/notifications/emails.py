@@ -1,23 +1,26 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from datetime import timedelta
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
 from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import EmailJob
+from ..users.models import User
 
 logger = logging.getLogger(__name__)
 
 
-def email_send(text_template, html_template, data, subject, emails, headers=None):
-    """Send an HTML/Plaintext email with the following fields.
+def email_build(text_template, html_template, data, subject, emails, headers=None):
+    """Render an HTML/Plaintext email without sending it.
 
-    text_template: URL to a Django template for the text email's contents
-    html_template: URL to a Django tempalte for the HTML email's contents
-    data: The context to pass to the templates
-    subject: The subject of the email
-    emails: The addresses to send the email to
-    headers: A dict of additional headers to send to the message
+    Takes the same arguments as email_send. The returned message can be
+    sent later with email_send_many.
 
     """
 
@@ -29,12 +32,59 @@ def email_send(text_template, html_template, data, subject, emails, headers=None
     headers = {} if headers is None else headers
     msg = EmailMultiAlternatives(subject, text_content, settings.EMAIL_FROM, emails, headers=headers)
     msg.attach_alternative(html_content, "text/html")
-    logger.debug("Emailing {} to {}".format(subject, emails))
+
+    return msg
+
+
+def email_send(text_template, html_template, data, subject, emails, headers=None):
+    """Send an HTML/Plaintext email with the following fields.
+
+    text_template: URL to a Django template for the text email's contents
+    html_template: URL to a Django tempalte for the HTML email's contents
+    data: The context to pass to the templates
+    subject: The subject of the email
+    emails: The addresses to send the email to
+    headers: A dict of additional headers to send to the message
+
+    """
+
+    msg = email_build(text_template, html_template, data, subject, emails, headers)
+    logger.debug("Emailing {} to {}".format(msg.subject, emails))
     msg.send()
 
     return msg
 
 
+def email_send_many(messages, batch_size=100, progress=None):
+    """Send many rendered emails over one connection to the mail server.
+
+    messages: An iterable of messages (e.g. from email_build)
+    batch_size: The number of messages to hand to the connection at once
+    progress: An optional function that is called with the number of
+              messages sent so far after each batch
+
+    Returns the number of messages that were sent.
+
+    """
+
+    sent = 0
+    batch = []
+    with get_connection() as connection:
+        for msg in messages:
+            batch.append(msg)
+            if len(batch) >= batch_size:
+                sent += connection.send_messages(batch) or 0
+                batch = []
+                if progress:
+                    progress(sent)
+        if batch:
+            sent += connection.send_messages(batch) or 0
+            if progress:
+                progress(sent)
+
+    return sent
+
+
 def email_send_bcc(text_template, html_template, data, subject, emails, headers=None):
     """Send an HTML/Plaintext email with the following fields.
 
@@ -59,3 +109,113 @@ def email_send_bcc(text_template, html_template, data, subject, emails, headers=
     msg.send()
 
     return msg
+
+
+def email_queue_bcc(text_template, html_template, data, subject, users, batch_size=None):
+    """Render an email once and queue it to be sent to many users by the send_queued_emails
+    command, instead of sending it during the request.
+
+    text_template: URL to a Django template for the text email's contents
+    html_template: URL to a Django tempalte for the HTML email's contents
+    data: The context to pass to the templates
+    subject: The subject of the email
+    users: A QuerySet of users or a list of user IDs to BCC the email to
+    batch_size: The number of recipients per email (EMAIL_QUEUE_BATCH_SIZE
+                by default)
+
+    Returns the number of users the email was queued for.
+
+    """
+
+    batch_size = batch_size or settings.EMAIL_QUEUE_BATCH_SIZE
+    msg = email_build(text_template, html_template, data, subject, [])
+    html_content = msg.alternatives[0][0]
+
+    if hasattr(users, "values_list"):
+        user_ids = list(users.values_list("id", flat=True))
+    else:
+        user_ids = list(users)
+
+    through = EmailJob.recipients.through
+    with transaction.atomic():
+        for i in range(0, len(user_ids), batch_size):
+            job = EmailJob.objects.create(subject=msg.subject, text_content=msg.body, html_content=html_content)
+            through.objects.bulk_create([through(emailjob_id=job.id, user_id=uid) for uid in user_ids[i:i + batch_size]])
+
+    logger.debug("Queued {} to {} users".format(msg.subject, len(user_ids)))
+    return len(user_ids)
+
+
+def send_queued_emails(limit=None):
+    """Send the queued emails that are due.
+
+    Each email is BCCed to its recipients' preferred addresses, which
+    are loaded with one LDAP search per email. An email that can not be
+    sent is retried with exponential backoff, up to
+    EMAIL_QUEUE_MAX_ATTEMPTS times.
+
+    Emails whose worker was stopped while sending them (and so are still
+    marked as sending after EMAIL_QUEUE_CLAIM_TIMEOUT) are queued again.
+    Such an email may be sent twice, but is never lost.
+
+    limit: The maximum number of emails to send
+
+    Returns a tuple of the number of emails sent and failed.
+
+    """
+
+    stale = timezone.now() - timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT)
+    # Jobs claimed before claims were timestamped have no claimed_time
+    requeued = (EmailJob.objects.filter(Q(claimed_time__lt=stale) | Q(claimed_time__isnull=True), status=EmailJob.SENDING)
+                                .update(status=EmailJob.PENDING))
+    if requeued:
+        logger.warning("Requeued {} emails that were never finished sending".format(requeued))
+
+    jobs = (EmailJob.objects.filter(status=EmailJob.PENDING, next_attempt__lte=timezone.now())
+                            .order_by("next_attempt", "id")
+                            .values_list("id", flat=True))
+    job_ids = list(jobs[:limit] if limit else jobs)
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        for job_id in job_ids:
+            # Claim the job so that other workers skip it
+            if not EmailJob.objects.filter(id=job_id, status=EmailJob.PENDING).update(status=EmailJob.SENDING,
+                                                                                      claimed_time=timezone.now()):
+                continue
+            job = EmailJob.objects.get(id=job_id)
+
+            try:
+                users = User.get_users(ids=job.recipients.values_list("id", flat=True), fields=["emails", "user_type"])
+                emails = [u.emails[0] if u.emails else u.tj_email for u in users]
+                emails = [em for em in emails if em]
+
+                msg = EmailMultiAlternatives(job.subject, job.text_content, settings.EMAIL_FROM, [settings.EMAIL_FROM],
+                                             bcc=emails, connection=connection)
+                msg.attach_alternative(job.html_content, "text/html")
+                logger.debug("Emailing {} to {}".format(job.subject, emails))
+                msg.send()
+            except Exception as e:
+                logger.warning("Unable to send queued email {}: {}".format(job, e))
+                # The connection may be broken, so open a new one for the next email
+                connection.close()
+
+                job.attempts += 1
+                job.last_error = str(e)
+                if job.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+                    job.status = EmailJob.FAILED
+                else:
+                    job.status = EmailJob.PENDING
+                    job.next_attempt = timezone.now() + timedelta(minutes=2 ** (job.attempts - 1))
+                job.save()
+                failed += 1
+            else:
+                job.status = EmailJob.SENT
+                job.sent_time = timezone.now()
+                job.save()
+                sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
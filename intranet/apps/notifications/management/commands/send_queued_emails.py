@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from intranet.apps.notifications.emails import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send queued emails (e.g. announcement notifications), retrying ones that failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once',
+                            action='store_true',
+                            dest='once',
+                            default=False,
+                            help='Send the emails that are due and exit.')
+
+        parser.add_argument('--interval',
+                            type=int,
+                            dest='interval',
+                            default=10,
+                            help='Seconds between checks for new emails.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_emails()
+            if sent or failed:
+                self.stdout.write("Sent {} emails, {} failed.".format(sent, failed))
+
+            if options["once"]:
+                break
+
+            time.sleep(options["interval"])
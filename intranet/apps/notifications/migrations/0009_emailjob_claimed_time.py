@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_emailjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailjob',
+            name='claimed_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -4,6 +4,7 @@ import hashlib
 import json
 
 from django.db import models
+from django.utils import timezone
 
 from ..users.models import User
 
@@ -42,3 +43,49 @@ class GCMNotification(models.Model):
         if json_data and "data" in json_data:
             return json_data["data"]
         return {}
+
+
+class EmailJob(models.Model):
+
+    """A rendered email waiting to be sent to a batch of users by the ``send_queued_emails``
+    command.
+
+    Attributes:
+        recipients
+            The users to send the email to (as BCC). Their addresses
+            are looked up when the email is sent.
+        status
+            Whether the email is pending, being sent, sent or has
+            failed too many times.
+        attempts
+            The number of failed attempts to send the email.
+        next_attempt
+            The earliest time at which the email should be (re)sent.
+        claimed_time
+            When a worker started sending the email.
+
+    """
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUSES = ((PENDING, "Pending"),
+                (SENDING, "Sending"),
+                (SENT, "Sent"),
+                (FAILED, "Failed"))
+
+    subject = models.CharField(max_length=250)
+    text_content = models.TextField()
+    html_content = models.TextField()
+    recipients = models.ManyToManyField(User, related_name="+")
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING, db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    claimed_time = models.DateTimeField(null=True, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    sent_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} ({})".format(self.subject, self.status)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+import requests
+
+from .models import GCMNotification, NotificationConfig
+
+logger = logging.getLogger(__name__)
+
+# Per-token errors that mean the token will never work again
+INVALID_TOKEN_ERRORS = ("NotRegistered", "InvalidRegistration", "MismatchSenderId")
+
+# Per-token errors that are worth retrying
+RETRY_TOKEN_ERRORS = ("Unavailable", "InternalServerError")
+
+
+class GCMBatchResult(object):
+
+    """The outcome of sending a message to one batch of registration IDs.
+
+    Attributes:
+        configs
+            The NotificationConfig objects in the batch.
+        multicast_id
+            The multicast ID of the first successful request, or None
+            if no request succeeded.
+        results
+            A dictionary mapping the IDs of the NotificationConfigs to
+            their per-token result from GCM.
+        error
+            A description of why the batch could not be sent, if it
+            could not be.
+
+    """
+
+    def __init__(self, configs):
+        self.configs = configs
+        self.multicast_id = None
+        self.results = {}
+        self.error = None
+
+    @property
+    def num_success(self):
+        return sum(1 for result in self.results.values() if "message_id" in result)
+
+    @property
+    def num_failure(self):
+        return len(self.configs) - self.num_success
+
+
+def gcm_send_batch(configs, data):
+    """Send a message to a batch of devices, retrying failed requests and
+    tokens that GCM reports as temporarily unavailable.
+
+    This only makes HTTP requests, so it can be run in a worker thread.
+
+    Args:
+        configs
+            A list of NotificationConfig objects with GCM tokens (at
+            most GCM_BATCH_SIZE).
+        data
+            The data payload of the message.
+
+    Returns:
+        A :class:`GCMBatchResult`.
+
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "project_id": settings.GCM_PROJECT_ID,
+        "Authorization": "key={}".format(settings.GCM_AUTH_KEY)
+    }
+    batch = GCMBatchResult(configs)
+    pending = list(configs)
+
+    for attempt in range(settings.GCM_MAX_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(2 ** (attempt - 1))
+
+        postdata = {
+            "registration_ids": [nc.gcm_token for nc in pending],
+            "data": data
+        }
+        try:
+            req = requests.post(settings.GCM_SEND_URL, headers=headers, data=json.dumps(postdata),
+                                timeout=settings.GCM_TIMEOUT)
+            if req.status_code >= 500:
+                batch.error = "HTTP {}".format(req.status_code)
+                continue
+            elif req.status_code >= 400:
+                # Bad request or authentication error; retrying will not help
+                batch.error = "HTTP {}: {}".format(req.status_code, req.text)
+                break
+            resp = req.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Sending GCM batch failed (attempt {}): {}".format(attempt + 1, e))
+            batch.error = str(e)
+            continue
+
+        # example output:
+        # {"multicast_id":123456,"success":1,"failure":0,"canonical_ids":0,"results":[{"message_id":"0:142%771acd"}]}
+        batch.error = None
+        if batch.multicast_id is None:
+            batch.multicast_id = resp.get("multicast_id")
+
+        retry = []
+        for nc, result in zip(pending, resp.get("results", [])):
+            batch.results[nc.id] = result
+            if result.get("error") in RETRY_TOKEN_ERRORS:
+                retry.append(nc)
+
+        pending = retry
+        if not pending:
+            break
+
+    return batch
+
+
+def gcm_send(nc_ids, data, user):
+    """Send a push notification to many devices.
+
+    Recipients are resolved with one query and split into batches of
+    GCM_BATCH_SIZE registration IDs, which are sent in parallel. Tokens
+    that GCM reports as invalid are removed, canonical IDs replace the
+    tokens they were returned for, and every batch that was delivered is
+    recorded as a GCMNotification.
+
+    Args:
+        nc_ids
+            A list of IDs of NotificationConfig objects.
+        data
+            The data payload of the message.
+        user
+            The user who is sending the message.
+
+    Returns:
+        A list of :class:`GCMBatchResult` objects.
+
+    """
+    configs = list(NotificationConfig.objects.filter(id__in=list(nc_ids))
+                                             .exclude(gcm_token=None)
+                                             .exclude(gcm_token=""))
+    batches = [configs[i:i + settings.GCM_BATCH_SIZE] for i in range(0, len(configs), settings.GCM_BATCH_SIZE)]
+    if not batches:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(settings.GCM_MAX_WORKERS, len(batches))) as executor:
+        results = list(executor.map(lambda batch: gcm_send_batch(batch, data), batches))
+
+    invalid = []
+    with transaction.atomic():
+        for batch in results:
+            for nc in batch.configs:
+                result = batch.results.get(nc.id, {})
+                if result.get("error") in INVALID_TOKEN_ERRORS:
+                    invalid.append(nc.id)
+                elif result.get("registration_id"):
+                    NotificationConfig.objects.filter(id=nc.id).update(gcm_token=result["registration_id"])
+
+            if batch.multicast_id is None:
+                continue
+
+            n = GCMNotification.objects.create(multicast_id=batch.multicast_id,
+                                               num_success=batch.num_success,
+                                               num_failure=batch.num_failure,
+                                               user=user,
+                                               sent_data=json.dumps({"data": data}))
+            GCMNotification.sent_to.through.objects.bulk_create([
+                GCMNotification.sent_to.through(gcmnotification_id=n.id, notificationconfig_id=nc.id)
+                for nc in batch.configs
+            ])
+
+        if invalid:
+            NotificationConfig.objects.filter(id__in=invalid).update(gcm_token=None)
+            logger.info("Removed {} invalid GCM tokens".format(len(invalid)))
+
+    return results
@@ -10,9 +10,8 @@ from django.http import HttpResponse
 from django.shortcuts import redirect, render
 from django.views.decorators.csrf import csrf_exempt
 
-import requests
-
 from .models import GCMNotification, NotificationConfig
+from .push import gcm_send
 from ..schedule.notifications import chrome_getdata_check
 
 logger = logging.getLogger(__name__)
@@ -135,59 +134,31 @@ def gcm_list_view(request):
 
 
 def gcm_post(nc_users, data, user=None, request=None):
+    """Send a push notification to the devices of the given NotificationConfig IDs.
+
+    Returns:
+        A tuple of a summary dictionary (with "success" and "failure"
+        counts) and a message, or False and an error message if nothing
+        could be delivered.
+
+    """
     if not user:
         user = request.user
 
-    nc_objs = []
-    reg_ids = []
-    fail_ids = []
-    logger.debug(nc_users)
-    for ncid in nc_users:
-        try:
-            nc = NotificationConfig.objects.get(id=ncid)
-        except NotificationConfig.DoesNotExist:
-            continue
-
-        if nc.gcm_token:
-            reg_ids.append(nc.gcm_token)
-            nc_objs.append(nc)
-        else:
-            fail_ids.append(ncid)
-
-    logger.debug(nc_objs)
-    logger.debug(reg_ids)
-    headers = {
-        "Content-Type": "application/json",
-        "project_id": settings.GCM_PROJECT_ID,
-        "Authorization": "key={}".format(settings.GCM_AUTH_KEY)
-    }
-    postdata = {
-        "registration_ids": reg_ids,
-        "data": data
+    results = gcm_send(nc_users, data, user)
+    logger.debug(results)
+
+    delivered = [batch for batch in results if batch.multicast_id is not None]
+    if not delivered:
+        errors = [batch.error for batch in results if batch.error]
+        return False, "; ".join(errors) if errors else "No devices to send to."
+
+    resp = {
+        "multicast_ids": [batch.multicast_id for batch in delivered],
+        "success": sum(batch.num_success for batch in delivered),
+        "failure": sum(batch.num_failure for batch in results)
     }
-    logger.debug(postdata)
-    postjson = json.dumps(postdata)
-    req = requests.post("https://android.googleapis.com/gcm/send", headers=headers, data=postjson)
-    logger.debug(req.text)
-    try:
-        resp = req.json()
-    except ValueError as e:
-        logger.debug(e)
-    # example output:
-    # {"multicast_id":123456,"success":1,"failure":0,"canonical_ids":0,"results":[{"message_id":"0:142%771acd"}]}
-    logger.debug(resp)
-    if "multicast_id" in resp:
-        n = GCMNotification.objects.create(multicast_id=resp["multicast_id"],
-                                           num_success=resp["success"],
-                                           num_failure=resp["failure"],
-                                           user=user,
-                                           sent_data=json.dumps(data))
-        for nc in nc_objs:
-            n.sent_to.add(nc)
-        n.save()
-        logger.debug(n)
-        return resp, req.text
-    return False, req.text
+    return resp, "{} of {} batches delivered".format(len(delivered), len(results))
 
 
 @login_required
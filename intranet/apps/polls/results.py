@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from threading import local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.html import strip_tags
+
+from .models import Answer, Question
+from ..users.models import Grade, UserDirectoryEntry
+
+logger = logging.getLogger(__name__)
+
+GRADES = range(9, 13)
+
+# How long (in seconds) a vote waits for another vote's change to the
+# same tally before giving up and marking the tally as stale
+TALLY_LOCK_WAIT = 0.5
+
+# Totals of a poll's answers grouped by question, choice, clear vote and
+# the voter's graduation year and sex. Each answer of a user who gave n
+# answers to a question has a weight of 1/n (for split approval
+# questions, and so that the weights of a question add up to its number
+# of voters).
+TALLY_SQL = """
+SELECT a.question_id, a.choice_id, a.clear_vote, d.graduation_year, d.sex, COUNT(*), SUM(1.0 / n.answers)
+FROM {answer} a
+JOIN {question} q ON q.id = a.question_id
+JOIN (SELECT question_id, user_id, COUNT(*) AS answers
+      FROM {answer}
+      WHERE question_id IN (SELECT id FROM {question} WHERE poll_id = %s)
+      GROUP BY question_id, user_id) n ON n.question_id = a.question_id AND n.user_id = a.user_id
+LEFT JOIN {directory} d ON d.user_id = a.user_id
+WHERE q.poll_id = %s
+GROUP BY a.question_id, a.choice_id, a.clear_vote, d.graduation_year, d.sex
+"""
+
+
+def _sex(value):
+    """Normalize a gender to "M", "F" or None."""
+    value = (value or "").upper()[:1]
+    return value if value in ("M", "F") else None
+
+
+def _add(tally, key, votes, weight):
+    entry = tally.setdefault(key, [0, 0.0])
+    entry[0] += votes
+    entry[1] += weight
+    if entry[0] == 0:
+        del tally[key]
+
+
+def _keys(poll_id):
+    key = "polls:tally:{}".format(poll_id)
+    return key, key + ":stale", key + ":lock"
+
+
+def _lock(lock_key, wait=0):
+    """Try to take a lock in the cache, waiting up to ``wait`` seconds."""
+    deadline = time.time() + wait
+    while not cache.add(lock_key, True, timeout=settings.CACHE_AGE["poll_tally_lock"]):
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def compute_tally(poll_id):
+    """Count the answers of a poll with a single grouped query.
+
+    Args:
+        poll_id
+            The ID of the poll.
+
+    Returns:
+        A dictionary mapping ``(question ID, choice ID, clear vote,
+        graduation year, sex)`` to a list of the number of answers and
+        the sum of their weights.
+
+    """
+    sql = TALLY_SQL.format(answer=Answer._meta.db_table,
+                           question=Question._meta.db_table,
+                           directory=UserDirectoryEntry._meta.db_table)
+    tally = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [poll_id, poll_id])
+        for question_id, choice_id, clear_vote, year, sex, votes, weight in cursor.fetchall():
+            _add(tally, (question_id, choice_id, bool(clear_vote), year, _sex(sex)), votes, float(weight))
+    return tally
+
+
+def get_tally(poll_id):
+    """Return the tally of a poll (see :func:`compute_tally`), from the cache if possible.
+
+    Cached tallies are kept up to date as answers are added and removed,
+    and are recomputed if an update could not be applied.
+
+    """
+    key, stale_key, lock_key = _keys(poll_id)
+    cached = cache.get_many([key, stale_key])
+    if key in cached and stale_key not in cached:
+        return cached[key]
+
+    if not _lock(lock_key):
+        return compute_tally(poll_id)
+
+    try:
+        cache.delete(stale_key)
+        tally = compute_tally(poll_id)
+        if cache.get(stale_key) is None:
+            cache.set(key, tally, timeout=settings.CACHE_AGE["poll_results"])
+    finally:
+        cache.delete(lock_key)
+    return tally
+
+
+def _user_entries(question_id, answers, year, sex):
+    """Return the tally entries for one user's answers (a list of (choice ID, clear vote)) to a
+    question."""
+    entries = {}
+    for choice_id, clear_vote in answers:
+        _add(entries, (question_id, choice_id, clear_vote, year, sex), 1, 1.0 / len(answers))
+    return entries
+
+
+def _mark_stale(poll_id):
+    cache.set(_keys(poll_id)[1], True, timeout=settings.CACHE_AGE["poll_results"])
+
+
+def _user_answers(question_id, user_id):
+    return list(Answer.objects.filter(question_id=question_id, user_id=user_id).values_list("choice_id", "clear_vote"))
+
+
+def _update_tally(question_id, user_id, before):
+    """Replace one user's contribution to a question in the cached tally of its poll.
+
+    Args:
+        question_id
+            The ID of the question.
+        user_id
+            The ID of the user.
+        before
+            The user's answers to the question (a list of (choice ID,
+            clear vote)) before the change; their current answers are
+            read from the database.
+
+    """
+    poll_id = Question.objects.filter(id=question_id).values_list("poll_id", flat=True).first()
+    if poll_id is None:
+        return
+    key, stale_key, lock_key = _keys(poll_id)
+
+    # The user's other answers change weight, so the user's whole
+    # contribution to the question is replaced
+    after = _user_answers(question_id, user_id)
+
+    demographics = UserDirectoryEntry.objects.filter(user_id=user_id).values_list("graduation_year", "sex").first()
+    year, sex = demographics if demographics else (None, None)
+
+    if not _lock(lock_key, TALLY_LOCK_WAIT):
+        logger.warning("Could not update the results of poll {}; they will be recomputed".format(poll_id))
+        _mark_stale(poll_id)
+        return
+
+    try:
+        tally = cache.get(key)
+        if tally is None:
+            return
+        for entry_key, (votes, weight) in _user_entries(question_id, before, year, _sex(sex)).items():
+            _add(tally, entry_key, -votes, -weight)
+        for entry_key, (votes, weight) in _user_entries(question_id, after, year, _sex(sex)).items():
+            _add(tally, entry_key, votes, weight)
+        if cache.get(stale_key) is None:
+            cache.set(key, tally, timeout=settings.CACHE_AGE["poll_results"])
+        else:
+            cache.delete(key)
+    finally:
+        cache.delete(lock_key)
+
+
+@receiver(post_save, sender=Answer, dispatch_uid="polls_answer_tally_save")
+def update_tally_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        before = _user_answers(instance.question_id, instance.user_id)
+        if (instance.choice_id, instance.clear_vote) in before:
+            before.remove((instance.choice_id, instance.clear_vote))
+        _update_tally(instance.question_id, instance.user_id, before)
+    else:
+        # The previous values of an edited answer are unknown
+        poll_id = Question.objects.filter(id=instance.question_id).values_list("poll_id", flat=True).first()
+        if poll_id is not None:
+            _mark_stale(poll_id)
+
+
+# (question ID, user ID) => the user's answers before the deletion in progress
+_deleting = local()
+
+
+@receiver(pre_delete, sender=Answer, dispatch_uid="polls_answer_tally_pre_delete")
+def record_answers_before_delete(sender, instance, **kwargs):
+    """Records a user's answers to a question before any of them are deleted.
+
+    A queryset delete removes every row before sending ``post_delete``
+    for each of them, so the answers as they were before the delete can
+    only be read here.
+
+    """
+    if not hasattr(_deleting, "answers"):
+        _deleting.answers = {}
+    key = (instance.question_id, instance.user_id)
+    _deleting.answers[key] = _user_answers(*key)
+
+
+@receiver(post_delete, sender=Answer, dispatch_uid="polls_answer_tally_delete")
+def update_tally_on_delete(sender, instance, **kwargs):
+    # The first deleted answer of a user applies the whole delete
+    before = getattr(_deleting, "answers", {}).pop((instance.question_id, instance.user_id), None)
+    if before is not None:
+        _update_tally(instance.question_id, instance.user_id, before)
+
+
+@receiver(post_save, sender=UserDirectoryEntry, dispatch_uid="polls_directory_entry_tally")
+def invalidate_tallies_on_directory_change(sender, instance, update_fields=None, **kwargs):
+    """Marks the tallies of the polls a user voted in as stale when the user's graduation year or
+    sex may have changed, since their answers are counted under the old values."""
+    if update_fields is not None and not {"graduation_year", "sex"} & set(update_fields):
+        return
+    poll_ids = Question.objects.filter(answer__user_id=instance.user_id).values_list("poll_id", flat=True).distinct()
+    for poll_id in poll_ids:
+        _mark_stale(poll_id)
+
+
+def fmt(num):
+    return round(num, 2)
+
+
+def perc(num, den):
+    if den == 0:
+        return 0
+    return int(10000 * num / den) / 100
+
+
+def _breakdown(entries, measure):
+    """Sum tally entries in total and for each grade, split by sex.
+
+    Args:
+        entries
+            A list of ``((graduation year, sex), (votes, weight))``.
+        measure
+            "votes" to count answers, "split" to count answers but sum
+            the weights by sex (for split approval), or "users" to count
+            voters.
+
+    Returns:
+        A dictionary mapping "total" and each grade to a dictionary of
+        "all", "male" and "female".
+
+    """
+    groups = ["total"] + list(GRADES)
+    result = {group: {"all": 0, "male": 0, "female": 0} for group in groups}
+    for (year, sex), (votes, weight) in entries:
+        value_all = weight if measure == "users" else votes
+        value_sex = votes if measure == "votes" else weight
+
+        grade = Grade.grade_from_year(year) if year else None
+        for group in ("total", grade) if grade in GRADES else ("total",):
+            result[group]["all"] += value_all
+            if sex == "M":
+                result[group]["male"] += value_sex
+            elif sex == "F":
+                result[group]["female"] += value_sex
+
+    for values in result.values():
+        if measure == "users":
+            values.update({name: int(round(value)) for name, value in values.items()})
+        elif measure == "split":
+            values.update(male=fmt(values["male"]), female=fmt(values["female"]))
+    return result
+
+
+def get_poll_results(poll):
+    """Build the results of a poll for the results page.
+
+    Returns:
+        A list with a dictionary for each question. Choice questions
+        have a list of "choices" (with the votes for each choice broken
+        down by grade and sex, followed by the clear votes and the
+        totals); writing questions have the "answers".
+
+    """
+    tally = get_tally(poll.id)
+
+    # question ID => choice ID (or "clear") => list of users
+    selections = {}
+    # question ID => user ID => number of answers
+    answer_counts = {}
+    choice_types = [Question.STD, Question.ELECTION, Question.APP, Question.SPLIT_APP]
+    for answer in Answer.objects.filter(question__poll=poll, question__type__in=choice_types).select_related("user"):
+        choice = "clear" if answer.clear_vote else answer.choice_id
+        selections.setdefault(answer.question_id, {}).setdefault(choice, []).append(answer.user)
+        counts = answer_counts.setdefault(answer.question_id, {})
+        counts[answer.user_id] = counts.get(answer.user_id, 0) + 1
+
+    questions = []
+    for q in poll.question_set.all():
+        if q.is_writing():
+            questions.append({
+                "question": q,
+                "answers": Answer.objects.filter(question=q).select_related("user")
+            })
+            continue
+        elif not q.is_choice():
+            continue
+
+        # choice ID (or "clear") => list of ((graduation year, sex), (votes, weight))
+        entries = {}
+        for (question_id, choice_id, clear_vote, year, sex), value in tally.items():
+            if question_id == q.id:
+                entries.setdefault("clear" if clear_vote else choice_id, []).append(((year, sex), value))
+        all_entries = [entry for choice_entries in entries.values() for entry in choice_entries]
+        users = _breakdown(all_entries, "users")
+        num_users = users["total"]["all"]
+        num_votes = sum(votes for _, (votes, _) in all_entries)
+        question_selections = selections.get(q.id, {})
+
+        split = q.type == Question.SPLIT_APP
+        choices = []
+        for c, choice_id in [(c, c.id) for c in q.choice_set.all().order_by("num")] + [("Clear vote", "clear")]:
+            votes = _breakdown(entries.get(choice_id, []), "split" if split else "votes")
+            votes["total"]["all_percent"] = perc(votes["total"]["all"], num_users if split else num_votes)
+            choices.append({
+                "choice": c,
+                "votes": votes,
+                "users": question_selections.get(choice_id, [])
+            })
+
+        users["total"]["all_percent"] = perc(num_users, num_users)
+        if split:
+            users["total"]["votes_all"] = num_votes
+        else:
+            users["total"].update(all=num_votes, users_all=num_users, all_percent=perc(num_votes, num_users))
+        choices.append({
+            "choice": "Total",
+            "votes": users
+        })
+
+        question = {
+            "question": q,
+            "choices": choices
+        }
+        if split:
+            question["user_scale"] = {user_id: 1 / n for user_id, n in answer_counts.get(q.id, {}).items()}
+        questions.append(question)
+
+    return questions
+
+
+def results_csv_rows(poll):
+    """Generate the rows of a CSV export of every answer to a poll, starting with the header.
+
+    Answers are read with a server-side iterator, so the export does
+    not hold all of them in memory.
+
+    """
+    yield ["Question", "Question Text", "Choice", "Choice Text", "Answer", "Clear Vote", "Weight",
+           "User ID", "Username", "Graduation Year", "Sex"]
+
+    answer_counts = {(question_id, user_id): n for question_id, user_id, n in
+                     (Answer.objects.filter(question__poll=poll)
+                                    .values_list("question_id", "user_id")
+                                    .annotate(n=Count("id"))
+                                    .order_by())}
+
+    answers = (Answer.objects.filter(question__poll=poll)
+                             .order_by("question__num", "choice__num", "user_id")
+                             .values_list("question_id", "question__num", "question__question", "choice__num", "choice__info",
+                                          "answer", "clear_vote", "user_id", "user__username",
+                                          "user__directory_entry__graduation_year", "user__directory_entry__sex"))
+    for (question_id, question_num, question, choice_num, choice, text, clear_vote, user_id, username,
+         year, sex) in answers.iterator():
+        yield [question_num, strip_tags(question), choice_num, strip_tags(choice or ""), text or "", clear_vote,
+               round(1 / answer_counts[(question_id, user_id)], 3), user_id, username, year, _sex(sex)]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+
+from .models import Answer, Choice, Poll, Question
+from .results import compute_tally, get_tally
+from ..users.models import User
+from ...test.ion_test import IonTestCase
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PollResultsTest(IonTestCase):
+    """Tests the cached poll tallies."""
+
+    def assertTallyCurrent(self, poll):
+        def rounded(tally):
+            return {key: (votes, round(weight, 6)) for key, (votes, weight) in tally.items()}
+
+        self.assertEqual(rounded(get_tally(poll.id)), rounded(compute_tally(poll.id)))
+
+    def test_incremental_tally(self):
+        cache.clear()
+        user1 = User.objects.create(username="user1")
+        user2 = User.objects.create(username="user2")
+        poll = Poll.objects.create(title="Test Poll", description="", start_time=timezone.now(), end_time=timezone.now())
+        question = Question.objects.create(poll=poll, question="Test Question", num=1, type=Question.SPLIT_APP, max_choices=3)
+        choices = [Choice.objects.create(question=question, num=num, info=str(num)) for num in range(1, 4)]
+
+        # Load the tally into the cache so the answers below update it
+        self.assertEqual(get_tally(poll.id), {})
+
+        for choice in choices:
+            Answer.objects.create(user=user1, question=question, choice=choice)
+        Answer.objects.create(user=user2, question=question, choice=choices[0])
+        self.assertTallyCurrent(poll)
+
+        # A queryset delete removes every row before post_delete is sent
+        Answer.objects.filter(user=user1, question=question).delete()
+        Answer.objects.create(user=user1, question=question, clear_vote=True)
+        self.assertTallyCurrent(poll)
+
+        Answer.objects.filter(user=user2, question=question, choice=choices[0]).delete()
+        self.assertTallyCurrent(poll)
+        self.assertEqual(sum(weight for _, weight in get_tally(poll.id).values()), 1)
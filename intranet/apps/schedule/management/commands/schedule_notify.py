@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 import json
+import time
+from datetime import datetime, timedelta
 
 from django.core.management.base import BaseCommand
 
 from intranet.apps.notifications.views import gcm_post, get_gcm_schedule_uids
-from intranet.apps.schedule.notifications import period_start_end_data
+from intranet.apps.schedule.notifications import day_transitions, period_start_end_data
 from intranet.apps.users.models import User
 
+# Notifications that are this late (e.g. after the process was restarted) are skipped
+MAX_LATENESS = timedelta(minutes=1)
+
+# Longest single sleep, so that changes to the system clock are noticed
+MAX_SLEEP = 60
+
 
 class Command(BaseCommand):
     help = "Send Google Cloud Messaging notifications at needed times at the beginning and end of a class period."
@@ -18,14 +26,58 @@ class Command(BaseCommand):
                             default=False,
                             help='notify')
 
-    def do_notify(self, pd_data):
-        users = get_gcm_schedule_uids()
-        user = User.objects.get(id=9999)
+        parser.add_argument('--daemon',
+                            action='store_true',
+                            dest='daemon',
+                            default=False,
+                            help='Keep running and send each notification at the time a period starts or ends, '
+                                 'instead of checking the current minute once.')
+
+    def do_notify(self, pd_data, users=None, user=None):
+        if users is None:
+            users = get_gcm_schedule_uids()
+        if user is None:
+            user = User.objects.get(id=9999)
         post, reqtext = gcm_post(users, pd_data, user=user)
+        return post, reqtext
+
+    def run_day(self, date, notify):
+        """Send the notifications for one day, returning after the last one."""
+        transitions = [(when, data) for when, data in day_transitions(date) if when + MAX_LATENESS >= datetime.now()]
+        self.stdout.write("{}: {} notifications scheduled".format(date, len(transitions)))
+        if not transitions:
+            return
+
+        # The recipients and sender are loaded once per day
+        users = list(get_gcm_schedule_uids())
+        user = User.objects.get(id=9999)
+
+        for when, pd_data in transitions:
+            remaining = (when - datetime.now()).total_seconds()
+            while remaining > 0:
+                time.sleep(min(MAX_SLEEP, remaining))
+                remaining = (when - datetime.now()).total_seconds()
+
+            self.stdout.write("{}: {}".format(when, json.dumps(pd_data)))
+            if notify:
+                post, reqtext = self.do_notify(pd_data, users, user)
+                if not post:
+                    self.stdout.write("Failed: {}".format(reqtext))
 
     def handle(self, *args, **options):
 
         notify = options["notify"]
+
+        if options["daemon"]:
+            while True:
+                today = datetime.now().date()
+                self.run_day(today, notify)
+
+                # Wait for the next day
+                while datetime.now().date() == today:
+                    tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time())
+                    time.sleep(max(1, min(MAX_SLEEP, (tomorrow - datetime.now()).total_seconds())))
+
         pd_data = period_start_end_data(None)
         if pd_data:
             self.stdout.write(json.dumps(pd_data))
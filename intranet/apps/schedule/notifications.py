@@ -3,6 +3,7 @@
 import datetime
 import logging
 
+from .models import Day
 from .views import schedule_context
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,11 @@ def period_start_end_data(request):
     blocks = ctx["sched_ctx"]["blocks"]
     point, block = at_period_point(blocks)
     logger.debug((point, block))
+    return period_point_data(point, block)
+
+
+def period_point_data(point, block):
+    """Returns the notification data for the start (point 1) or end (point 2) of a block."""
     if point == 1:
         return {
             "title": "{} has started".format(block.name),
@@ -41,3 +47,34 @@ def at_period_point(blocks):
         elif now == b.end.date_obj(now):
             return (2, b)
     return (0, None)
+
+
+def day_transitions(date):
+    """Returns the times on a day at which a block starts or ends, along with
+    the notification data for each.
+
+    If a block ends when another starts, only the notification for the
+    earlier block is included, as in :func:`at_period_point`.
+
+    Args:
+        date
+            A date object.
+
+    Returns:
+        A list of (datetime, notification data) tuples ordered by time.
+
+    """
+    day = Day.objects.select_related("day_type").filter(date=date).first()
+    if day is None:
+        return []
+
+    blocks = day.day_type.blocks.select_related("start", "end").order_by("start__hour", "start__minute")
+
+    transitions = {}
+    for b in blocks:
+        for point, block_time in ((1, b.start), (2, b.end)):
+            when = block_time.date_obj(date)
+            if when not in transitions:
+                transitions[when] = period_point_data(point, b)
+
+    return sorted(transitions.items())
@@ -19,6 +19,10 @@ from ..users.views import profile_view
 
 logger = logging.getLogger(__name__)
 
+# Attributes displayed for each user on the search results page
+SEARCH_RESULT_ATTRIBUTES = ["ion_id", "user_type", "common_name", "first_name", "last_name",
+                            "nickname", "student_id", "graduation_year"]
+
 
 def do_ldap_query(q, admin=False):
     c = LDAPConnection()
@@ -236,12 +240,12 @@ def do_ldap_query(q, admin=False):
             result_dns = new_dns
             i += 1
 
-    # loop through the DNs saved and get actual user objects
-    users = []
-    for dn in result_dns:
-        user = User.get_user(dn=dn)
-        users.append(user)
-
+    # get actual user objects for all of the DNs saved at once, along
+    # with the attributes shown on the search results page and the
+    # permissions that decide which of them are visible
+    users = User.get_users(dns=result_dns, fields=SEARCH_RESULT_ATTRIBUTES)
+    User.preload_permissions(users)
+    User.prefetch_cache(users, ["grade"])
     return users
 
 
@@ -2,8 +2,11 @@
 
 from django.contrib import admin
 
-from ..users.models import User
+from ..users.models import ClassIndexEntry, DirectorySync, User, UserDirectoryEntry
 
 admin.site.register([
     User,
+    UserDirectoryEntry,
+    DirectorySync,
+    ClassIndexEntry,
 ])
@@ -33,6 +33,7 @@ class ProfileDetail(generics.RetrieveAPIView):
         else:
             user = request.user
 
+        user.preload()
         serializer = self.get_serializer(user)
         data = serializer.data
         return Response(data)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from intranet.apps.users.models import Grade, User
+from intranet.apps.users.photos import get_photo
+
+
+class Command(BaseCommand):
+    help = "Generate the sized copies of every student's photos ahead of time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year',
+                            dest='year',
+                            choices=Grade.names,
+                            default=None,
+                            help='Only process photos from this year.')
+
+    def handle(self, *args, **options):
+        years = [options["year"]] if options["year"] else Grade.names
+        sizes = [size for size, box in settings.PHOTO_SIZES.items() if box is not None]
+
+        students = User.objects.get_students()
+        total = len(students)
+        photos = 0
+        for i, user in enumerate(students, 1):
+            for year in years:
+                data = user._load_photo_binary(year)
+                if data:
+                    for size in sizes:
+                        get_photo(data, size)
+                    photos += 1
+
+            if i % 100 == 0:
+                self.stdout.write("{}/{} users processed".format(i, total))
+
+        self.stdout.write("Done: {} photos of {} users processed.".format(photos, total))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from cacheops import invalidate_model
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from intranet.apps.users.models import ClassIndexEntry
+from intranet.db.ldap_db import LDAPConnection
+
+
+class Command(BaseCommand):
+    help = "Rebuild the local class index from the tjhsstClass entries in LDAP."
+
+    def handle(self, *args, **options):
+        c = LDAPConnection()
+        results = c.paged_search(settings.CLASS_DN, "(objectClass=tjhsstClass)", ClassIndexEntry.LDAP_ATTRIBUTES)
+        self.stdout.write("{} LDAP entries found".format(len(results)))
+
+        sections = {}
+        for row in results:
+            attrs = row.get("attributes")
+            if attrs and attrs.get("tjhsstSectionId"):
+                sections[attrs["tjhsstSectionId"][0]] = (row["dn"], attrs)
+
+        with transaction.atomic():
+            existing = ClassIndexEntry.objects.nocache().select_for_update().in_bulk(list(sections.keys()))
+
+            new_entries = []
+            updated = 0
+            for section_id, (dn, attrs) in sections.items():
+                entry = existing.get(section_id)
+                if entry is None:
+                    entry = ClassIndexEntry(section_id=section_id)
+                    entry.update_from_ldap(dn, attrs)
+                    new_entries.append(entry)
+                elif entry.update_from_ldap(dn, attrs):
+                    entry.save()
+                    updated += 1
+
+            ClassIndexEntry.objects.bulk_create(new_entries)
+
+            stale = ClassIndexEntry.objects.nocache().exclude(section_id__in=list(sections.keys()))
+            removed = stale.count()
+            stale.delete()
+
+        invalidate_model(ClassIndexEntry)
+
+        self.stdout.write("Done: {} added, {} updated, {} removed.".format(len(new_entries), updated, removed))
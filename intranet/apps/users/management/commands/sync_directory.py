@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from cacheops import invalidate_model
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from intranet.apps.users.models import DirectorySync, User, UserDirectoryEntry
+from intranet.db.ldap_db import LDAPConnection
+
+
+class Command(BaseCommand):
+    help = "Update the local user directory from LDAP entries that changed since the last sync."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full',
+                            action='store_true',
+                            dest='full',
+                            default=False,
+                            help='Sync every user, and remove entries for users no longer in LDAP.')
+
+        parser.add_argument('--chunk-size',
+                            type=int,
+                            dest='chunk_size',
+                            default=500,
+                            help='Number of users to write per transaction.')
+
+    def handle(self, *args, **options):
+        last_sync = None
+        if not options["full"]:
+            last_sync = UserDirectoryEntry.objects.nocache().aggregate(Max("modify_timestamp"))["modify_timestamp__max"]
+
+        if last_sync:
+            # Entries modified in the same second as the last sync may not have been seen yet
+            since = last_sync - timedelta(seconds=1)
+            query = "(&(iodineUidNumber=*)(modifyTimestamp>={:%Y%m%d%H%M%S}Z))".format(since)
+            self.stdout.write("Syncing users modified since {}".format(since))
+        else:
+            query = "(iodineUidNumber=*)"
+            self.stdout.write("Syncing all users")
+
+        c = LDAPConnection()
+        results = c.paged_search(settings.USER_DN, query, UserDirectoryEntry.LDAP_ATTRIBUTES)
+        self.stdout.write("{} LDAP entries found".format(len(results)))
+
+        entries = {}
+        for row in results:
+            attrs = row.get("attributes")
+            if attrs and attrs.get("iodineUidNumber") and attrs.get("iodineUid"):
+                entries[int(attrs["iodineUidNumber"][0])] = attrs
+
+        ids = sorted(entries.keys())
+        created = updated = 0
+        for i in range(0, len(ids), options["chunk_size"]):
+            chunk = ids[i:i + options["chunk_size"]]
+            chunk_created, chunk_updated = self.sync_chunk(chunk, entries)
+            created += chunk_created
+            updated += chunk_updated
+            self.stdout.write("{}/{} users processed".format(i + len(chunk), len(ids)))
+
+        removed = 0
+        if options["full"]:
+            stale = UserDirectoryEntry.objects.nocache().exclude(user_id__in=ids)
+            removed = stale.count()
+            stale.delete()
+
+        invalidate_model(UserDirectoryEntry)
+
+        # Lookups only switch to the mirror once it has been completely filled
+        DirectorySync.objects.create(full=not last_sync)
+
+        self.stdout.write("Done: {} added, {} updated, {} removed.".format(created, updated, removed))
+
+    def sync_chunk(self, ids, entries):
+        """Write the directory entries of a chunk of users in one transaction.
+
+        Returns:
+            A tuple of the number of entries added and updated.
+
+        """
+        with transaction.atomic():
+            users = User.objects.nocache().in_bulk(ids)
+            missing = [uid for uid in ids if uid not in users]
+            if missing:
+                users.update(User._create_users_from_ldap([(uid, entries[uid]["iodineUid"][0]) for uid in missing]))
+
+            existing = UserDirectoryEntry.objects.nocache().select_for_update().in_bulk(ids)
+
+            new_entries = []
+            updated = 0
+            for uid in ids:
+                entry = existing.get(uid)
+                if entry is None:
+                    entry = UserDirectoryEntry(user=users[uid])
+                    entry.update_from_ldap(entries[uid])
+                    new_entries.append(entry)
+                elif entry.update_from_ldap(entries[uid]):
+                    entry.save()
+                    updated += 1
+
+            UserDirectoryEntry.objects.bulk_create(new_entries)
+
+        return len(new_entries), updated
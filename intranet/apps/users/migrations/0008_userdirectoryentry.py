@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_receive_schedule_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDirectoryEntry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='directory_entry', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('common_name', models.CharField(max_length=255, null=True)),
+                ('first_name', models.CharField(db_index=True, max_length=100, null=True)),
+                ('last_name', models.CharField(db_index=True, max_length=100, null=True)),
+                ('nickname', models.CharField(max_length=100, null=True)),
+                ('graduation_year', models.IntegerField(db_index=True, null=True)),
+                ('user_type', models.CharField(db_index=True, max_length=100, null=True)),
+                ('student_id', models.CharField(db_index=True, max_length=20, null=True)),
+                ('counselor', models.IntegerField(null=True)),
+                ('emails', models.TextField(blank=True, default='')),
+                ('birthday', models.DateField(db_index=True, null=True)),
+                ('modify_timestamp', models.DateTimeField(db_index=True, null=True)),
+                ('last_synced', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_userdirectoryentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassIndexEntry',
+            fields=[
+                ('section_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('dn', models.CharField(max_length=255)),
+                ('class_id', models.CharField(db_index=True, max_length=100, null=True)),
+                ('name', models.CharField(max_length=255, null=True)),
+                ('periods', models.CharField(blank=True, default='', max_length=50)),
+                ('quarters', models.CharField(blank=True, default='', max_length=50)),
+                ('room_number', models.CharField(db_index=True, max_length=50, null=True)),
+                ('course_length', models.CharField(max_length=50, null=True)),
+                ('teacher_dn', models.CharField(db_index=True, max_length=255, null=True)),
+                ('sort_value', models.FloatField(db_index=True, null=True)),
+                ('last_synced', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['sort_value'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_classindexentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdirectoryentry',
+            name='sex',
+            field=models.CharField(db_index=True, max_length=10, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_userdirectoryentry_sex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full', models.BooleanField(default=False)),
+                ('completed_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
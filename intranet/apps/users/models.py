@@ -4,17 +4,20 @@ import hashlib
 import logging
 import os
 from base64 import b64encode
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, time
+from functools import lru_cache
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, UserManager as DjangoUserManager
 from django.core import exceptions
-from django.core.cache import cache
 from django.core.signing import Signer
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 
 from intranet.db.ldap_db import LDAPConnection, LDAPFilter
 from intranet.middleware import threadlocals
+from intranet.utils.request_cache import request_cache as cache
 
 import ldap3
 import ldap3.utils.dn
@@ -24,6 +27,27 @@ from ..groups.models import Group
 logger = logging.getLogger(__name__)
 
 
+# Whether the local directory mirror has been populated, once it is known
+_directory_synced = []
+
+
+def directory_is_synced():
+    """Returns whether user lookups can use the local directory mirror (see
+    :class:`UserDirectoryEntry`) instead of LDAP.
+
+    This is the USE_DIRECTORY_MIRROR setting, or if it is None, whether
+    a sync of every user has ever completed (see :class:`DirectorySync`).
+    A table left partly filled by an interrupted sync is not used. Once
+    a completed sync has been seen, this process stops checking.
+
+    """
+    if settings.USE_DIRECTORY_MIRROR is not None:
+        return settings.USE_DIRECTORY_MIRROR
+    if not _directory_synced and DirectorySync.objects.filter(full=True).exists():
+        _directory_synced.append(True)
+    return bool(_directory_synced)
+
+
 class UserManager(DjangoUserManager):
 
     """User model Manager for table-level User queries.
@@ -60,17 +84,16 @@ class UserManager(DjangoUserManager):
 
     def users_in_year(self, year):
         """Get a list of users in a specific graduation year."""
+        if directory_is_synced():
+            return list(User.objects.filter(directory_entry__graduation_year=year).select_related("directory_entry"))
+
         c = LDAPConnection()
 
         results = c.search(settings.USER_DN,
                            "graduationYear={}".format(year),
                            ["dn"])
 
-        users = []
-        for user in results:
-            users.append(User.get_user(dn=user["dn"]))
-
-        return users
+        return User.get_users(dns=[user["dn"] for user in results])
 
     def _ldap_and_string(self, opts):
         """Combine LDAP queries with AND.
@@ -116,6 +139,12 @@ class UserManager(DjangoUserManager):
 
     def users_with_birthday(self, month, day):
         """Return a list of user objects who have a birthday on a given date."""
+        if directory_is_synced():
+            users = list(User.objects.filter(directory_entry__birthday__month=int(month),
+                                             directory_entry__birthday__day=int(day)).select_related("directory_entry"))
+            User.preload_permissions(users)
+            return [u for u in users if u.attribute_is_visible("showbirthday")]
+
         c = LDAPConnection()
 
         month = int(month)
@@ -132,8 +161,9 @@ class UserManager(DjangoUserManager):
                            ["dn"])
 
         users = []
-        for res in results:
-            u = User.get_user(dn=res["dn"])
+        found = User.get_users(dns=[res["dn"] for res in results])
+        User.preload_permissions(found)
+        for u in found:
             if u.attribute_is_visible("showbirthday"):
                 users.append(u)
 
@@ -182,6 +212,13 @@ class UserManager(DjangoUserManager):
 
         """
         teachers = self.get_teachers()
+        if directory_is_synced():
+            return (teachers.filter(directory_entry__first_name__isnull=False,
+                                    directory_entry__last_name__regex=r"^..")
+                            .exclude(id__in=[8888, 7011])
+                            .select_related("directory_entry")
+                            .order_by("directory_entry__last_name", "directory_entry__first_name"))
+
         teachers = [(u.last_name, u.first_name, u.id) for u in teachers]
         for t in teachers:
             if t is None or t[0] is None or t[1] is None or t[2] is None:
@@ -310,6 +347,202 @@ class User(AbstractBaseUser, PermissionsMixin):
 
         return user
 
+    @classmethod
+    def get_users(cls, dns=None, ids=None, fields=None, chunk_size=200):
+        """Retrieve many user objects at once and save them to the SQL database if necessary.
+
+        This is the bulk version of :meth:`get_user`. Instead of running
+        a SQL query and several LDAP searches for each user, the users
+        are resolved with one LDAP search per chunk of users and one SQL
+        query, and users that are not yet in the SQL database are added
+        with a single bulk insert.
+
+        Args:
+            dns
+                A list of full LDAP Distinguished Names of users.
+            ids
+                A list of user IDs.
+            fields
+                An optional list of simple attribute names (keys of
+                ``User.ldap_user_attributes``) to fetch in the same LDAP
+                search and cache, as with :meth:`preload`.
+            chunk_size
+                The maximum number of users to include in a single search.
+
+        Returns:
+            A list of User objects in the same order as the given DNs
+            or IDs. Users that could not be found are left out.
+
+        """
+        if (dns is None) == (ids is None):
+            raise TypeError("get_users() requires exactly one of dns or ids.")
+
+        fields = list(fields or [])
+        for name in fields:
+            if name not in User.ldap_user_attributes:
+                raise AttributeError("'User' has no attribute '{}'".format(name))
+        ldap_names = set(["iodineUid", "iodineUidNumber"])
+        ldap_names |= set(User.ldap_user_attributes[name]["ldap_name"] for name in fields)
+
+        if dns is not None:
+            dns = list(dns)
+            usernames = []
+            for dn in dns:
+                try:
+                    usernames.append(User.username_from_dn(dn))
+                except (ldap3.LDAPExceptionError, IndexError):
+                    logger.warning("Invalid user DN " + dn)
+            search_attribute = "iodineUid"
+            search_values = usernames
+            # Fetched once the IDs are known from LDAP
+            sql_users = None
+        else:
+            ids = [int(i) for i in ids]
+            sql_users = User.objects.select_related("directory_entry").in_bulk(ids)
+            search_attribute = "iodineUidNumber"
+            if fields:
+                search_values = [str(i) for i in ids]
+            else:
+                search_values = [str(i) for i in ids if i not in sql_users]
+
+        # ion_id => (dn, username, attributes)
+        ldap_users = OrderedDict()
+        if search_values:
+            c = LDAPConnection()
+            search_values = sorted(set(search_values))
+            results = []
+            # Searching in chunks keeps each filter and its results under
+            # the server's filter length and size limits
+            for i in range(0, len(search_values), chunk_size):
+                query = LDAPFilter.attribute_in_list(search_attribute,
+                                                     [LDAPFilter.escape(v) for v in search_values[i:i + chunk_size]])
+                results.extend(c.search(settings.USER_DN, query, sorted(ldap_names)))
+            ldap_users = User._parse_ldap_users(results, fields)
+
+        sql_users = User._sql_users_for_ldap_users(ldap_users, sql_users)
+
+        if dns is not None:
+            order = {}
+            for uid, (dn, username, _) in ldap_users.items():
+                order[username.lower()] = uid
+            users = []
+            for username in usernames:
+                uid = order.get(username.lower())
+                if uid in sql_users:
+                    users.append(sql_users[uid])
+            return users
+        else:
+            return [sql_users[uid] for uid in ids if uid in sql_users]
+
+    @staticmethod
+    def users_from_ldap_results(results, fields=None):
+        """Create user objects directly from the results of an LDAP search.
+
+        This lets callers that already search for users (e.g. by class
+        enrollment) fetch the attributes they need in the same search
+        instead of resolving each DN afterwards. The search must include
+        the ``iodineUid`` and ``iodineUidNumber`` attributes, along with
+        the LDAP names of ``fields``.
+
+        Args:
+            results
+                The results of an LDAP search of user entries.
+            fields
+                An optional list of simple attribute names (keys of
+                ``User.ldap_user_attributes``) included in the search
+                to cache, as with :meth:`get_users`.
+
+        Returns:
+            A list of User objects in the same order as the results.
+
+        """
+        ldap_users = User._parse_ldap_users(results, fields)
+        sql_users = User._sql_users_for_ldap_users(ldap_users)
+        return [sql_users[uid] for uid in ldap_users if uid in sql_users]
+
+    @staticmethod
+    def _parse_ldap_users(results, fields=None):
+        """Extract users from LDAP search results and cache their attributes and DNs.
+
+        Returns:
+            An ordered dictionary mapping IDs to ``(dn, username, attributes)`` tuples.
+
+        """
+        ldap_users = OrderedDict()
+        for row in results:
+            attrs = row.get("attributes")
+            if not attrs or not attrs.get("iodineUidNumber") or not attrs.get("iodineUid"):
+                continue
+            ldap_users[int(attrs["iodineUidNumber"][0])] = (row["dn"], attrs["iodineUid"][0], attrs)
+
+        if fields:
+            User.cache_ldap_attributes([(dn, attrs) for dn, _, attrs in ldap_users.values()], fields)
+        cache.set_many({":".join([str(uid), "dn"]): entry[0] for uid, entry in ldap_users.items()},
+                       timeout=settings.CACHE_AGE["dn_id_mapping"])
+
+        return ldap_users
+
+    @staticmethod
+    def _sql_users_for_ldap_users(ldap_users, sql_users=None):
+        """Fetch (or add) the SQL users matching parsed LDAP users.
+
+        Args:
+            ldap_users
+                A dictionary from :meth:`_parse_ldap_users`.
+            sql_users
+                A dictionary of users that were already fetched by ID.
+
+        Returns:
+            A dictionary mapping IDs to User objects, with their DNs set.
+
+        """
+        if sql_users is None:
+            sql_users = User.objects.select_related("directory_entry").in_bulk(list(ldap_users.keys()))
+
+        missing = [uid for uid in ldap_users if uid not in sql_users]
+        if missing:
+            sql_users.update(User._create_users_from_ldap([(uid, ldap_users[uid][1]) for uid in missing]))
+
+        for uid, user in sql_users.items():
+            if uid in ldap_users:
+                user.dn = ldap_users[uid][0]
+
+        return sql_users
+
+    @staticmethod
+    def _create_users_from_ldap(users):
+        """Add users that exist in LDAP but not in the SQL database with one bulk insert.
+
+        Args:
+            users
+                A list of ``(id, username)`` tuples.
+
+        Returns:
+            A dictionary mapping IDs to the saved User objects.
+
+        """
+        created = {}
+        for uid, username in users:
+            user = User(id=uid, username=username)
+            user.set_unusable_password()
+            user.last_login = datetime(9999, 1, 1)
+            created[uid] = user
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(created.values())
+        except IntegrityError:
+            # Another request added some of the users in the meantime
+            logger.debug("Bulk user creation conflicted - adding users individually.")
+            existing = User.objects.in_bulk(list(created.keys()))
+            for uid, user in created.items():
+                if uid in existing:
+                    created[uid] = existing[uid]
+                else:
+                    user.save()
+
+        return created
+
     @staticmethod
     def dn_from_id(id):
         """Get a dn, given an ID.
@@ -354,6 +587,7 @@ class User(AbstractBaseUser, PermissionsMixin):
         return ldap3.utils.dn.parse_dn(dn)[0][1]
 
     @staticmethod
+    @lru_cache(maxsize=settings.SECURE_CACHE_KEY_MEMO_SIZE)
     def create_secure_cache_key(identifier):
         """Create a cache key for sensitive information.
 
@@ -370,7 +604,9 @@ class User(AbstractBaseUser, PermissionsMixin):
         be associated).
 
         This effectively makes sure non-root users on the production
-        server can't access private data from the cache.
+        server can't access private data from the cache. Keys are
+        memoized, since signing and hashing every key of a page of
+        users adds up.
 
         Args:
             identifier
@@ -494,6 +730,25 @@ class User(AbstractBaseUser, PermissionsMixin):
         # if not self.username:
             # self.username = ldap.dn.str2dn(dn)[0][0][1]
 
+    @property
+    def directory(self):
+        """Returns the user's entry in the local directory mirror.
+
+        Returns:
+            :class:`UserDirectoryEntry` object, or ``None`` if the user
+            has not been synced from LDAP.
+
+        """
+        if "_directory" not in self.__dict__:
+            entry = None
+            if self.id is not None:
+                try:
+                    entry = self.directory_entry
+                except UserDirectoryEntry.DoesNotExist:
+                    pass
+            self.__dict__["_directory"] = entry
+        return self.__dict__["_directory"]
+
     @property
     def tj_email(self):
         """Get (or guess) a user's TJ email.
@@ -588,6 +843,7 @@ class User(AbstractBaseUser, PermissionsMixin):
                 class_object = Class(dn=dn)
                 schedule.append(class_object)
 
+            Class.load_index(schedule)
             return schedule
         elif not cached and visible:
             c = LDAPConnection()
@@ -607,10 +863,11 @@ class User(AbstractBaseUser, PermissionsMixin):
             except KeyError:
                 return None
             else:
-                schedule = []
-                for dn in classes:
-                    class_object = Class(dn=dn)
+                class_objects = [Class(dn=dn) for dn in classes]
+                Class.load_index(class_objects)
 
+                schedule = []
+                for dn, class_object in zip(classes, class_objects):
                     # Temporarily pack the classes in tuples so we can
                     # sort on an integer key instead of the periods
                     # property to avoid tons of needless LDAP queries
@@ -653,6 +910,10 @@ class User(AbstractBaseUser, PermissionsMixin):
             :class:`User` object for the user's counselor
 
         """
+        if self.directory is not None:
+            counselor = self.directory.counselor
+            return User.get_user(id=counselor) if counselor else None
+
         key = ":".join([self.dn, "counselor"])
 
         cached = cache.get(key)
@@ -730,6 +991,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         cached = cache.get(key)
         visible = self.attribute_is_visible("showbirthday")
 
+        if visible and self.directory is not None:
+            birthday = self.directory.birthday
+            return datetime.combine(birthday, time()) if birthday else None
+
         if cached and visible:
             logger.debug("Attribute 'birthday' of user {} loaded "
                          "from cache.".format(self.id))
@@ -781,11 +1046,6 @@ class User(AbstractBaseUser, PermissionsMixin):
             Binary data
 
         """
-        identifier = ":".join([self.dn, "photo", photo_year])
-        key = identifier  # User.create_secure_cache_key(identifier)
-
-        cached = cache.get(key)
-
         if self.is_http_request_sender():
             visible = True
         elif self._current_user_override():
@@ -801,30 +1061,46 @@ class User(AbstractBaseUser, PermissionsMixin):
 
             visible = visible_self and visible_parent
 
-        if cached and visible:
+        if visible:
+            return self._load_photo_binary(photo_year)
+        else:
+            return None
+
+    def _load_photo_binary(self, photo_year):
+        """Returns the binary data for a user's picture without checking
+        whether the requesting user is allowed to see it.
+
+        Returns:
+            Binary data, or None
+
+        """
+        identifier = ":".join([self.dn, "photo", photo_year])
+        key = identifier  # User.create_secure_cache_key(identifier)
+
+        cached = cache.get(key)
+
+        if cached:
             logger.debug("{} photo of user {} loaded "
                          "from cache.".format(photo_year.title(),
                                               self.id))
             return cached
-        elif not cached and visible:
-            c = LDAPConnection()
-            dn = "cn={}Photo,{}".format(photo_year, self.dn)
-            try:
-                results = c.search(dn,
-                                   "(objectClass=iodinePhoto)",
-                                   ['jpegPhoto'])
-                if len(results) == 1:
-                    data = results[0][1]['jpegPhoto'][0]
-                else:
-                    data = None
-            except (ldap3.LDAPNoSuchObjectResult, KeyError):
+
+        c = LDAPConnection()
+        dn = "cn={}Photo,{}".format(photo_year, self.dn)
+        try:
+            results = c.search(dn,
+                               "(objectClass=iodinePhoto)",
+                               ['jpegPhoto'])
+            if len(results) == 1:
+                data = results[0][1]['jpegPhoto'][0]
+            else:
                 data = None
+        except (ldap3.LDAPNoSuchObjectResult, KeyError):
+            data = None
 
-            cache.set(key, data,
-                      timeout=settings.CACHE_AGE['ldap_permissions'])
-            return data
-        else:
-            return None
+        cache.set(key, data,
+                  timeout=settings.CACHE_AGE['ldap_permissions'])
+        return data
 
     def photo_base64(self, photo_year):
         """Returns base64 encoded binary data for a user's picture.
@@ -886,28 +1162,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         else:
             c = LDAPConnection()
 
-            perms = {
-                "parent": False,
-                "self": {
-                    "default": False,
-                    "freshman": None,
-                    "sophomore": None,
-                    "junior": None,
-                    "senior": None
-                }
-            }
-
             default_result = c.user_attributes(self.dn,
                                                ["perm-showpictures-self",
                                                 "perm-showpictures"])
             default = default_result.first_result()
-            if "perm-showpictures" in default:
-                perms["parent"] = (default["perm-showpictures"][0] == "TRUE")
-
-            if "perm-showpictures-self" in default:
-                perms["self"]["default"] = (
-                    default["perm-showpictures-self"][0] == "TRUE"
-                )
 
             photos_result = c.search(self.dn,
                                      "(objectclass=iodinePhoto)",
@@ -915,20 +1173,7 @@ class User(AbstractBaseUser, PermissionsMixin):
                                       "perm-showpictures",
                                       "perm-showpictures-self"])
 
-            photos = photos_result
-
-            for photo in photos:
-                attrs = photo['attributes']
-                grade = attrs["cn"][0][:-len("Photo")]
-                try:
-                    public = (attrs["perm-showpictures-self"][0] == "TRUE")
-                    perms["self"][grade] = public
-                except KeyError:
-                    try:
-                        public = (attrs["perm-showpictures"][0] == "TRUE")
-                        perms["self"][grade] = public
-                    except KeyError:
-                        perms["self"][grade] = False
+            perms = User._parse_photo_permissions(default, [photo['attributes'] for photo in photos_result])
 
             cache.set(key, perms,
                       timeout=settings.CACHE_AGE["ldap_permissions"])
@@ -956,34 +1201,248 @@ class User(AbstractBaseUser, PermissionsMixin):
             return cached
         else:
             c = LDAPConnection()
-            results = c.user_attributes(self.dn, ["perm-showaddress",
-                                                  "perm-showtelephone",
-                                                  "perm-showbirthday",
-                                                  "perm-showschedule",
-                                                  "perm-showeighth",
-                                                  "perm-showpictures",
-                                                  "perm-showaddress-self",
-                                                  "perm-showtelephone-self",
-                                                  "perm-showbirthday-self",
-                                                  "perm-showschedule-self",
-                                                  "perm-showeighth-self",
-                                                  "perm-showpictures-self"
-                                                  ])
-            result = results.first_result()
-            perms = {"parent": {}, "self": {}}
-            for perm, value in result.items():
-                bool_value = True if (value[0] == 'TRUE') else False
-                if perm.endswith("-self"):
-                    perm_name = perm[5:-5]
-                    perms["self"][perm_name] = bool_value
-                else:
-                    perm_name = perm[5:]
-                    perms["parent"][perm_name] = bool_value
+            results = c.user_attributes(self.dn, User.PERMISSION_ATTRIBUTES)
+            perms = User._parse_permissions(results.first_result())
 
             cache.set(key, perms,
                       timeout=settings.CACHE_AGE['ldap_permissions'])
             return perms
 
+    # The LDAP attributes that make up :attr:`permissions`
+    PERMISSION_ATTRIBUTES = ["perm-showaddress",
+                             "perm-showtelephone",
+                             "perm-showbirthday",
+                             "perm-showschedule",
+                             "perm-showeighth",
+                             "perm-showpictures",
+                             "perm-showaddress-self",
+                             "perm-showtelephone-self",
+                             "perm-showbirthday-self",
+                             "perm-showschedule-self",
+                             "perm-showeighth-self",
+                             "perm-showpictures-self"]
+
+    @staticmethod
+    def _parse_photo_permissions(default, photos):
+        """Build the :attr:`photo_permissions` dictionary from LDAP results.
+
+        Args:
+            default
+                The attributes of the user's entry.
+            photos
+                A list of the attributes of the user's iodinePhoto entries.
+
+        """
+        perms = {
+            "parent": False,
+            "self": {
+                "default": False,
+                "freshman": None,
+                "sophomore": None,
+                "junior": None,
+                "senior": None
+            }
+        }
+
+        if "perm-showpictures" in default:
+            perms["parent"] = (default["perm-showpictures"][0] == "TRUE")
+
+        if "perm-showpictures-self" in default:
+            perms["self"]["default"] = (
+                default["perm-showpictures-self"][0] == "TRUE"
+            )
+
+        for attrs in photos:
+            grade = attrs["cn"][0][:-len("Photo")]
+            try:
+                public = (attrs["perm-showpictures-self"][0] == "TRUE")
+                perms["self"][grade] = public
+            except KeyError:
+                try:
+                    public = (attrs["perm-showpictures"][0] == "TRUE")
+                    perms["self"][grade] = public
+                except KeyError:
+                    perms["self"][grade] = False
+
+        return perms
+
+    @staticmethod
+    def _parse_permissions(result):
+        """Build the :attr:`permissions` dictionary from the attributes of a user's entry."""
+        perms = {"parent": {}, "self": {}}
+        for perm, value in result.items():
+            if perm not in User.PERMISSION_ATTRIBUTES or not value:
+                continue
+            bool_value = True if (value[0] == 'TRUE') else False
+            if perm.endswith("-self"):
+                perm_name = perm[5:-5]
+                perms["self"][perm_name] = bool_value
+            else:
+                perm_name = perm[5:]
+                perms["parent"][perm_name] = bool_value
+
+        return perms
+
+    # Cached values whose keys are not signed with create_secure_cache_key
+    UNSIGNED_CACHE_KEYS = ["grade", "counselor", "photo_permissions", "user_info_permissions"]
+
+    @staticmethod
+    def cache_key(dn, name):
+        """Returns the cache key of one of a user's cached values.
+
+        Args:
+            dn
+                The DN of the user.
+            name
+                The name of an attribute in ``ldap_user_attributes``, a
+                cached property (e.g. "grade", "classes" or "address")
+                or "photo_permissions" or "user_info_permissions".
+
+        Returns:
+            String
+
+        """
+        identifier = ":".join([dn, name])
+        if name in User.UNSIGNED_CACHE_KEYS:
+            return identifier
+        return User.create_secure_cache_key(identifier)
+
+    @staticmethod
+    def prefetch_cache(users, names):
+        """Load cached values for many users with a single cache lookup.
+
+        Reading a cached value is a round trip to the cache server, so a
+        page that shows a few values for each user in a list should
+        prefetch them. Later reads in the same request are then answered
+        from memory.
+
+        Args:
+            users
+                A list of User objects.
+            names
+                A list of names that can be passed to :meth:`cache_key`.
+
+        """
+        cache.prefetch([User.cache_key(user.dn, name) for user in users if user is not None and user.dn for name in names])
+
+    def _photo_version_name(self, year):
+        """Returns the name a photo version is recorded under.
+
+        Which photo is served depends on whether the requesting user may
+        see this user's photos regardless of their permissions, so
+        versions are recorded separately for those viewers and for
+        everyone else. This keeps the two from overwriting each other,
+        and keeps the version of a hidden photo out of the URLs given to
+        viewers who cannot see it.
+
+        """
+        level = "all" if self.is_http_request_sender() or self._current_user_override() else "public"
+        return "{}:{}".format(year or "preferred", level)
+
+    def photo_version(self, year=None):
+        """Returns the version of one of the user's photos that was last
+        served to viewers like the requesting user, so pages can link to
+        it with a URL that browsers cache for a long time.
+
+        Args:
+            year
+                The grade name of the photo, or None for the preferred
+                photo.
+
+        Returns:
+            The version identifier (see
+            :func:`intranet.apps.users.photos.photo_version`), or None if
+            it is not known.
+
+        """
+        if self.dn is None:
+            return None
+        versions = cache.get(User.cache_key(self.dn, "photo_versions")) or {}
+        return versions.get(self._photo_version_name(year))
+
+    def set_photo_version(self, year, version):
+        """Records the version of one of the user's photos that was served to the requesting user (see
+        :meth:`photo_version`)."""
+        if self.dn is None:
+            return
+        key = User.cache_key(self.dn, "photo_versions")
+        name = self._photo_version_name(year)
+        versions = cache.get(key) or {}
+        if versions.get(name) != version:
+            versions[name] = version
+            cache.set(key, versions, timeout=settings.CACHE_AGE["photo_version"])
+
+    def clear_photo_versions(self):
+        """Forgets the recorded photo versions after the photo shown for the user changes."""
+        if self.dn is not None:
+            cache.delete(User.cache_key(self.dn, "photo_versions"))
+
+    @staticmethod
+    def preload_permissions(users, chunk_size=100):
+        """Fetch the :attr:`permissions` and :attr:`photo_permissions` of
+        many users at once and cache them.
+
+        Reading either property for a user that is not cached costs one
+        or two LDAP searches, which adds up on pages that list many users
+        (class rosters, search results, birthdays). This fetches the user
+        entries and their iodinePhoto entries with one subtree search per
+        chunk of users and fills the same cache keys that the properties
+        read.
+
+        Args:
+            users
+                A list of User objects.
+            chunk_size
+                The maximum number of users to include in a single search.
+
+        Returns:
+            The number of users whose permissions were fetched from LDAP.
+
+        """
+        keys = {}
+        for user in users:
+            if user is not None and user.dn:
+                keys[user.dn] = (":".join([user.dn, "photo_permissions"]),
+                                 "{}:{}".format(user.dn, "user_info_permissions"))
+
+        cached = cache.get_many([key for pair in keys.values() for key in pair])
+        missing = [dn for dn, pair in keys.items() if not all(cached.get(key) for key in pair)]
+        if not missing:
+            return 0
+
+        c = LDAPConnection()
+        attributes = sorted(set(User.PERMISSION_ATTRIBUTES) | {"cn"})
+        to_cache = {}
+        for i in range(0, len(missing), chunk_size):
+            # lowercased user DN => (user attributes, list of photo attributes)
+            entries = {dn.lower(): (None, []) for dn in missing[i:i + chunk_size]}
+            usernames = [LDAPFilter.escape(User.username_from_dn(dn)) for dn in missing[i:i + chunk_size]]
+            # Matching iodineUid against the DN components selects the
+            # iodinePhoto entries below each user
+            query = "(|(&{}{})(&(objectClass=iodinePhoto){}))".format(LDAPFilter.all_users(),
+                                                                      LDAPFilter.attribute_in_list("iodineUid", usernames),
+                                                                      LDAPFilter.attribute_in_list("iodineUid:dn:", usernames))
+            for row in c.search(settings.USER_DN, query, attributes):
+                dn = row["dn"].lower()
+                if dn in entries:
+                    entries[dn] = (row["attributes"], entries[dn][1])
+                else:
+                    parent = dn.split(",", 1)[-1]
+                    if parent in entries:
+                        entries[parent][1].append(row["attributes"])
+
+            for dn in missing[i:i + chunk_size]:
+                default, photos = entries[dn.lower()]
+                if default is None:
+                    logger.warning("No such user " + dn)
+                    continue
+                photo_key, info_key = keys[dn]
+                to_cache[photo_key] = User._parse_photo_permissions(default, photos)
+                to_cache[info_key] = User._parse_permissions(default)
+
+        cache.set_many(to_cache, timeout=settings.CACHE_AGE["ldap_permissions"])
+        return len(to_cache) // 2
+
     @property
     def can_view_eighth(self):
         """Checks if a user has the showeighth permission.
@@ -1371,14 +1830,6 @@ class User(AbstractBaseUser, PermissionsMixin):
             raise exceptions.ObjectDoesNotExist("Could not determine DN of User with ID {} (requesting {})".format(self.id, name))
 
         attr = User.ldap_user_attributes[name]
-        should_cache = attr["cache"]
-        if should_cache:
-            identifier = ":".join((self.dn, name))
-            key = User.create_secure_cache_key(identifier)
-
-            cached = cache.get(key)
-        else:
-            cached = False
 
         if attr["perm"] is None:
             visible = True
@@ -1388,9 +1839,34 @@ class User(AbstractBaseUser, PermissionsMixin):
         if name not in ["ion_id", "ion_username", "user_type"]:
             visible = self._current_user_override() or visible
 
+        if not visible:
+            return None
+
+        backfill = False
+        if name in UserDirectoryEntry.MIRRORED_ATTRIBUTES and self.directory is not None:
+            value = self.directory.attribute_value(name)
+            if value is not None or name not in UserDirectoryEntry.BACKFILLED_ATTRIBUTES:
+                logger.debug("Attribute '{}' of user {} loaded "
+                             "from directory.".format(name, self.id))
+                return value
+            # The entry was synced before the attribute was mirrored, so
+            # read it from LDAP and store it in the entry
+            backfill = True
+
+        should_cache = attr["cache"]
+        if should_cache:
+            identifier = ":".join((self.dn, name))
+            key = User.create_secure_cache_key(identifier)
+
+            cached = cache.get(key)
+        else:
+            cached = False
+
         if cached and visible:
             logger.debug("Attribute '{}' of user {} loaded "
                          "from cache.".format(name, self.id or self.dn))
+            if backfill:
+                self.directory.set_attribute(name, cached)
             return cached
         elif not cached and visible:
             c = LDAPConnection()
@@ -1402,23 +1878,131 @@ class User(AbstractBaseUser, PermissionsMixin):
                 except TypeError:
                     result = None
 
-                if attr["is_list"]:
-                    value = result
-                elif result:
-                    value = result[0]
-                else:
-                    value = None
+                value = User._ldap_attribute_value(attr, result)
+                if value is None:
                     should_cache = False
 
                 if should_cache:
                     cache.set(key, value,
                               timeout=settings.CACHE_AGE["user_attribute"])
+                if backfill and value is not None:
+                    self.directory.set_attribute(name, value)
                 return value
             except KeyError:
                 return None
         else:
             return None
 
+    @staticmethod
+    def _ldap_attribute_value(attr, result):
+        """Convert the raw list of LDAP values for a simple attribute into the value returned by
+        :meth:`__getattr__`.
+
+        Args:
+            attr
+                The attribute's entry in ``User.ldap_user_attributes``.
+            result
+                The list of values returned by LDAP (or None).
+
+        Returns:
+            The list itself for list attributes, otherwise the first
+            value, or None if there is no value.
+
+        """
+        if attr["is_list"]:
+            return result
+        elif result:
+            return result[0]
+        else:
+            return None
+
+    @staticmethod
+    def cache_ldap_attributes(entries, fields):
+        """Populate the secure per-attribute cache keys of users from LDAP results.
+
+        All of the values are written to the cache at once.
+
+        Args:
+            entries
+                A list of ``(dn, attributes)`` tuples, where attributes
+                is the attributes dictionary of the user's LDAP entry
+                (e.g. from :meth:`LDAPResult.first_result`).
+            fields
+                A list of simple attribute names (keys of
+                ``User.ldap_user_attributes``) to cache.
+
+        """
+        to_cache = {}
+        for dn, result in entries:
+            for name in fields:
+                attr = User.ldap_user_attributes[name]
+                if not attr["cache"] or attr["ldap_name"] not in result:
+                    continue
+
+                value = User._ldap_attribute_value(attr, result[attr["ldap_name"]])
+                if value is None:
+                    continue
+
+                identifier = ":".join((dn, name))
+                to_cache[User.create_secure_cache_key(identifier)] = value
+
+        if to_cache:
+            cache.set_many(to_cache, timeout=settings.CACHE_AGE["user_attribute"])
+
+    def preload(self, fields=None):
+        """Fetch simple LDAP attributes of the user with one search and cache them.
+
+        Accessing a simple attribute through :meth:`__getattr__` issues
+        a separate LDAP search for every attribute that is not already
+        cached. Views that are about to render many attributes of a user
+        (e.g. the profile page) should call this first so that all of
+        the missing attributes are fetched at once. Permission checks
+        are still performed when the attributes are read.
+
+        Args:
+            fields
+                A list of simple attribute names (keys of
+                ``User.ldap_user_attributes``) to load. Defaults to all
+                cacheable attributes.
+
+        Returns:
+            A list of the attribute names that were fetched from LDAP.
+
+        """
+        if fields is None:
+            fields = [name for name, attr in User.ldap_user_attributes.items() if attr["cache"]]
+        else:
+            for name in fields:
+                if name not in User.ldap_user_attributes:
+                    raise AttributeError("'User' has no attribute '{}'".format(name))
+            fields = [name for name in fields if User.ldap_user_attributes[name]["cache"]]
+
+        if not fields or self.dn is None:
+            return []
+
+        keys = {name: User.create_secure_cache_key(":".join((self.dn, name))) for name in fields}
+        cached = cache.get_many(list(keys.values()))
+        missing = [name for name in fields if not cached.get(keys[name])]
+
+        if not missing:
+            logger.debug("All preloaded attributes of user {} loaded "
+                         "from cache.".format(self.id or self.dn))
+            return []
+
+        c = LDAPConnection()
+        ldap_names = sorted(set(User.ldap_user_attributes[name]["ldap_name"] for name in missing))
+        try:
+            results = c.user_attributes(self.dn, ldap_names)
+        except ldap3.LDAPNoSuchObjectResult:
+            return []
+
+        result = results.first_result()
+        if not result:
+            return []
+
+        User.cache_ldap_attributes([(self.dn, result)], missing)
+        return missing
+
     def set_ldap_attribute(self, name, value, override_set=False):
         """Set a user attribute in LDAP."""
 
@@ -1449,6 +2033,12 @@ class User(AbstractBaseUser, PermissionsMixin):
             key = User.create_secure_cache_key(identifier)
             cache.set(key, value, timeout=settings.CACHE_AGE["user_attribute"])
 
+        if name in UserDirectoryEntry.MIRRORED_ATTRIBUTES and self.directory is not None:
+            self.directory.set_attribute(name, value)
+
+        if name == "preferred_photo":
+            self.clear_photo_versions()
+
     def set_ldap_preference(self, item_name, value, is_admin=False):
         logger.debug("Pref: {} {}".format(item_name, value))
 
@@ -1478,12 +2068,14 @@ class User(AbstractBaseUser, PermissionsMixin):
             grade = field_name.split("photoperm-")[1]
             self.set_raw_ldap_photoperm(field_type, grade, value)
             cache.delete(":".join([self.dn, "photo_permissions"]))
+            self.clear_photo_versions()
         else:
             logger.debug("Setting raw LDAP: {} = {}".format(ldap_name, value))
             self.set_raw_ldap_attribute(ldap_name, value)
 
         if field_name == "showpictures":
             cache.delete(":".join([self.dn, "photo_permissions"]))
+            self.clear_photo_versions()
 
         if field_name in ["showschedule", "showaddress", "showphone", "showbirthday", "showpictures", "showeighth"]:
             cache.delete(":".join([self.dn, "user_info_permissions"]))
@@ -1516,6 +2108,7 @@ class User(AbstractBaseUser, PermissionsMixin):
         for attr in User.ldap_user_attributes:
             cache.delete(":".join((self.dn, attr)))
             cache.delete(User.create_secure_cache_key(":".join((self.dn, attr))))
+        self.__dict__.pop("_directory", None)
 
     @property
     def is_eighth_sponsor(self):
@@ -1568,6 +2161,252 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.id
 
 
+class UserDirectoryEntry(models.Model):
+
+    """A local copy of the LDAP attributes of a user that list views need.
+
+    Rows are kept up to date by the ``sync_directory`` management
+    command, which only fetches LDAP entries whose ``modifyTimestamp``
+    changed since the last sync. :class:`User` reads the mirrored
+    attributes from here before trying the cache and LDAP, so views
+    that list many users can filter and sort them with indexed SQL
+    queries (join through ``directory_entry``).
+
+    Attributes:
+        user
+            The :class:`User` this entry mirrors.
+        modify_timestamp
+            The ``modifyTimestamp`` of the LDAP entry when it was
+            last synced.
+
+    """
+
+    user = models.OneToOneField(User, primary_key=True, related_name="directory_entry", on_delete=models.CASCADE)
+
+    common_name = models.CharField(max_length=255, null=True)
+    first_name = models.CharField(max_length=100, null=True, db_index=True)
+    last_name = models.CharField(max_length=100, null=True, db_index=True)
+    nickname = models.CharField(max_length=100, null=True)
+    graduation_year = models.IntegerField(null=True, db_index=True)
+    user_type = models.CharField(max_length=100, null=True, db_index=True)
+    student_id = models.CharField(max_length=20, null=True, db_index=True)
+    counselor = models.IntegerField(null=True)
+    emails = models.TextField(blank=True, default="")  # newline separated
+    birthday = models.DateField(null=True, db_index=True)
+    sex = models.CharField(max_length=10, null=True, db_index=True)
+
+    modify_timestamp = models.DateTimeField(null=True, db_index=True)
+    last_synced = models.DateTimeField(auto_now=True)
+
+    # Simple attributes of User (keys of User.ldap_user_attributes) that
+    # are read from this table
+    MIRRORED_ATTRIBUTES = ("common_name", "first_name", "last_name", "nickname",
+                           "graduation_year", "user_type", "student_id", "emails", "sex")
+
+    # Mirrored attributes that were added after entries were first
+    # synced. Until an entry is synced again, these are NULL and are read
+    # from LDAP (and stored in the entry) instead.
+    BACKFILLED_ATTRIBUTES = ("sex",)
+
+    LDAP_ATTRIBUTES = sorted(set([User.ldap_user_attributes[name]["ldap_name"] for name in MIRRORED_ATTRIBUTES] +
+                                 ["iodineUid", "iodineUidNumber", "counselor", "birthday", "modifyTimestamp"]))
+
+    @staticmethod
+    def parse_timestamp(value):
+        """Convert an LDAP GeneralizedTime (e.g. ``20160212162100Z``) into an aware datetime."""
+        if not value:
+            return None
+        if isinstance(value, datetime):
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value, timezone.utc)
+            return value
+        return timezone.make_aware(datetime.strptime(value[:14], "%Y%m%d%H%M%S"), timezone.utc)
+
+    @staticmethod
+    def _to_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def update_from_ldap(self, attributes):
+        """Set the fields of the entry from the raw attributes of an LDAP search result.
+
+        Args:
+            attributes
+                The ``attributes`` dictionary of the user's LDAP entry.
+
+        Returns:
+            Whether any field was changed.
+
+        """
+
+        def first(ldap_name):
+            values = attributes.get(ldap_name)
+            return values[0] if values else None
+
+        birthday = first("birthday")
+        try:
+            birthday = datetime.strptime(birthday, "%Y%m%d").date() if birthday else None
+        except ValueError:
+            birthday = None
+
+        fields = {
+            "common_name": first("cn"),
+            "first_name": first("givenName"),
+            "last_name": first("sn"),
+            "nickname": first("nickname"),
+            "graduation_year": self._to_int(first("graduationYear")),
+            "user_type": first("objectClass"),
+            "student_id": first("tjhsstStudentId"),
+            "counselor": self._to_int(first("counselor")),
+            "emails": "\n".join(attributes.get("mail") or []),
+            "birthday": birthday,
+            "sex": first("gender"),
+            "modify_timestamp": self.parse_timestamp(first("modifyTimestamp"))
+        }
+
+        changed = False
+        for field, value in fields.items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
+
+    def attribute_value(self, name):
+        """Return a mirrored attribute in the same form as :meth:`User.__getattr__`."""
+        if name == "emails":
+            return self.emails.split("\n") if self.emails else None
+        return getattr(self, name)
+
+    def set_attribute(self, name, value):
+        """Update a mirrored attribute after it has been changed in LDAP."""
+        if name == "emails":
+            value = "\n".join(value or [])
+        setattr(self, name, value)
+        self.save(update_fields=[name])
+
+    def __str__(self):
+        return "{} ({})".format(self.user_id, self.common_name)
+
+
+class DirectorySync(models.Model):
+
+    """A run of the ``sync_directory`` management command that completed.
+
+    Rows are only written once every entry has been synced, so
+    :func:`directory_is_synced` can tell a populated mirror from one
+    that a sync was interrupted while filling.
+
+    Attributes:
+        full
+            Whether the run synced every user in LDAP, rather than
+            only those modified since the last sync.
+        completed_time
+            When the run finished.
+
+    """
+
+    full = models.BooleanField(default=False)
+    completed_time = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{} sync at {}".format("Full" if self.full else "Incremental", self.completed_time)
+
+
+class ClassIndexEntry(models.Model):
+
+    """A local copy of the schedule attributes of a tjhsstClass section.
+
+    Rows are refreshed by the ``sync_classes`` management command with
+    one paged LDAP search. :class:`Class` and :class:`ClassSections`
+    read from this table when it has been populated, so pages that list
+    many sections (all classes, rooms, other sections of a class) do not
+    need separate LDAP searches for every section.
+
+    Attributes:
+        section_id
+            The tjhsstSectionId of the class.
+        sort_value
+            The value of :attr:`Class.sortvalue`, stored so that
+            sections can be ordered in SQL.
+
+    """
+
+    section_id = models.CharField(max_length=100, primary_key=True)
+    dn = models.CharField(max_length=255)
+    class_id = models.CharField(max_length=100, null=True, db_index=True)
+    name = models.CharField(max_length=255, null=True)
+    periods = models.CharField(max_length=50, blank=True, default="")  # comma separated
+    quarters = models.CharField(max_length=50, blank=True, default="")  # comma separated
+    room_number = models.CharField(max_length=50, null=True, db_index=True)
+    course_length = models.CharField(max_length=50, null=True)
+    teacher_dn = models.CharField(max_length=255, null=True, db_index=True)
+    sort_value = models.FloatField(null=True, db_index=True)
+
+    last_synced = models.DateTimeField(auto_now=True)
+
+    LDAP_ATTRIBUTES = ["tjhsstSectionId", "tjhsstClassId", "cn", "classPeriod", "quarterNumber",
+                       "roomNumber", "courseLength", "sponsorDn"]
+
+    class Meta:
+        ordering = ["sort_value"]
+
+    def update_from_ldap(self, dn, attributes):
+        """Set the fields of the entry from the raw attributes of an LDAP search result.
+
+        Args:
+            dn
+                The DN of the class.
+            attributes
+                The ``attributes`` dictionary of the class's LDAP entry.
+
+        Returns:
+            Whether any field was changed.
+
+        """
+
+        def first(ldap_name):
+            values = attributes.get(ldap_name)
+            return values[0] if values else None
+
+        periods = sorted(int(p) for p in attributes.get("classPeriod") or [])
+        quarters = sorted(int(q) for q in attributes.get("quarterNumber") or [])
+        sort_value = None
+        if periods:
+            sort_value = min(periods) + (float(sum(quarters)) / 11)
+
+        fields = {
+            "dn": dn,
+            "class_id": first("tjhsstClassId"),
+            "name": first("cn"),
+            "periods": ",".join(str(p) for p in periods),
+            "quarters": ",".join(str(q) for q in quarters),
+            "room_number": first("roomNumber"),
+            "course_length": first("courseLength"),
+            "teacher_dn": first("sponsorDn"),
+            "sort_value": sort_value
+        }
+
+        changed = False
+        for field, value in fields.items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
+
+    @property
+    def period_list(self):
+        return [int(p) for p in self.periods.split(",")] if self.periods else []
+
+    @property
+    def quarter_list(self):
+        return [int(q) for q in self.quarters.split(",")] if self.quarters else []
+
+    def __str__(self):
+        return "{} ({})".format(self.section_id, self.name)
+
+
 class Class(object):
     """Represents a tjhsstClass LDAP object in which a user is enrolled.
 
@@ -1596,6 +2435,66 @@ class Class(object):
         """
         self.dn = dn or 'tjhsstSectionId={},ou=schedule,dc=tjhsst,dc=edu'.format(id)
 
+    # Attributes of students shown on class rosters and in roster CSVs,
+    # which are fetched in the same search as the students themselves
+    ROSTER_ATTRIBUTES = ["first_name", "last_name", "nickname", "student_id",
+                         "graduation_year", "emails", "user_type"]
+
+    @classmethod
+    def from_index(cls, entry):
+        """Create a Class object from an entry in the class index without any further queries."""
+        class_object = cls(dn=entry.dn)
+        class_object.__dict__["_index"] = entry
+        return class_object
+
+    @staticmethod
+    def load_index(classes):
+        """Fetch the class index entries of many Class objects with one query.
+
+        Args:
+            classes
+                A list of Class objects.
+
+        """
+        classes = [c for c in classes if "_index" not in c.__dict__]
+        if not classes:
+            return
+
+        entries = {}
+        if ClassIndexEntry.objects.exists():
+            entries = ClassIndexEntry.objects.in_bulk([c.section_id for c in classes])
+        for c in classes:
+            c.__dict__["_index"] = entries.get(c.section_id)
+
+    @staticmethod
+    def load_teachers(classes):
+        """Fetch the teachers of many Class objects at once.
+
+        Args:
+            classes
+                A list of Class objects whose index entries have been
+                loaded.
+
+        """
+        dns = set(c.index.teacher_dn for c in classes if c.index is not None and c.index.teacher_dn)
+        teachers = {u.dn.lower(): u for u in User.get_users(dns=list(dns), fields=["last_name"])}
+        for c in classes:
+            if c.index is not None and c.index.teacher_dn:
+                c.__dict__["_teacher"] = teachers.get(c.index.teacher_dn.lower())
+
+    @property
+    def index(self):
+        """Returns the class's entry in the local class index.
+
+        Returns:
+            :class:`ClassIndexEntry` object, or ``None`` if the class
+            has not been indexed.
+
+        """
+        if "_index" not in self.__dict__:
+            Class.load_index([self])
+        return self.__dict__["_index"]
+
     @property
     def section_id(self):
         return ldap3.utils.dn.parse_dn(self.dn)[0][1]
@@ -1611,18 +2510,13 @@ class Class(object):
 
         """
         c = LDAPConnection()
-        students = c.search(settings.USER_DN, "enrolledClass={}".format(self.dn), ["dn"])
-
-        users = []
-        for row in students:
-            dn = row["dn"]
-            try:
-                user = User.get_user(dn=dn)
-            except User.DoesNotExist:
-                continue
-            users.append(user)
+        ldap_names = set(["iodineUid", "iodineUidNumber"])
+        ldap_names |= set(User.ldap_user_attributes[name]["ldap_name"] for name in Class.ROSTER_ATTRIBUTES)
+        students = c.search(settings.USER_DN,
+                            "enrolledClass={}".format(LDAPFilter.escape(self.dn)),
+                            sorted(ldap_names))
 
-        return users
+        return User.users_from_ldap_results(students, Class.ROSTER_ATTRIBUTES)
 
     @property
     def teacher(self):
@@ -1632,6 +2526,11 @@ class Class(object):
             User object
 
         """
+        if "_teacher" in self.__dict__:
+            return self.__dict__["_teacher"]
+        if self.index is not None and self.index.teacher_dn:
+            return User.get_user(dn=self.index.teacher_dn)
+
         key = ":".join([self.dn, 'teacher'])
 
         cached = cache.get(key)
@@ -1660,6 +2559,9 @@ class Class(object):
             Integer list
 
         """
+        if self.index is not None:
+            return self.index.quarter_list
+
         key = ":".join([self.dn, "quarters"])
 
         cached = cache.get(key)
@@ -1691,6 +2593,9 @@ class Class(object):
             A float value of the equation.
 
         """
+        if self.index is not None and self.index.sort_value is not None:
+            return self.index.sort_value
+
         return min(map(float, self.periods)) + (float(sum(self.quarters)) / 11)
 
     @property
@@ -1705,6 +2610,7 @@ class Class(object):
 
         schedule = []
         classes = class_sections.classes
+        Class.load_teachers(classes)
         # Sort in order
         for class_object in classes:
             sortvalue = class_object.sortvalue
@@ -1765,6 +2671,11 @@ class Class(object):
         if name not in class_attributes:
             raise AttributeError("'Class' has no attribute '{}'".format(name))
 
+        if self.index is not None:
+            if name == "periods":
+                return self.index.period_list
+            return getattr(self.index, name)
+
         key = ":".join([self.dn, name])
 
         cached = cache.get(key)
@@ -1835,6 +2746,9 @@ class ClassSections(object):
             List of Class objects
 
         """
+        if ClassIndexEntry.objects.exists():
+            return [Class.from_index(entry) for entry in ClassIndexEntry.objects.filter(class_id=self.id)]
+
         c = LDAPConnection()
         query = c.search(self.dn, "(&(objectClass=tjhsstClass)(tjhsstClassId={}))".format(self.id), ["tjhsstSectionId", "dn"])
 
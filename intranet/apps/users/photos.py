@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def photo_version(data):
+    """Returns the version identifier of a photo, which is a hash of its
+    contents.
+
+    Args:
+        data
+            The binary data of the original photo.
+
+    Returns:
+        A hex string
+
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def photo_path(version, size):
+    """Returns the path that a sized copy of a photo is stored at.
+
+    Args:
+        version
+            The version identifier of the original photo.
+        size
+            The name of a size in PHOTO_SIZES.
+
+    """
+    return os.path.join(settings.PHOTO_CACHE_ROOT, version[:2], "{}_{}.jpg".format(version, size))
+
+
+def resize_photo(data, size):
+    """Scales a photo down to fit within the bounding box of a size.
+
+    Args:
+        data
+            The binary data of the original photo.
+        size
+            The name of a size in PHOTO_SIZES.
+
+    Returns:
+        The binary data of the resized photo, as a JPEG.
+
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail(settings.PHOTO_SIZES[size], Image.ANTIALIAS)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+def get_photo(data, size="full"):
+    """Returns a sized copy of a photo, creating and storing it on disk if
+    it has not been generated yet.
+
+    Args:
+        data
+            The binary data of the original photo.
+        size
+            The name of a size in PHOTO_SIZES.
+
+    Returns:
+        A tuple of the version identifier of the original photo and the
+        binary data of the sized copy.
+
+    """
+    version = photo_version(data)
+    if settings.PHOTO_SIZES.get(size) is None:
+        return version, data
+
+    path = photo_path(version, size)
+    try:
+        with open(path, "rb") as f:
+            return version, f.read()
+    except (IOError, OSError):
+        pass
+
+    try:
+        resized = resize_photo(data, size)
+    except (IOError, OSError, ValueError):
+        logger.warning("Could not resize photo {} to {}".format(version, size))
+        return version, data
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(resized)
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as e:
+        logger.error("Could not store photo {} at {}: {}".format(version, path, e))
+
+    return version, resized
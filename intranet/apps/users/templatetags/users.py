@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from django import template
+from django.core.urlresolvers import reverse
+from django.utils.http import urlencode
 
 from ..models import User
 
@@ -11,3 +13,19 @@ register = template.Library()
 def user_attr(username, attribute):
     """Gets an attribute of the user with the given username."""
     return getattr(User.get_user(username=username), attribute)
+
+
+@register.simple_tag
+def photo_url(user, size="full", year=None):
+    """Gets the URL of a user's photo in one of the PHOTO_SIZES.
+
+    The URL includes the photo's version when it is known, so browsers
+    can keep it cached until the photo changes.
+
+    """
+    args = [user.id, year] if year else [user.id]
+    params = [("size", size)]
+    version = user.photo_version(year)
+    if version:
+        params.append(("v", version))
+    return "{}?{}".format(reverse("profile_picture", args=args), urlencode(params))
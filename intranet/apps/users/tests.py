@@ -2,9 +2,12 @@
 
 from io import StringIO
 
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.management import call_command
 
+from .models import Class, ClassIndexEntry, User, UserDirectoryEntry
 from ...test.ion_test import IonTestCase
+from ...utils.request_cache import RequestCache
 
 
 class DynamicGroupTest(IonTestCase):
@@ -16,3 +19,140 @@ class DynamicGroupTest(IonTestCase):
         output = ["2016: 1 users", "2016: Processed", "2017: 0 users", "2017: Processed", "2018: 0 users",
                   "2018: Processed", "2019: 0 users", "2019: Processed", "Done."]
         self.assertEqual(out.getvalue().splitlines(), output)
+
+
+class UserPreloadTest(IonTestCase):
+    """Tests bulk loading of LDAP attributes."""
+
+    def test_preload(self):
+        user = User.get_user(username='awilliam')
+        cacheable = [name for name, attr in User.ldap_user_attributes.items() if attr["cache"]]
+        self.assertEqual(sorted(user.preload()), sorted(cacheable))
+        with self.assertRaises(AttributeError):
+            user.preload(fields=["not_an_attribute"])
+
+
+class GetUsersTest(IonTestCase):
+    """Tests resolving many users at once."""
+
+    def test_get_users(self):
+        users = User.get_users(dns=["iodineUid=awilliam,ou=people,dc=tjhsst,dc=edu"])
+        self.assertEqual([u.id for u in users], [1337])
+        self.assertEqual(users[0].username, "awilliam")
+        # The user was added to the database, so no LDAP search is needed
+        self.assertEqual(User.get_users(ids=[1337]), users)
+        with self.assertRaises(TypeError):
+            User.get_users()
+
+    def test_users_from_ldap_results(self):
+        results = [{"dn": "iodineUid=awilliam,ou=people,dc=tjhsst,dc=edu",
+                    "attributes": {"iodineUid": ["awilliam"], "iodineUidNumber": ["1337"], "sn": ["William"]}},
+                   {"dn": "ou=people,dc=tjhsst,dc=edu", "attributes": {}}]
+        users = User.users_from_ldap_results(results, ["last_name"])
+        self.assertEqual([u.id for u in users], [1337])
+        self.assertEqual(users[0].dn, "iodineUid=awilliam,ou=people,dc=tjhsst,dc=edu")
+
+
+class UserDirectoryTest(IonTestCase):
+    """Tests reading user attributes from the local directory."""
+
+    def test_directory_entry(self):
+        user = User.get_user(username='awilliam')
+        entry = UserDirectoryEntry(user=user)
+        changed = entry.update_from_ldap({
+            "iodineUid": ["awilliam"],
+            "iodineUidNumber": [1337],
+            "cn": ["Angela William"],
+            "givenName": ["Angela"],
+            "sn": ["William"],
+            "graduationYear": ["2016"],
+            "mail": ["awilliam@example.com", "angela@example.com"],
+            "birthday": ["19980130"],
+            "gender": ["F"],
+            "modifyTimestamp": ["20160212162100Z"]
+        })
+        self.assertTrue(changed)
+        entry.save()
+
+        user = User.get_user(username='awilliam')
+        self.assertEqual(user.last_name, "William")
+        self.assertEqual(user.graduation_year, 2016)
+        self.assertEqual(user.emails, ["awilliam@example.com", "angela@example.com"])
+        self.assertIsNone(user.nickname)
+        self.assertTrue(user.is_female)
+        self.assertEqual(User.objects.users_in_year(2016), [user])
+
+
+class RequestCacheTest(IonTestCase):
+    """Tests the per-request cache in front of the cache server."""
+
+    def test_request_cache(self):
+        backend = LocMemCache("request-cache-test", {})
+        request_cache = RequestCache(backend)
+        backend.set("a", 1)
+
+        # Outside of a request, nothing is kept in memory
+        self.assertEqual(request_cache.get("a"), 1)
+        self.assertEqual(request_cache.stats(), {})
+
+        request_cache.activate()
+        request_cache.prefetch(["a", "b"])
+        backend.set("a", 2)
+        self.assertEqual(request_cache.get("a"), 1)
+        self.assertEqual(request_cache.get("b", "default"), "default")
+        request_cache.set("b", 3)
+        self.assertEqual(request_cache.get_many(["a", "b"]), {"a": 1, "b": 3})
+        request_cache.delete("a")
+        self.assertIsNone(request_cache.get("a"))
+        self.assertEqual(request_cache.stats(), {"hits": 5, "misses": 2, "round_trips": 1})
+
+        request_cache.clear()
+        self.assertEqual(request_cache.get("b"), 3)
+        self.assertEqual(request_cache.stats(), {})
+
+
+class UserPermissionsTest(IonTestCase):
+    """Tests building permission dictionaries from LDAP attributes."""
+
+    def test_parse_permissions(self):
+        perms = User._parse_permissions({
+            "cn": ["Angela William"],
+            "perm-showbirthday": ["TRUE"],
+            "perm-showbirthday-self": ["FALSE"]
+        })
+        self.assertEqual(perms, {"parent": {"showbirthday": True}, "self": {"showbirthday": False}})
+
+        photo_perms = User._parse_photo_permissions({"perm-showpictures": ["TRUE"], "perm-showpictures-self": ["TRUE"]},
+                                                    [{"cn": ["seniorPhoto"], "perm-showpictures-self": ["FALSE"]},
+                                                     {"cn": ["juniorPhoto"]}])
+        self.assertTrue(photo_perms["parent"])
+        self.assertTrue(photo_perms["self"]["default"])
+        self.assertFalse(photo_perms["self"]["senior"])
+        self.assertFalse(photo_perms["self"]["junior"])
+        self.assertIsNone(photo_perms["self"]["freshman"])
+        self.assertEqual(User.preload_permissions([]), 0)
+
+
+class ClassIndexTest(IonTestCase):
+    """Tests reading class attributes from the local class index."""
+
+    def test_class_index(self):
+        dn = "tjhsstSectionId=1234-01,ou=schedule,dc=tjhsst,dc=edu"
+        entry = ClassIndexEntry(section_id="1234-01")
+        self.assertTrue(entry.update_from_ldap(dn, {
+            "tjhsstSectionId": ["1234-01"],
+            "tjhsstClassId": ["1234"],
+            "cn": ["Computer Systems"],
+            "classPeriod": ["3", "2"],
+            "quarterNumber": ["1", "2"],
+            "roomNumber": ["201"]
+        }))
+        entry.save()
+
+        c = Class(id="1234-01")
+        self.assertEqual(c.name, "Computer Systems")
+        self.assertEqual(c.periods, [2, 3])
+        self.assertEqual(c.quarters, [1, 2])
+        self.assertEqual(c.room_number, "201")
+        self.assertAlmostEqual(c.sortvalue, 2 + 3.0 / 11)
+        self.assertEqual([s.section_id for s in c.sections], ["1234-01"])
@@ -8,12 +8,14 @@ import os
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect, render
+from django.utils.http import parse_etags, quote_etag
 
 from intranet.db.ldap_db import LDAPConnection, LDAPFilter
 
-from .models import Class, Grade, User
+from .models import Class, ClassIndexEntry, Grade, User
+from .photos import get_photo
 from ..eighth.models import (EighthBlock, EighthScheduledActivity,
                              EighthSignup, EighthSponsor)
 from ..eighth.utils import get_start_date
@@ -50,6 +52,9 @@ def profile_view(request, user_id=None):
         messages.success(request, "Cleared cache for {}".format(profile_user))
         return redirect("/profile/{}".format(profile_user.id))
 
+    # Fetch all of the attributes shown on the profile with one LDAP search
+    profile_user.preload()
+
     num_blocks = 6
 
     eighth_schedule = []
@@ -118,6 +123,12 @@ def get_ionldap_courses(profile_user, current_user=None):
 def picture_view(request, user_id, year=None):
     """Displays a view of a user's picture.
 
+    The picture is scaled to the size given in the "size" GET parameter
+    (one of PHOTO_SIZES), and is served with an ETag so that browsers can
+    revalidate it instead of downloading it again. If the "v" GET parameter
+    matches the current version of the picture, it is cached for
+    PHOTO_VERSIONED_MAX_AGE.
+
     Args:
         user_id
             The ID of the user whose picture is being fetched.
@@ -134,48 +145,52 @@ def picture_view(request, user_id, year=None):
 
     if user is None:
         raise Http404
+
+    data = None
+    preferred = None
+    if year is None:
+        preferred = user.preferred_photo
+        if preferred is not None:
+            if preferred.endswith("Photo"):
+                preferred = preferred[:-len("Photo")]
+
+        if preferred == "AUTO":
+            data = user.default_photo()
+        # Exclude 'graduate' from names array
+        elif preferred in Grade.names:
+            data = user.photo_binary(preferred)
     else:
-        if year is None:
-            preferred = user.preferred_photo
-            if preferred is not None:
-                if preferred.endswith("Photo"):
-                    preferred = preferred[:-len("Photo")]
-
-            if preferred == "AUTO":
-                data = user.default_photo()
-                if data is None:
-                    image_buffer = io.open(default_image_path, mode="rb")
-                else:
-                    image_buffer = io.StringIO(data)
-
-            # Exclude 'graduate' from names array
-            elif preferred in Grade.names:
-                data = user.photo_binary(preferred)
-
-                if data:
-                    image_buffer = io.StringIO(data)
-                else:
-                    image_buffer = io.open(default_image_path, mode="rb")
-            else:
-                image_buffer = io.open(default_image_path, mode="rb")
-        else:
-            data = user.photo_binary(year)
-            if data:
-                image_buffer = io.StringIO(data)
-            else:
-                image_buffer = io.open(default_image_path, mode="rb")
-
-        response = HttpResponse(content_type="image/jpeg")
+        data = user.photo_binary(year)
+
+    if not data:
+        with io.open(default_image_path, mode="rb") as f:
+            data = f.read()
+
+    size = request.GET.get("size", "full")
+    if size not in settings.PHOTO_SIZES:
+        size = "full"
+
+    version, img = get_photo(data, size)
+    user.set_photo_version(year, version)
+    etag = quote_etag("{}-{}".format(version, size))
+
+    if request.GET.get("v") == version:
+        cache_control = "private, max-age={}".format(settings.PHOTO_VERSIONED_MAX_AGE)
+    else:
+        cache_control = "private, max-age={}".format(settings.PHOTO_MAX_AGE)
+
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(img, content_type="image/jpeg")
         response["Content-Disposition"] = "filename={}_{}.jpg".format(user_id, year or preferred)
-        try:
-            img = image_buffer.read()
-        except UnicodeDecodeError:
-            img = io.open(default_image_path, mode="rb").read()
 
-        image_buffer.close()
-        response.write(img)
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    # The picture shown depends on the requesting user's permissions
+    response["Vary"] = "Cookie"
 
-        return response
+    return response
 
 
 @login_required
@@ -186,7 +201,10 @@ def class_section_view(request, section_id):
     except Exception:
         raise Http404
 
-    students = sorted(c.students, key=lambda x: (x.last_name, x.first_name))
+    students = c.students
+    User.preload_permissions(students)
+    User.prefetch_cache(students, ["grade"])
+    students = sorted(students, key=lambda x: (x.last_name, x.first_name))
 
     attrs = {
         "name": c.name,
@@ -229,6 +247,19 @@ def class_section_view(request, section_id):
 
 @login_required
 def class_room_view(request, room_id):
+    if ClassIndexEntry.objects.exists():
+        classes_objs = [Class.from_index(entry) for entry in ClassIndexEntry.objects.filter(room_number=room_id)]
+        if not classes_objs:
+            raise Http404
+        Class.load_teachers(classes_objs)
+
+        context = {
+            "room": room_id,
+            "classes": classes_objs
+        }
+
+        return render(request, "users/class_room.html", context)
+
     c = LDAPConnection()
     room_id = LDAPFilter.escape(room_id)
 
@@ -261,6 +292,16 @@ def class_room_view(request, room_id):
 
 @login_required
 def all_classes_view(request):
+    if ClassIndexEntry.objects.exists():
+        classes_objs = [Class.from_index(entry) for entry in ClassIndexEntry.objects.all()]
+        Class.load_teachers(classes_objs)
+
+        context = {
+            "classes": classes_objs
+        }
+
+        return render(request, "users/all_classes.html", context)
+
     c = LDAPConnection()
 
     classes = c.search("ou=schedule,dc=tjhsst,dc=edu",
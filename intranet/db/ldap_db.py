@@ -2,7 +2,8 @@
 
 import logging
 import sys
-from threading import local
+import time
+from threading import Lock, local
 
 from django.conf import settings
 from django.core.handlers.wsgi import WSGIHandler
@@ -17,6 +18,8 @@ except ImportError:
 import ldap3
 import ldap3.protocol.sasl
 import ldap3.utils.conv
+from ldap3.core.exceptions import LDAPCommunicationError
+from ldap3.protocol.sasl.sasl import abort_sasl_negotiation, send_sasl_negotiation
 
 logger = logging.getLogger(__name__)
 _thread_locals = local()
@@ -55,6 +58,285 @@ class LDAPFilter(object):
         return LDAPFilter.attribute_in_list("objectclass", user_object_classes)
 
 
+# SASL GSSAPI security layers (RFC 4752)
+NO_SECURITY_LAYER = 1
+
+
+class KerberosConnection(ldap3.Connection):
+
+    """An LDAP connection that does a GSSAPI bind with the credentials it is given.
+
+    ldap3 binds with the default credentials of the process, which are
+    found through the KRB5CCNAME environmental variable, so only one
+    user's credentials could be used by a process at a time. Each
+    KerberosConnection carries its own credentials instead, so threads
+    can bind as different users at the same time.
+
+    Attributes:
+        gssapi_creds
+            The gssapi.Credentials used for the bind.
+
+    """
+
+    def __init__(self, server, gssapi_creds, **kwargs):
+        self.gssapi_creds = gssapi_creds
+        super(KerberosConnection, self).__init__(server, authentication=ldap3.SASL, sasl_mechanism=ldap3.GSSAPI, **kwargs)
+
+    def do_sasl_bind(self, controls):
+        with self.lock:
+            if self.sasl_in_progress:
+                return None
+            self.sasl_in_progress = True
+            try:
+                return self._gssapi_negotiate(controls)
+            finally:
+                self.sasl_in_progress = False
+
+    def _gssapi_negotiate(self, controls):
+        """Perform the GSSAPI SASL exchange (like ldap3's sasl_gssapi, but with explicit
+        credentials). Only authentication is supported, not security layers."""
+        target_name = gssapi.Name("ldap@" + self.server.host, gssapi.NameType.hostbased_service)
+        ctx = gssapi.SecurityContext(name=target_name, mech=gssapi.MechType.kerberos, creds=self.gssapi_creds)
+        in_token = None
+        try:
+            while not ctx.complete:
+                out_token = ctx.step(in_token) or b""
+                result = send_sasl_negotiation(self, controls, out_token)
+                in_token = result["saslCreds"]
+
+            message = ctx.unwrap(in_token).message
+            if len(message) != 4:
+                raise LDAPCommunicationError("Incorrect response from server")
+            server_security_layers = bytearray(message)[0]
+            if not server_security_layers & NO_SECURITY_LAYER:
+                raise LDAPCommunicationError("Server requires a security layer, but this is not implemented")
+
+            out_token = ctx.wrap(bytes(bytearray([NO_SECURITY_LAYER, 0, 0, 0])), False)
+            return send_sasl_negotiation(self, controls, out_token.message)
+        except (gssapi.exceptions.GSSError, LDAPCommunicationError):
+            abort_sasl_negotiation(self, controls)
+            raise
+
+
+class LDAPConnectionPool(object):
+
+    """A per-process pool of bound LDAP connections.
+
+    Binding to LDAP (especially with GSSAPI) is expensive, so instead of
+    unbinding at the end of every request, connections are returned to
+    this pool and reused by later requests. A connection can not be
+    rebound with different GSSAPI credentials, so connections are keyed
+    by their bind identity: the Kerberos credentials cache that was used
+    for the bind. A connection that fell back to a simple bind is still
+    stored under the identity that requested it.
+
+    Attributes:
+        max_size
+            The maximum number of idle connections kept open.
+        idle_timeout
+            The number of seconds after which an idle connection is
+            closed.
+        health_check_interval
+            The number of seconds a connection can be idle before it is
+            checked with a "Who am I?" request on reuse.
+        stats
+            A dictionary of counters (hits, misses, expired, unhealthy,
+            evicted and rebinds) for this process.
+
+    """
+
+    def __init__(self, max_size, idle_timeout, health_check_interval):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "unhealthy": 0,
+            "evicted": 0,
+            "rebinds": 0
+        }
+        # List of (identity, connection, simple_bind, release time),
+        # least recently released first
+        self._idle = []
+        self._lock = Lock()
+
+    @staticmethod
+    def current_identity():
+        """Return the bind identity for the current request.
+
+        The credentials cache should have already been set for the
+        current thread by the KerberosCacheMiddleware (or by the
+        authentication backend for a login request).
+
+        """
+        return getattr(_thread_locals, "kerberos_cache", None)
+
+    @staticmethod
+    def connect(identity=None):
+        """Connect to the LDAP server specified in settings and bind.
+
+        A GSSAPI bind with the credentials in the given cache is
+        attempted first, and a simple bind as the service user is used
+        if that fails.
+
+        Args:
+            identity
+                The name of the Kerberos credentials cache to bind with,
+                or None to use the default credentials of the process.
+
+        Returns:
+            A tuple of the bound connection and whether a simple bind
+            was used.
+
+        """
+        server = ldap3.Server(settings.LDAP_SERVER)
+
+        logger.info("Connecting to LDAP...")
+        if 'gssapi' in sys.modules:
+            try:
+                if identity is None:
+                    creds = gssapi.Credentials(usage="initiate")
+                else:
+                    creds = gssapi.Credentials(usage="initiate", store={"ccache": identity})
+                conn = KerberosConnection(server, creds)
+                conn.bind()
+                logger.info("Successfully connected to LDAP.")
+                return conn, False
+            except (ldap3.LDAPExceptionError, gssapi.exceptions.GSSError) as e:
+                logger.warning("SASL bind failed - using simple bind")
+                logger.warning(e)
+
+        conn = ldap3.Connection(server, settings.AUTHUSER_DN, settings.AUTHUSER_PASSWORD)
+        conn.bind()
+        return conn, True
+
+    def _is_healthy(self, conn, idle_time):
+        if conn.closed or not conn.bound:
+            return False
+
+        if idle_time < self.health_check_interval:
+            return True
+
+        try:
+            conn.extend.standard.who_am_i()
+        except ldap3.LDAPExceptionError as e:
+            logger.debug("LDAP connection failed health check: {}".format(e))
+            return False
+        return True
+
+    @staticmethod
+    def _close(conn):
+        try:
+            if conn.bound:
+                conn.unbind()
+        except ldap3.LDAPExceptionError as e:
+            logger.debug("Error closing LDAP connection: {}".format(e))
+
+    def _remove_expired(self, now):
+        """Remove idle connections that have timed out.
+
+        Must be called with the lock held. Returns the removed connections.
+
+        """
+        expired = [entry for entry in self._idle if now - entry[3] > self.idle_timeout]
+        if expired:
+            self._idle = [entry for entry in self._idle if now - entry[3] <= self.idle_timeout]
+            self.stats["expired"] += len(expired)
+        return [entry[1] for entry in expired]
+
+    def acquire(self, identity):
+        """Take a connection bound as the given identity out of the pool, or bind a new one.
+
+        Returns:
+            A tuple of the bound connection and whether a simple bind
+            was used.
+
+        """
+        now = time.time()
+        while True:
+            with self._lock:
+                to_close = self._remove_expired(now)
+                entry = None
+                for i in reversed(range(len(self._idle))):
+                    if self._idle[i][0] == identity:
+                        entry = self._idle.pop(i)
+                        break
+
+            for conn in to_close:
+                self._close(conn)
+
+            if entry is None:
+                break
+
+            _, conn, simple_bind, released = entry
+            if self._is_healthy(conn, now - released):
+                with self._lock:
+                    self.stats["hits"] += 1
+                return conn, simple_bind
+
+            with self._lock:
+                self.stats["unhealthy"] += 1
+            self._close(conn)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return self.connect(identity)
+
+    def release(self, identity, conn, simple_bind):
+        """Return a connection to the pool, closing the least recently used connections if the
+        pool is full."""
+        if conn.closed or not conn.bound:
+            return
+
+        with self._lock:
+            self._idle.append((identity, conn, simple_bind, time.time()))
+            to_close = self._remove_expired(time.time())
+            while len(self._idle) > self.max_size:
+                to_close.append(self._idle.pop(0)[1])
+                self.stats["evicted"] += 1
+
+        for old_conn in to_close:
+            self._close(old_conn)
+
+    def discard(self, identity):
+        """Close all idle connections bound as the given identity (e.g. on logout)."""
+        with self._lock:
+            to_close = [entry[1] for entry in self._idle if entry[0] == identity]
+            self._idle = [entry for entry in self._idle if entry[0] != identity]
+
+        for conn in to_close:
+            self._close(conn)
+
+    def record_rebind(self):
+        with self._lock:
+            self.stats["rebinds"] += 1
+
+    def get_stats(self):
+        """Return a copy of the pool counters along with the number of idle connections."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["idle"] = len(self._idle)
+        return stats
+
+
+_pool = None
+_pool_lock = Lock()
+
+
+def get_connection_pool():
+    """Return the process-wide :class:`LDAPConnectionPool`, creating it if necessary."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LDAPConnectionPool(settings.LDAP_POOL_MAX_SIZE,
+                                           settings.LDAP_POOL_IDLE_TIMEOUT,
+                                           settings.LDAP_POOL_HEALTH_CHECK_INTERVAL)
+    return _pool
+
+
 class LDAPConnection(object):
 
     """Represents an LDAP connection with wrappers for the raw ldap queries.
@@ -69,36 +351,38 @@ class LDAPConnection(object):
     def conn(self):
         """Lazily load and return the raw connection from threadlocals.
 
-        Connect to the LDAP server specified in settings and bind using
-        the GSSAPI protocol. The requisite KRB5CCNAME environmental
-        variable should have already been set by the SetKerberosCache
-        middleware.
+        The connection is taken from the :class:`LDAPConnectionPool`
+        (which binds a new one using the GSSAPI protocol if there is no
+        idle connection for the current Kerberos cache) and is returned
+        to the pool when the request is finished.
 
         """
-        ldap_exceptions = (ldap3.LDAPExceptionError,)
-        if 'gssapi' in sys.modules:
-            ldap_exceptions += (gssapi.exceptions.GSSError,)
+        identity = LDAPConnectionPool.current_identity()
 
-        if (not hasattr(_thread_locals, "ldap_conn") or _thread_locals.ldap_conn is None):
-            logger.info("Connecting to LDAP...")
-            server = ldap3.Server(settings.LDAP_SERVER)
-            _thread_locals.ldap_conn = ldap3.Connection(server, authentication=ldap3.SASL, sasl_mechanism='GSSAPI')
+        if getattr(_thread_locals, "ldap_conn", None) is not None:
+            if _thread_locals.ldap_identity == identity:
+                return _thread_locals.ldap_conn
 
-            try:
-                _thread_locals.ldap_conn.bind()
-                _thread_locals.simple_bind = False
-                logger.info("Successfully connected to LDAP.")
-            except ldap_exceptions as e:
-                logger.warning("SASL bind failed - using simple bind")
-                logger.warning(e)
-                _thread_locals.ldap_conn = ldap3.Connection(server, settings.AUTHUSER_DN, settings.AUTHUSER_PASSWORD)
-                _thread_locals.ldap_conn.bind()
-                _thread_locals.simple_bind = True
+            # The Kerberos cache changed (e.g. a new login) since the
+            # connection was taken from the pool
+            release_ldap_connection()
 
-            # logger.debug(_thread_locals.ldap_conn.whoami_s())
+        conn, simple_bind = get_connection_pool().acquire(identity)
+        _thread_locals.ldap_conn = conn
+        _thread_locals.ldap_identity = identity
+        _thread_locals.simple_bind = simple_bind
 
         return _thread_locals.ldap_conn
 
+    def reconnect(self):
+        """Throw away the current thread's connection so that the next operation binds a new
+        one."""
+        conn = getattr(_thread_locals, "ldap_conn", None)
+        if conn is not None:
+            LDAPConnectionPool._close(conn)
+        _thread_locals.ldap_conn = None
+        get_connection_pool().record_rebind()
+
     def did_use_simple_bind(self):
         """Returns whether a simple bind was used, or ``False`` for an uninitialized connection."""
 
@@ -134,9 +418,56 @@ class LDAPConnection(object):
         if not filter.endswith(')'):
             filter = "(%s)" % filter
 
-        self.conn.search(dn, filter, attributes=attributes)
+        try:
+            self.conn.search(dn, filter, attributes=attributes)
+        except ldap3.LDAPCommunicationError as e:
+            logger.warning("LDAP connection lost ({}) - rebinding".format(e))
+            self.reconnect()
+            self.conn.search(dn, filter, attributes=attributes)
         return self.conn.response
 
+    def paged_search(self, dn, filter, attributes, page_size=500):
+        """Search LDAP with the simple paged results control.
+
+        This should be used instead of :meth:`search` for searches that
+        can return more entries than the server's size limit (e.g. every
+        user in the directory).
+
+        Args:
+            dn
+                The string representation of the distinguished name
+                (DN) of the entry at which to start the search.
+            filter
+                The string representation of the filter to apply to
+                the search.
+            attributes
+                A list of LDAP attributes (as strings) to retrieve.
+            page_size
+                The number of entries to request per page.
+
+        Returns:
+            A list of the entries found, in the same format as the
+            results of :meth:`search`.
+
+        """
+        logger.debug("Paged searching ldap - dn: {}, filter: {}, "
+                     "attributes: {}".format(dn, filter, attributes))
+
+        if not filter.endswith(')'):
+            filter = "(%s)" % filter
+
+        def run():
+            entries = self.conn.extend.standard.paged_search(dn, filter, attributes=attributes,
+                                                             paged_size=page_size, generator=False)
+            return [entry for entry in entries if entry.get("type") == "searchResEntry"]
+
+        try:
+            return run()
+        except ldap3.LDAPCommunicationError as e:
+            logger.warning("LDAP connection lost ({}) - rebinding".format(e))
+            self.reconnect()
+            return run()
+
     def user_attributes(self, dn, attributes):
         """Fetch a list of attributes of the specified user.
 
@@ -227,7 +558,13 @@ class LDAPConnection(object):
             value = [str(v) for v in value]
         else:
             value = [value]
-        self.conn.modify(dn, {attribute: [(ldap3.MODIFY_REPLACE, value)]})
+        changes = {attribute: [(ldap3.MODIFY_REPLACE, value)]}
+        try:
+            self.conn.modify(dn, changes)
+        except ldap3.LDAPCommunicationError as e:
+            logger.warning("LDAP connection lost ({}) - rebinding".format(e))
+            self.reconnect()
+            self.conn.modify(dn, changes)
 
 
 class LDAPResult(object):
@@ -258,26 +595,42 @@ class LDAPResult(object):
         return self.result
 
 
+def set_kerberos_cache(cache):
+    """Set the Kerberos credentials cache that the current thread binds to LDAP with.
+
+    Args:
+        cache
+            The name of the credentials cache, or None to use the
+            default credentials of the process.
+
+    """
+    _thread_locals.kerberos_cache = cache
+
+
+def release_ldap_connection():
+    """Return the current thread's LDAP connection to the pool and clear up thread locals."""
+    conn = getattr(_thread_locals, "ldap_conn", None)
+    if conn is not None:
+        get_connection_pool().release(_thread_locals.ldap_identity, conn,
+                                      getattr(_thread_locals, "simple_bind", False))
+        logger.debug("LDAP connection returned to pool.")
+    _thread_locals.ldap_conn = None
+    if hasattr(_thread_locals, "simple_bind"):
+        del _thread_locals.simple_bind
+
+
 @receiver(request_finished,
           dispatch_uid="close_ldap_connection",
           sender=WSGIHandler)
 def close_ldap_connection(sender, **kwargs):
-    """Closes the request's LDAP connection and clears up thread locals.
+    """Releases the request's LDAP connection and clears up thread locals.
 
     Listens for the request_finished signal from Django and upon
-    receipt, unbinds from the directory, terminates the current
-    association, and frees resources.
-
-    It would be nice if we could leave the connections open in a pool,
-    but it looks like rebinding on an open connection isn't possible
-    with GSSAPI binds.
+    receipt, returns the connection to the :class:`LDAPConnectionPool`
+    so that a later request using the same Kerberos cache can reuse it
+    without binding again.
 
     """
-    if hasattr(_thread_locals, "ldap_conn"):
-        if _thread_locals.ldap_conn is not None:
-            if _thread_locals.ldap_conn.bound:
-                _thread_locals.ldap_conn.unbind()
-            _thread_locals.ldap_conn = None
-            logger.info("LDAP connection closed.")
-    if hasattr(_thread_locals, "simple_bind"):
-        del _thread_locals.simple_bind
+    release_ldap_connection()
+    set_kerberos_cache(None)
+    logger.debug("LDAP pool stats: {}".format(get_connection_pool().get_stats()))
@@ -1,51 +1,35 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import os
+
+from ..db.ldap_db import set_kerberos_cache
 
 logger = logging.getLogger(__name__)
 
 
 class KerberosCacheMiddleware(object):
 
-    """Reloads the KRB5CCNAME environmental variable from the session for potential use in future
-    LDAP requests.
+    """Loads the Kerberos cache stored in the session for use in LDAP requests.
 
-    For a login request, the KRB5CCNAME environmental variable has
-    already been set in the authentication backend, but for all other
-    requests, it must be reset from the Kerberos cache stored in a
-    user's session. Otherwise all requests to a a particular Gunicorn
-    worker would use the Kerberos cache of the user who most recently
-    logged in through that worker.
+    For a login request, the cache has already been set for the current
+    thread by the authentication backend, but for all other requests,
+    it must be loaded from the Kerberos cache stored in a user's
+    session. The cache is kept in a thread local (not the KRB5CCNAME
+    environmental variable, which is shared by every thread in the
+    process) and is passed explicitly to the LDAP bind, so a worker can
+    serve requests for different users in different threads at once.
 
-    The environmental variable must be set by middleware so it is
-    available for requests to any view and so each view does not have
-    to load the environmental variable. The LDAP wrapper
-    (intranet.db.ldap_db) cannot set the environmental variable because
-    it does not have access to the current session (request.session).
+    The cache must be set by middleware so it is available for requests
+    to any view. The LDAP wrapper (intranet.db.ldap_db) cannot load it
+    because it does not have access to the current session
+    (request.session).
 
     """
 
     def process_request(self, request):
-        """Propogate KRB5CCNAME session variable to the environmental variable."""
-        if "KRB5CCNAME" in request.session:
-            # It is important to check that the environmental variable
-            # matches the session variable because environmentals stay
-            # on the worker after requests.
-            if "KRB5CCNAME" in os.environ:
-                if os.environ["KRB5CCNAME"] != request.session["KRB5CCNAME"]:
-                    logger.debug("Reloading KRB5CCNAME environmental "
-                                 "variable from session.")
-                    os.environ["KRB5CCNAME"] = request.session["KRB5CCNAME"]
-            else:
-                logger.debug("KRB5CCNAME environmental variable not set - "
-                             "setting it to KRB5CCNAME from session vars.")
-                os.environ["KRB5CCNAME"] = request.session["KRB5CCNAME"]
-
-            # if request.user.is_authenticated():
-            #     proc = pexpect.spawn("klist -t")
-            #     proc.close()
-            #     if proc.exitstatus != 0:
-            #         logout(request)
+        """Set the current thread's Kerberos cache from the KRB5CCNAME session variable."""
+        # Always set it, so that a request without a cache does not use
+        # the cache of the previous request served by this thread
+        set_kerberos_cache(request.session.get("KRB5CCNAME"))
 
         return None
@@ -4,6 +4,7 @@ import os
 import re
 import subprocess
 import sys
+import tempfile
 
 from typing import Any  # noqa
 
@@ -38,6 +39,21 @@ EMAIL_ANNOUNCEMENTS = True
 
 EMAIL_FROM = "ion-noreply@tjhsst.edu"
 
+# Queued emails (see intranet.apps.notifications.emails.email_queue_bcc)
+EMAIL_QUEUE_BATCH_SIZE = 100  # recipients per email
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+# Emails claimed longer ago than this (in seconds) by a worker that never
+# finished sending them are queued again
+EMAIL_QUEUE_CLAIM_TIMEOUT = int(datetime.timedelta(minutes=30).total_seconds())
+
+# Push notifications (see intranet.apps.notifications.push)
+# GCM_AUTH_KEY and GCM_PROJECT_ID are set in secret.py
+GCM_SEND_URL = "https://android.googleapis.com/gcm/send"
+GCM_BATCH_SIZE = 1000  # registration IDs per request; the maximum GCM accepts
+GCM_MAX_WORKERS = 4  # requests sent at once
+GCM_TIMEOUT = 10  # seconds
+GCM_MAX_ATTEMPTS = 3
+
 # Address to send production error messages
 ADMINS = (
     ("Ion Errors", "ion-errors@lists.tjhsst.edu"),
@@ -248,15 +264,47 @@ CACHE_AGE = {
     "user_grade": int(10 * get_month_seconds()),
     "user_classes": int(6 * get_month_seconds()),
     "user_photo": int(6 * get_month_seconds()),
+    # Photo URLs include this version, so changes made directly in LDAP
+    # are picked up within this time
+    "photo_version": int(datetime.timedelta(hours=24).total_seconds()),
     "class_teacher": int(6 * get_month_seconds()),
     "class_attribute": int(6 * get_month_seconds()),
     "user_attribute": int(2 * get_month_seconds()),
     "bell_schedule": int(datetime.timedelta(weeks=1).total_seconds()),
     "ldap_permissions": int(datetime.timedelta(hours=24).total_seconds()),
     "users_list": int(datetime.timedelta(hours=24).total_seconds()),
-    "emerg": int(datetime.timedelta(minutes=5).total_seconds())
+    "emerg": int(datetime.timedelta(minutes=5).total_seconds()),
+    "eighth_block_activities": int(datetime.timedelta(hours=24).total_seconds()),
+    # Poll tallies are updated as votes are cast, so they can be kept
+    # until the poll is long over
+    "poll_results": int(datetime.timedelta(weeks=2).total_seconds()),
+    "poll_tally_lock": 10
+}
+
+# Whether to look up users in the local directory mirror (filled by the
+# sync_directory command) instead of LDAP. None uses the mirror once a
+# sync of every user has completed.
+USE_DIRECTORY_MIRROR = None
+
+# Number of signed cache keys for user data that are memoized per process
+SECURE_CACHE_KEY_MEMO_SIZE = 100000
+
+# Sized copies of user photos, stored by a hash of the original image. They
+# can be regenerated at any time, so they are kept outside the project.
+PHOTO_CACHE_ROOT = os.path.join(tempfile.gettempdir(), "ion_photo_cache")
+
+# Bounding boxes (width, height) of the photo sizes; None keeps the original
+PHOTO_SIZES = {
+    "thumbnail": (64, 80),
+    "card": (172, 215),
+    "full": None
 }
 
+# Browser cache lifetime of photos requested with a matching version, and of
+# unversioned photo URLs (which are revalidated with their ETag afterwards)
+PHOTO_VERSIONED_MAX_AGE = int(datetime.timedelta(days=365).total_seconds())
+PHOTO_MAX_AGE = int(datetime.timedelta(hours=1).total_seconds())
+
 # Cacheops configuration
 # may be removed in the future
 CACHEOPS_REDIS = {
@@ -275,8 +323,9 @@ CACHEOPS_DEFAULTS = {
 }
 
 CACHEOPS = {
+    # Bulk updates of eighth models go through eighth.models.invalidated_update
     "eighth.*": {
-        "timeout": 1  # int(datetime.timedelta(hours=1).total_seconds())
+        "timeout": int(datetime.timedelta(hours=1).total_seconds())
     },
     "announcements.*": {},
     "events.*": {},
@@ -320,9 +369,16 @@ HOST = "ion.tjhsst.edu"
 LDAP_REALM = "CSL.TJHSST.EDU"
 LDAP_SERVER = "ldap://iodine-ldap.tjhsst.edu"
 KINIT_TIMEOUT = 15  # seconds before pexpect timeouts
+KERBEROS_MAX_CONCURRENT_LOGINS = 8  # per process
 
 AUTHUSER_DN = "cn=authuser,dc=tjhsst,dc=edu"
 
+# Bound LDAP connections are kept open and reused between requests with
+# the same Kerberos cache (see intranet.db.ldap_db.LDAPConnectionPool)
+LDAP_POOL_MAX_SIZE = 20  # idle connections per process
+LDAP_POOL_IDLE_TIMEOUT = 5 * 60  # seconds before an idle connection is closed
+LDAP_POOL_HEALTH_CHECK_INTERVAL = 60  # seconds idle before a connection is checked on reuse
+
 # !! define AUTHUSER_PASSWORD in secret.py !!
 
 # LDAP schema config
@@ -639,5 +695,11 @@ ATTENDANCE_LOCK_HOUR = 20
 CLEAR_ABSENCE_DAYS = 14
 # The address for FCPS' Emergency Announcement page
 FCPS_EMERGENCY_PAGE = "http://www.fcps.edu/content/emergencyContent.html"
+# Seconds to wait for the FCPS Emergency Announcement page
+FCPS_EMERGENCY_TIMEOUT = 5
+# Seconds between fetches of the page by the poll_emerg command
+FCPS_EMERGENCY_POLL_INTERVAL = 60
+# Seconds to keep showing the last fetched announcement if fetches fail
+FCPS_EMERGENCY_MAX_STALE = 60 * 60
 # Shows a warning message with yellow background on the login page
 # LOGIN_WARNING = "This is a message to display on the login page."
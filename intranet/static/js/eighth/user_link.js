@@ -28,7 +28,7 @@ $(function() {
             console.debug(uid, "LOAD");
             var img = $("<img class='user-pic' />");
             img.attr("data-user-id", uid);
-            img.attr("src", "/profile/picture/" + uid);
+            img.attr("src", $(this).attr("data-picture-url") || "/profile/picture/" + uid + "?size=card");
             img.attr("width", 172);
             img.attr("height", 215);
             img.css({
@@ -15,6 +15,8 @@ values = {
     ('ou=people,dc=tjhsst,dc=edu', '(graduationYear=2017)', ('dn',)): [],
     ('ou=people,dc=tjhsst,dc=edu', '(graduationYear=2018)', ('dn',)): [],
     ('ou=people,dc=tjhsst,dc=edu', '(graduationYear=2019)', ('dn',)): [],
+    ('ou=people,dc=tjhsst,dc=edu', '(|(iodineUid=awilliam))', ('iodineUid', 'iodineUidNumber')): [
+        {'dn': uid_dn, 'attributes': {'iodineUid': ['awilliam'], 'iodineUidNumber': [1337]}}],
 }  # type: Dict[Any,Any]
 
 
@@ -36,6 +38,9 @@ for x, y in class_attrs:
 perms = ('perm-showaddress', 'perm-showtelephone', 'perm-showbirthday', 'perm-showschedule', 'perm-showeighth', 'perm-showpictures',
          'perm-showaddress-self', 'perm-showtelephone-self', 'perm-showbirthday-self', 'perm-showschedule-self', 'perm-showeighth-self', 'perm-showpictures-self')
 values[(uid_dn, all_users, perms)] = [{'attributes': {x: [True] for x in perms}}]
+preload = ('cn', 'displayName', 'gender', 'givenName', 'graduationYear', 'homePhone', 'iodineUid', 'iodineUidNumber', 'mail', 'middlename', 'mobile',
+           'nickname', 'objectClass', 'preferredPhoto', 'sn', 'startpage', 'telephoneNumber', 'title', 'tjhsstStudentId', 'webpage')
+values[(uid_dn, all_users, preload)] = [{'attributes': {x: [y] for x, y in attrs if x in preload}}]
 street = ('street', 'l', 'st', 'postalCode')
 values[(uid_dn, all_users, street)] = [{'attributes': {x: ['memes'] for x in street}}]
 
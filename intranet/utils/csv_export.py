@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import csv
+
+from django.http import StreamingHttpResponse
+
+
+class _Echo(object):
+
+    """A file-like object whose ``write`` returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, filename):
+    """Return a response that writes CSV rows as they are generated.
+
+    The rows are never all held in memory, so ``rows`` should be a
+    generator (e.g. over a queryset's ``iterator()``) for large exports.
+
+    Args:
+        rows
+            An iterable of lists of values, starting with the header.
+        filename
+            The name of the downloaded file.
+
+    Returns:
+        A StreamingHttpResponse.
+
+    """
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type="text/csv")
+    response["Content-Disposition"] = "attachment; filename=\"{}\"".format(filename)
+    return response
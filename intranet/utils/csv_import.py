@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import itertools
+import logging
+import sys
+import time
+
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class RowError(ValueError):
+
+    """Raised by :meth:`CSVImporter.parse_row` for rows that cannot be imported."""
+
+
+class CSVImporter(object):
+
+    """Imports a CSV file in chunks of rows.
+
+    Rows are read lazily, so files of any size can be imported without
+    loading them into memory. Subclasses implement :meth:`parse_row`,
+    which turns a raw row into whatever :meth:`import_chunk` needs, and
+    :meth:`import_chunk`, which should resolve everything the chunk
+    refers to with a few ``id__in`` queries and write with bulk queries.
+    Each chunk is imported in its own transaction; if it fails, the
+    chunk is rolled back and reported, and the import continues with the
+    next one.
+
+    Attributes:
+        stats
+            A dictionary of counters. ``rows`` and ``errors`` are
+            maintained by the importer; subclasses can add their own
+            (e.g. ``created``), which are included in the reports.
+
+    """
+
+    chunk_size = 1000
+
+    # Whether the first row of the file is a header that should be skipped
+    has_header = False
+
+    def __init__(self, stdout=None, chunk_size=None):
+        self.stdout = stdout or sys.stdout
+        if chunk_size:
+            self.chunk_size = chunk_size
+        self.stats = {"rows": 0, "errors": 0}
+
+    def parse_row(self, row):
+        """Convert a row of the CSV file for :meth:`import_chunk`.
+
+        Args:
+            row
+                A list of the values in the row.
+
+        Raises:
+            RowError
+                If the row is invalid and should be skipped.
+
+        """
+        return row
+
+    def import_chunk(self, rows):
+        """Write a chunk of parsed rows to the database.
+
+        This is called inside a transaction.
+
+        Args:
+            rows
+                A list of ``(line number, parsed row)`` tuples.
+
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Called after every chunk has been imported."""
+        pass
+
+    def error(self, line, message):
+        """Report a row that could not be imported."""
+        self.stats["errors"] += 1
+        self.stdout.write("Line {}: {}\n".format(line, message))
+
+    def count(self, name, n=1):
+        """Increment one of the :attr:`stats` counters."""
+        self.stats[name] = self.stats.get(name, 0) + n
+
+    def format_stats(self):
+        return ", ".join("{} {}".format(value, name) for name, value in sorted(self.stats.items()))
+
+    def run(self, path):
+        """Import a CSV file.
+
+        Args:
+            path
+                The path of the CSV file.
+
+        Returns:
+            The :attr:`stats` dictionary.
+
+        """
+        start = time.time()
+        with open(path, "r") as f:
+            reader = enumerate(csv.reader(f), 1)
+            if self.has_header:
+                next(reader, None)
+
+            while True:
+                chunk = list(itertools.islice(reader, self.chunk_size))
+                if not chunk:
+                    break
+
+                parsed = []
+                for line, row in chunk:
+                    self.stats["rows"] += 1
+                    try:
+                        parsed.append((line, self.parse_row(row)))
+                    except RowError as e:
+                        self.error(line, e)
+
+                try:
+                    with transaction.atomic():
+                        self.import_chunk(parsed)
+                except DatabaseError as e:
+                    logger.exception("Importing lines {}-{} of {} failed".format(chunk[0][0], chunk[-1][0], path))
+                    self.error("{}-{}".format(chunk[0][0], chunk[-1][0]), "chunk rolled back: {}".format(e))
+
+                elapsed = time.time() - start
+                self.stdout.write("{} ({:.0f} rows/s)\n".format(self.format_stats(), self.stats["rows"] / max(elapsed, 0.001)))
+
+        self.finish()
+        self.stdout.write("Done in {:.1f}s: {}\n".format(time.time() - start, self.format_stats()))
+        return self.stats
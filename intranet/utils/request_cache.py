@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from threading import local
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import request_finished, request_started
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Stored for keys that are known not to be in the cache
+_MISSING = object()
+
+
+class RequestCache(object):
+
+    """An in-process cache in front of the Django cache that lives for one request.
+
+    Rendering a page of users reads the same few attributes of each user
+    from the cache, and every read is a round trip to Redis. During a
+    request, this keeps every value that was read or written (and every
+    key that was not found) in memory, so repeated reads are free, and
+    :meth:`get_many` and :meth:`prefetch` can load the values for many
+    users with a single round trip.
+
+    Outside of a request (e.g. in management commands), where nothing
+    would clear the in-process values, every call goes straight to the
+    Django cache.
+
+    The interface is the subset of the Django cache API that is used
+    with it: ``get``, ``get_many``, ``set``, ``set_many`` and
+    ``delete``.
+
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._local = local()
+
+    @property
+    def _values(self):
+        return getattr(self._local, "values", None)
+
+    def activate(self):
+        """Start keeping values for the current thread's request."""
+        self._local.values = {}
+        self._local.stats = {"hits": 0, "misses": 0, "round_trips": 0}
+
+    def clear(self):
+        """Forget the current thread's values and stop keeping them."""
+        self._local.values = None
+        self._local.stats = {}
+
+    def stats(self):
+        """Return the hit, miss and Redis round trip counters of the current request."""
+        return dict(getattr(self._local, "stats", {}))
+
+    def get(self, key, default=None):
+        values = self._values
+        if values is None:
+            return self.backend.get(key, default)
+
+        if key in values:
+            self._local.stats["hits"] += 1
+            value = values[key]
+        else:
+            self._local.stats["misses"] += 1
+            self._local.stats["round_trips"] += 1
+            value = self.backend.get(key, _MISSING)
+            values[key] = value
+
+        return default if value is _MISSING else value
+
+    def get_many(self, keys):
+        values = self._values
+        if values is None:
+            return self.backend.get_many(keys)
+
+        missing = [key for key in keys if key not in values]
+        self._local.stats["hits"] += len(keys) - len(missing)
+        if missing:
+            self._local.stats["misses"] += len(missing)
+            self._local.stats["round_trips"] += 1
+            found = self.backend.get_many(missing)
+            for key in missing:
+                values[key] = found.get(key, _MISSING)
+
+        return {key: values[key] for key in keys if values[key] is not _MISSING}
+
+    def prefetch(self, keys):
+        """Load the values for the given keys with a single round trip, so later calls to
+        :meth:`get` for them are answered from memory."""
+        if self._values is not None:
+            self.get_many(keys)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.backend.set(key, value, timeout=timeout)
+        if self._values is not None:
+            self._values[key] = value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        self.backend.set_many(data, timeout=timeout)
+        if self._values is not None:
+            self._values.update(data)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        if self._values is not None:
+            self._values[key] = _MISSING
+
+
+request_cache = RequestCache(cache)
+
+
+@receiver(request_started, dispatch_uid="activate_request_cache")
+def activate_request_cache(sender, **kwargs):
+    request_cache.activate()
+
+
+@receiver(request_finished, dispatch_uid="clear_request_cache")
+def clear_request_cache(sender, **kwargs):
+    """Discards the request's cached values and logs its counters."""
+    stats = request_cache.stats()
+    if stats:
+        logger.debug("Request cache stats: {}".format(stats))
+    request_cache.clear()